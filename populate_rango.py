@@ -4,7 +4,8 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE',
 
 import django
 django.setup()
-from rango.models import Category, Page
+from rango.models import Page
+from rango.importer import import_records
 
 def populate():
 	# firstly, create lists of dictionaries containing the pages 
@@ -55,31 +56,25 @@ def populate():
 			"Django": {"pages": django_pages, "views": 64, "likes": 32},
 			"Other Frameworks": {"pages": other_pages, "views": 32, "likes": 16}, } 
 
-	# go through the cats dictionary, 
-	# add each category and add all associated pages
+	# go through the cats dictionary and turn each category and
+	# each of its pages into a record for the bulk importer
+	# (the same importer is behind python manage.py import_rango)
 
-	for cat, cat_data in cats.items():
-		c = add_cat(cat, views =cat_data['views'], likes=cat_data['likes'])
-		for p in cat_data["pages"]:
-			add_page(c, p["title"], p["url"], p["views"])
+	import_records(records(cats))
 
 	# print the added categories
 
-	for c in Category.objects.all():
-		for p in Page.objects.filter(category=c):
-			print("- {0} - {1}".format(str(c), str(p)))
-
-def add_page(cat, title, url, views=0):
-	p = Page.objects.get_or_create(category=cat, title=title, views=views)[0]
-	p.url=url
-	p.views=views
-	p.save()
-	return p
-
-def add_cat(name, views=0, likes=0):
-	c = Category.objects.get_or_create(name=name, views=views, likes=likes)[0]
-	c.save()
-	return c
+	# in one query, joining each page's category rather than asking for
+	# the pages of every category in turn
+
+	for p in Page.objects.select_related('category').order_by('category_id', 'id'):
+		print("- {0} - {1}".format(str(p.category), str(p)))
+
+def records(cats):
+	for cat, cat_data in cats.items():
+		yield {'category': cat, 'views': cat_data['views'], 'likes': cat_data['likes']}
+		for p in cat_data["pages"]:
+			yield {'category': cat, 'title': p["title"], 'url': p["url"], 'views': p["views"]}
 
 # start execution here!
 if __name__ == '__main__':
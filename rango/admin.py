@@ -1,15 +1,162 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.contrib.admin.widgets import ForeignKeyRawIdWidget
+from django.core.paginator import EmptyPage, Paginator
+from django.db.models import Max
+from django.utils.functional import cached_property
+from rango import page_cache, search, stats, trending
+from rango.caching import bump_categories_version
 from rango.models import Category, Page, UserProfile
 
 # Register your models here.
 
-class CategoryAdmin(admin.ModelAdmin):
+# the changelists are written to stay quick with millions of rows:
+#   - related objects shown in list_display are fetched with a join
+#   - the paginator estimates the size of an unfiltered table rather than
+#     running COUNT(*) over it, and show_full_result_count = False skips the
+#     second COUNT(*) the changelist would otherwise run
+#   - the search box asks the FTS5 table from rango/search.py
+#   - foreign keys are entered by id (with a lookup popup) rather than
+#     rendering a <select> with every category or user
+#   - bulk actions are single UPDATEs, followed by one rebuild of the
+#     category aggregates they affect
+
+# below this many rows, counting them exactly is cheap enough
+EXACT_COUNT_LIMIT = 10000
+
+# the most rows a search (or filter) will count, or page through
+FILTERED_COUNT_LIMIT = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+	# the count of an unfiltered table is only an estimate - too big by the
+	# number of rows that have been deleted - so the last few page links
+	# can lead past the last row. Those pages (and any other page number
+	# past the end) show the last page that has rows instead of an error
+	estimated = False
+
+	@cached_property
+	def count(self):
+		queryset = self.object_list
+		if not queryset.query.where:
+			# the whole table - ids are handed out in order, so the largest
+			# is a close enough guess (it's never too small) and comes
+			# straight from the primary key's index
+			estimate = queryset.model._default_manager.using(queryset.db).aggregate(largest=Max('pk'))['largest'] or 0
+			if estimate > EXACT_COUNT_LIMIT:
+				self.estimated = True
+				return estimate
+		return queryset.order_by()[:FILTERED_COUNT_LIMIT].count()
+
+	def validate_number(self, number):
+		try:
+			return super(EstimatedCountPaginator, self).validate_number(number)
+		except EmptyPage:
+			if int(number) < 1:
+				raise
+			return self.num_pages
+
+	def page(self, number):
+		page = super(EstimatedCountPaginator, self).page(number)
+		if self.estimated and page.number > 1 and not page.object_list:
+			# past the last row - count the rows after all (the only time the
+			# whole table is counted) and show the real last page
+			self.estimated = False
+			self.__dict__['count'] = self.object_list.order_by().count()
+			self.__dict__.pop('num_pages', None)
+			self.__dict__.pop('page_range', None)
+			page = super(EstimatedCountPaginator, self).page(self.num_pages)
+		return page
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+	paginator = EstimatedCountPaginator
+	show_full_result_count = False
+
+	def get_search_results(self, request, queryset, search_term):
+		# pages and categories are searched with FTS5, anything else (or
+		# SQLite without FTS5) with search_fields as usual
+		matching = None
+		if self.model in (Page, Category):
+			matching = search.filter_matching(queryset, search_term, limit=FILTERED_COUNT_LIMIT)
+		if matching is None:
+			return super(LargeTableAdmin, self).get_search_results(request, queryset, search_term)
+		return matching, False
+
+
+class CategoryAdmin(LargeTableAdmin):
 	prepopulated_fields = {'slug':('name',)}
+	# all columns of the category itself - the page aggregates are kept on it
+	list_display = ('name', 'page_count', 'page_views', 'views', 'likes')
+	search_fields = ('name',)
+	readonly_fields = ('page_count', 'page_views', 'top_page_ids', 'trending_page_ids', 'related_category_ids', 'version')
+	actions = ['reset_counters']
+
+	def reset_counters(self, request, queryset):
+		category_ids = list(queryset.values_list('id', flat=True))
+		updated = Category.objects.filter(id__in=category_ids).update(views=0, likes=0)
+		# the sidebar and index page show categories by likes
+		bump_categories_version()
+		stats.touch(category_ids)
+		page_cache.purge_categories(category_ids)
+		self.message_user(request, "Reset the views and likes of {0} categories.".format(updated))
+	reset_counters.short_description = "Reset views and likes of selected categories"
+
+
+class PageActionForm(ActionForm):
+	# the category to move pages to, entered by id like Page.category itself
+	category = forms.ModelChoiceField(
+		Category.objects.all(), required=False,
+		widget=ForeignKeyRawIdWidget(Page._meta.get_field('category').remote_field, admin.site))
+
+
+class PageAdmin(LargeTableAdmin):
+	list_display = ('title', 'category', 'url', 'views')
+	list_select_related = ('category',)
+	raw_id_fields = ('category',)
+	search_fields = ('title',)
+	action_form = PageActionForm
+	actions = ['reset_views', 'move_to_category']
 
-class PageAdmin(admin.ModelAdmin):
-	list_display = ('title', 'category', 'url')
+	def _changed(self, category_ids):
+		# the UPDATEs skip the signals in rango/signals.py, so put right
+		# what they would have
+		category_ids = set(category_ids)
+		stats.rebuild(category_ids)
+		trending.refresh_categories(category_ids)
+
+	def reset_views(self, request, queryset):
+		category_ids = list(queryset.order_by().values_list('category_id', flat=True).distinct())
+		updated = queryset.update(views=0)
+		self._changed(category_ids)
+		self.message_user(request, "Reset the views of {0} pages.".format(updated))
+	reset_views.short_description = "Reset views of selected pages"
+
+	def move_to_category(self, request, queryset):
+		try:
+			category = PageActionForm().fields['category'].clean(request.POST.get('category') or None)
+		except forms.ValidationError:
+			category = None
+		if category is None:
+			self.message_user(request, "Choose a category to move the pages to.", messages.WARNING)
+			return
+		category_ids = list(queryset.order_by().values_list('category_id', flat=True).distinct())
+		updated = queryset.update(category=category)
+		self._changed(category_ids + [category.id])
+		self.message_user(request, "Moved {0} pages to {1}.".format(updated, category))
+	move_to_category.short_description = "Move selected pages to category"
+
+
+class UserProfileAdmin(LargeTableAdmin):
+	# UserProfile.__str__ shows the username, so fetch the users with the
+	# profiles rather than one query per row
+	list_select_related = ('user',)
+	list_display = ('user', 'website')
+	raw_id_fields = ('user',)
+	# whole usernames only, rather than a substring match on every user
+	search_fields = ('=user__username',)
 
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Page, PageAdmin)
-admin.site.register(UserProfile)
-
+admin.site.register(UserProfile, UserProfileAdmin)
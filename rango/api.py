@@ -0,0 +1,152 @@
+import hashlib
+from functools import wraps
+
+from django.http import JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rango.caching import CATEGORIES_VERSION_KEY, CATEGORY_STATS_VERSION_KEY, get_versions
+from rango.category_index import get_category
+from rango.models import Category, Page
+from rango.pagination import category_page_values, parse_cursor, parse_size
+from rango.replicas import read_from_replica
+
+# a read-only JSON API
+#   /rango/api/categories/                      every category
+#   /rango/api/categories/<slug>/pages/         a category's pages, most viewed first
+#   /rango/api/pages/top/                       the most viewed pages on the site
+#
+# rows are read with .values(), never as model instances, and only the
+# columns asked for with ?fields=id,title,... (the default is all of them)
+#
+# lists are paginated with cursors like the category page (see
+# rango/pagination.py) - each response has a 'next' to pass back as ?after=
+#
+# every response has a strong ETag made from version numbers that change
+# whenever what it shows could have: Category.version for a category's
+# pages, the versions in rango/caching.py for the others. Those versions are
+# known without touching the Page table, so a client sending If-None-Match
+# with an ETag that is still current gets a 304 straight away
+
+CATEGORY_FIELDS = ('id', 'name', 'slug', 'views', 'likes', 'page_count', 'page_views')
+PAGE_FIELDS = ('id', 'title', 'url', 'views')
+# top pages can also say which category they are in
+TOP_PAGE_FIELDS = PAGE_FIELDS + ('category',)
+
+TOP_PAGES_LIMIT = 10
+TOP_PAGES_MAX_LIMIT = 50
+
+
+class BadRequest(Exception):
+	pass
+
+
+def parse_fields(value, allowed):
+	if not value:
+		return list(allowed)
+	fields = []
+	for name in value.split(','):
+		name = name.strip()
+		if name not in allowed:
+			raise BadRequest("Unknown field '{0}', choose from {1}.".format(name, ', '.join(allowed)))
+		if name not in fields:
+			fields.append(name)
+	return fields
+
+def make_etag(*parts):
+	return quote_etag('-'.join(str(part) for part in parts))
+
+def query_hash(request):
+	# the query string is part of every ETag, since ?fields= and ?after=
+	# change the response as much as the data does
+	return hashlib.md5(request.META.get('QUERY_STRING', '').encode('utf-8')).hexdigest()[:12]
+
+def api_view(view):
+	# answers If-None-Match before the view runs, and sets the ETag on the
+	# view's response. The view is given the request and returns
+	# (etag, function that builds the response data)
+	@wraps(view)
+	def wrapper(request, *args, **kwargs):
+		try:
+			etag, build = view(request, *args, **kwargs)
+			if etag is not None:
+				response = get_conditional_response(request, etag=etag)
+				if response is not None:
+					return response
+			response = JsonResponse(build())
+		except BadRequest as e:
+			return JsonResponse({'error': str(e)}, status=400)
+		except Category.DoesNotExist:
+			return JsonResponse({'error': 'The specified category does not exist!'}, status=404)
+		if etag is not None:
+			response['ETag'] = etag
+			# clients may keep the response, but must check it's still current
+			response['Cache-Control'] = 'no-cache'
+		return response
+	return read_from_replica(wrapper)
+
+
+@api_view
+def categories(request):
+	fields = parse_fields(request.GET.get('fields'), CATEGORY_FIELDS)
+	size = parse_size(request.GET.get('size'))
+	try:
+		after = int(request.GET['after'])
+	except (KeyError, ValueError):
+		after = None
+	etag = make_etag('categories', *get_versions(CATEGORIES_VERSION_KEY, CATEGORY_STATS_VERSION_KEY)
+					 + [query_hash(request)])
+
+	def build():
+		columns = fields if 'id' in fields else fields + ['id']
+		rows = Category.objects.order_by('id')
+		if after is not None:
+			rows = rows.filter(id__gt=after)
+		rows = list(rows.values(*columns)[:size + 1])
+		has_more = len(rows) > size
+		rows = rows[:size]
+		return {
+			'categories': [dict((name, row[name]) for name in fields) for row in rows],
+			'next': str(rows[-1]['id']) if has_more and rows else None,
+		}
+	return etag, build
+
+@api_view
+def category_pages(request, category_name_slug):
+	# the category comes from the in-process index, so a request whose ETag
+	# matches is answered without any queries at all
+	category = get_category(category_name_slug)
+	if category is None:
+		raise Category.DoesNotExist()
+	fields = parse_fields(request.GET.get('fields'), PAGE_FIELDS)
+	after = parse_cursor(request.GET.get('after'))
+	size = parse_size(request.GET.get('size'))
+	etag = make_etag('category', category.id, category.version, query_hash(request))
+
+	def build():
+		pages, next_cursor = category_page_values(category.id, fields, after=after, size=size)
+		return {
+			'category': {'slug': category.slug, 'name': category.name},
+			'pages': pages,
+			'next': next_cursor,
+		}
+	return etag, build
+
+@api_view
+def top_pages(request):
+	fields = parse_fields(request.GET.get('fields'), TOP_PAGE_FIELDS)
+	try:
+		limit = max(1, min(int(request.GET['limit']), TOP_PAGES_MAX_LIMIT))
+	except (KeyError, ValueError):
+		limit = TOP_PAGES_LIMIT
+	# page views and page changes both bump the category stats version
+	etag = make_etag('top', *get_versions(CATEGORY_STATS_VERSION_KEY) + [query_hash(request)])
+
+	def build():
+		lookups = dict((name, name) for name in PAGE_FIELDS)
+		lookups['category'] = 'category__slug'
+		columns = [lookups[name] for name in fields] + [name for name in ('id', 'views') if name not in fields]
+		# read off the index on views, newest first among equals (as the
+		# index page lists them), so nothing needs sorting
+		rows = Page.objects.order_by('-views', '-id').values(*columns)[:limit]
+		return {'pages': [dict((name, row[lookups[name]]) for name in fields) for row in rows]}
+	return etag, build
@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class RangoConfig(AppConfig):
     name = 'rango'
+
+    def ready(self):
+        # importing the modules connects the signal receivers and
+        # registers the counter handlers
+        import rango.related
+        import rango.signals
+        import rango.visits
@@ -0,0 +1,123 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model, hashers
+from django.contrib.auth.backends import ModelBackend
+from rango.ratelimit import TokenBuckets
+
+# password hashing is deliberately slow (tens of milliseconds of CPU each
+# time), so rather than every request thread hashing at once, hashes are
+# made and checked by a small pool of RANGO_HASH_WORKERS threads - under a
+# burst of signups or logins the other pages keep getting served
+#
+# at most RANGO_HASH_QUEUE hashes wait for the pool, beyond that
+# HashingBusy is raised and the view asks the user to try again
+#
+# PooledModelBackend (AUTHENTICATION_BACKENDS) is Django's ModelBackend
+# checking passwords in the pool - it also rehashes a password that was
+# made with an older hasher or fewer iterations when its user logs in
+
+# how long to wait for a place in the queue before giving up, in seconds
+QUEUE_TIMEOUT = 5
+
+# failed logins are limited per username and per address, before any
+# hashing is done - each gets RANGO_LOGIN_ATTEMPTS tries (four times as many
+# for an address, which may be shared), then one more every
+# RANGO_LOGIN_ATTEMPT_INTERVAL seconds
+LOGIN_ATTEMPTS = 5
+LOGIN_ATTEMPT_INTERVAL = 60
+failed_by_username = TokenBuckets(LOGIN_ATTEMPTS, LOGIN_ATTEMPT_INTERVAL)
+failed_by_address = TokenBuckets(LOGIN_ATTEMPTS * 4, LOGIN_ATTEMPT_INTERVAL / 4.0)
+
+
+class HashingBusy(Exception):
+	pass
+
+
+def _workers():
+	default = max(1, (os.cpu_count() or 2) // 2)
+	return getattr(settings, 'RANGO_HASH_WORKERS', default)
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+def _get_pool():
+	global _executor, _slots
+	with _lock:
+		if _executor is None:
+			_executor = ThreadPoolExecutor(max_workers=_workers(), thread_name_prefix='rango-hashing')
+			_slots = threading.BoundedSemaphore(_workers() + getattr(settings, 'RANGO_HASH_QUEUE', 32))
+		return _executor, _slots
+
+def run(func, *args):
+	# runs func(*args) in the hashing pool and waits for the result
+	# with RANGO_HASH_WORKERS = 0 it is run in the calling thread
+	if not _workers():
+		return func(*args)
+
+	executor, slots = _get_pool()
+	if not slots.acquire(timeout=QUEUE_TIMEOUT):
+		raise HashingBusy()
+	try:
+		return executor.submit(func, *args).result()
+	finally:
+		slots.release()
+
+def hash_password(raw_password):
+	# the same as User.set_password(), without tying up the calling thread
+	return run(hashers.make_password, raw_password)
+
+def check_password(raw_password, encoded):
+	# returns (whether the password is right, whether its hash is out of date)
+	outdated = []
+	correct = run(hashers.check_password, raw_password, encoded, outdated.append)
+	return correct, bool(outdated)
+
+def _login_attempts():
+	return getattr(settings, 'RANGO_LOGIN_ATTEMPTS', LOGIN_ATTEMPTS)
+
+def _login_attempt_interval():
+	return getattr(settings, 'RANGO_LOGIN_ATTEMPT_INTERVAL', LOGIN_ATTEMPT_INTERVAL)
+
+def _limit_buckets():
+	# the limits follow the settings, read at every use like the hashing
+	# pool's - the buckets' tokens are kept
+	attempts, interval = _login_attempts(), _login_attempt_interval()
+	failed_by_username.capacity, failed_by_username.interval = attempts, interval
+	failed_by_address.capacity, failed_by_address.interval = attempts * 4, interval / 4.0
+
+def login_wait(request, username):
+	# seconds before another login may be tried, 0 if it may be tried now
+	_limit_buckets()
+	return max(failed_by_username.wait((username or '').lower()),
+			   failed_by_address.wait(request.META.get('REMOTE_ADDR')))
+
+def login_failed(request, username):
+	_limit_buckets()
+	failed_by_username.take((username or '').lower())
+	failed_by_address.take(request.META.get('REMOTE_ADDR'))
+
+
+class PooledModelBackend(ModelBackend):
+
+	def authenticate(self, request, username=None, password=None, **kwargs):
+		UserModel = get_user_model()
+		if username is None:
+			username = kwargs.get(UserModel.USERNAME_FIELD)
+		try:
+			user = UserModel._default_manager.get_by_natural_key(username)
+		except UserModel.DoesNotExist:
+			# hash anyway, so a missing user takes as long as a wrong password
+			hash_password(password)
+			return None
+
+		correct, outdated = check_password(password, user.password)
+		if not correct or not self.user_can_authenticate(user):
+			return None
+		if outdated:
+			user.password = hash_password(password)
+			user.save(update_fields=['password'])
+		return user
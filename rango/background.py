@@ -0,0 +1,44 @@
+import logging
+import threading
+import time
+
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+# a few rango subsystems (counters, write-behind sessions) buffer writes and
+# apply them every few seconds from a background thread - this starts one
+# daemon thread per job per process, the first time the job is needed
+
+_threads = {}
+_lock = threading.Lock()
+
+
+def _run_forever(name, interval, func):
+	while True:
+		time.sleep(interval)
+		try:
+			func()
+		except Exception:
+			logger.exception("Background job %s failed", name)
+		finally:
+			# the thread has its own database connection - tidy it up like
+			# the request handler would
+			close_old_connections()
+
+def run_periodically(name, interval, func):
+	# calls func every interval seconds in a daemon thread, unless interval
+	# is None, in which case the caller is expected to run it some other way
+	# (e.g. from a management command)
+	if interval is None:
+		return
+	thread = _threads.get(name)
+	if thread is not None and thread.is_alive():
+		return
+	with _lock:
+		thread = _threads.get(name)
+		if thread is None or not thread.is_alive():
+			thread = threading.Thread(target=_run_forever, args=(name, interval, func),
+									  name='rango-{0}'.format(name), daemon=True)
+			thread.start()
+			_threads[name] = thread
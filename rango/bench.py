@@ -0,0 +1,146 @@
+import math
+import random
+import sys
+import tempfile
+from contextlib import contextmanager
+from http.cookies import SimpleCookie
+from io import BytesIO
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import connections, reset_queries
+from django.test.utils import override_settings
+
+# helpers shared by the bench_* management commands
+
+
+@contextmanager
+def scratch_database(alias='default', name=None):
+	# runs the block against a new, fully migrated database (the same kind
+	# the test runner uses), so a benchmark never touches db.sqlite3
+	# for SQLite that is an in-memory database, unless a file name is given
+	connection = connections[alias]
+	old_test_name = connection.settings_dict['TEST'].get('NAME')
+	if name is not None:
+		connection.settings_dict['TEST']['NAME'] = name
+	old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+	# point any mirrors of the database (the read replica) at the new one too
+	mirrors = dict((other, connections[other].settings_dict['NAME']) for other in connections
+				   if connections[other].settings_dict['TEST'].get('MIRROR') == alias)
+	for other in mirrors:
+		connections[other].close()
+		connections[other].creation.set_as_test_mirror(connection.settings_dict)
+	counter_dir = tempfile.mkdtemp(prefix='rango-bench-')
+	# Django empties the query log at the start of every request, which
+	# would lose the queries of all but the last request in a measurement
+	request_started.disconnect(reset_queries)
+	try:
+		# keep the benchmark's counters away from the real journals (and
+		# flushed only when a benchmark asks), and let requests through
+		# ALLOWED_HOSTS
+		with override_settings(RANGO_COUNTER_DIR=counter_dir, RANGO_COUNTER_FLUSH_INTERVAL=None,
+							   ALLOWED_HOSTS=['*']):
+			yield connection
+	finally:
+		request_started.connect(reset_queries)
+		for other, name in mirrors.items():
+			connections[other].close()
+			connections[other].settings_dict['NAME'] = name
+		connection.creation.destroy_test_db(old_name, verbosity=0)
+		connection.settings_dict['TEST']['NAME'] = old_test_name
+
+def seed_records(pages, categories):
+	# importer records for categories and pages, the same kind of data
+	# populate_rango.py adds, only much more of it
+	rng = random.Random(0)
+	for i in range(categories):
+		yield {'category': 'Category {0}'.format(i), 'views': rng.randint(0, 1000), 'likes': rng.randint(0, 1000)}
+	for j in range(pages):
+		i = j % categories
+		yield {'category': 'Category {0}'.format(i), 'title': 'Page {0}'.format(j),
+			   'url': 'http://example.com/{0}/{1}'.format(i, j), 'views': rng.randint(0, 10000)}
+
+def is_write(sql):
+	return sql.lstrip().split(None, 1)[0].upper() in ('INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+def percentile(values, fraction):
+	# nearest-rank percentile of a sorted list, e.g. percentile(times, 0.95)
+	if not values:
+		return 0.0
+	rank = min(max(int(math.ceil(fraction * len(values))), 1), len(values))
+	return values[rank - 1]
+
+
+class WSGIBrowser(object):
+	# calls a WSGI application directly, the way a web server would, and
+	# behaves enough like a browser to get through the site: it keeps the
+	# cookies it is sent and returns the CSRF token with every POST
+
+	def __init__(self, application):
+		self.application = application
+		self.cookies = SimpleCookie()
+
+	def environ(self, method, path, body):
+		path, _, query = path.partition('?')
+		environ = {
+			'REQUEST_METHOD': method,
+			'PATH_INFO': path,
+			'QUERY_STRING': query,
+			'SERVER_NAME': 'testserver',
+			'SERVER_PORT': '80',
+			'SERVER_PROTOCOL': 'HTTP/1.1',
+			'REMOTE_ADDR': '127.0.0.1',
+			'wsgi.version': (1, 0),
+			'wsgi.url_scheme': 'http',
+			'wsgi.input': BytesIO(body),
+			'wsgi.errors': sys.stderr,
+			'wsgi.multithread': False,
+			'wsgi.multiprocess': False,
+			'wsgi.run_once': False,
+		}
+		if self.cookies:
+			environ['HTTP_COOKIE'] = '; '.join(
+				'{0}={1}'.format(name, morsel.coded_value) for name, morsel in self.cookies.items())
+		if method == 'POST':
+			environ['CONTENT_TYPE'] = 'application/x-www-form-urlencoded'
+			environ['CONTENT_LENGTH'] = str(len(body))
+			if settings.CSRF_COOKIE_NAME in self.cookies:
+				environ['HTTP_X_CSRFTOKEN'] = self.cookies[settings.CSRF_COOKIE_NAME].value
+		return environ
+
+	def remember_cookies(self, headers):
+		for name, value in headers:
+			if name.lower() != 'set-cookie':
+				continue
+			cookie = SimpleCookie()
+			cookie.load(value)
+			for key, morsel in cookie.items():
+				if morsel['max-age'] == '0':
+					# Django deletes a cookie by expiring it straight away
+					self.cookies.pop(key, None)
+				else:
+					self.cookies[key] = morsel
+
+	def request(self, method, path, data=None):
+		# returns the status code and the body of the response
+		body = urlencode(data or {}).encode('utf-8')
+		status = []
+
+		def start_response(status_line, headers, exc_info=None):
+			status.append(int(status_line.split(None, 1)[0]))
+			self.remember_cookies(headers)
+
+		result = self.application(self.environ(method, path, body), start_response)
+		try:
+			content = b''.join(result)
+		finally:
+			if hasattr(result, 'close'):
+				result.close()
+		return status[0], content
+
+	def get(self, path):
+		return self.request('GET', path)
+
+	def post(self, path, data):
+		return self.request('POST', path, data)
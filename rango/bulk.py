@@ -0,0 +1,125 @@
+from django.conf import settings
+from django.db import transaction
+from django.template.defaultfilters import slugify
+from rango import links, page_cache, stats
+from rango.caching import bump_categories_version
+from rango.forms import CategoryForm, PageForm
+from rango.models import Category, Page
+
+# adds many pages (or categories) at once, for curators pasting in
+# hundreds of links - see views.add_pages and views.add_categories
+#
+# every row is validated with the same form as a single add, and only if
+# they are all valid are they inserted, with one bulk_create in one
+# transaction. Otherwise nothing is inserted and the errors are returned
+# per row, as {row number (from 0): {field: [messages]}}
+#
+# bulk_create skips Model.save() and the signals in rango/signals.py, so
+# the urls are linked and the category aggregates and caches updated here,
+# once for the whole batch
+
+# rows per request - this also keeps each batch's lookups under SQLite's
+# limit on the number of parameters in a query
+MAX_ROWS = 500
+
+
+def max_rows():
+	return getattr(settings, 'RANGO_BULK_MAX_ROWS', MAX_ROWS)
+
+
+class TooManyRows(Exception):
+	pass
+
+
+class BulkCategoryForm(CategoryForm):
+
+	def validate_unique(self):
+		# checked for the whole batch at once by add_categories(), rather
+		# than with a query per row
+		pass
+
+
+def _validate(form_class, rows, defaults):
+	# returns [(row number, valid form)] and the errors of the other rows
+	if len(rows) > max_rows():
+		raise TooManyRows("At most {0} rows can be added at once.".format(max_rows()))
+	forms, errors = [], {}
+	for i, row in enumerate(rows):
+		if not isinstance(row, dict):
+			errors[i] = {'__all__': ["Each row must be an object."]}
+			continue
+		data = dict(defaults)
+		data.update(row)
+		form = form_class(data)
+		if form.is_valid():
+			forms.append((i, form))
+		else:
+			errors[i] = form.errors
+	return forms, errors
+
+def add_pages(category, rows):
+	# rows are dicts of PageForm fields (title, url), returns (pages added, errors)
+	forms, errors = _validate(PageForm, rows, {'views': 0})
+	if errors or not forms:
+		return [], errors
+
+	urls = [form.cleaned_data['url'] for i, form in forms]
+	with transaction.atomic():
+		link_ids = links.resolve(urls)
+		pages = [Page(category_id=category.id, title=form.cleaned_data['title'], url=form.cleaned_data['url'],
+					  link_id=link_ids.get(form.cleaned_data['url']), views=0)
+				 for i, form in forms]
+		Page.objects.bulk_create(pages)
+		# new pages have no views, so they only join the top pages of a
+		# category that has fewer than stats.TOP_PAGES
+		stats.adjust(category.id, pages=len(pages))
+		if category.page_count < stats.TOP_PAGES:
+			stats.refresh_top_pages([category.id])
+		stats.touch([category.id])
+	page_cache.purge_categories([category.id])
+	return pages, {}
+
+def add_categories(rows):
+	# rows are dicts of CategoryForm fields (name), returns (categories added, errors)
+	forms, errors = _validate(BulkCategoryForm, rows, {'views': 0, 'likes': 0})
+
+	# names (or names that would make the same slug) already taken, by an
+	# existing category or an earlier row
+	slugs = dict((i, slugify(form.cleaned_data['name'])) for i, form in forms)
+	taken = set(Category.objects.filter(slug__in=slugs.values()).values_list('slug', flat=True))
+	categories = []
+	for i, form in forms:
+		if slugs[i] in taken:
+			errors[i] = {'name': ["Category with this Name already exists."]}
+		else:
+			taken.add(slugs[i])
+			categories.append(Category(name=form.cleaned_data['name'], slug=slugs[i]))
+	if errors or not categories:
+		return [], errors
+
+	with transaction.atomic():
+		Category.objects.bulk_create(categories)
+	# the sidebar lists every category, and the index the most liked
+	bump_categories_version()
+	page_cache.purge('index')
+	return categories, {}
+
+def error_list(errors):
+	# the errors as a JSON-friendly list, one entry per row with errors
+	return [{'row': i, 'errors': dict((field, list(messages)) for field, messages in row_errors.items())}
+			for i, row_errors in sorted(errors.items())]
+
+def parse_pages(text):
+	# one page per line, its title then its url, e.g.
+	#   Official Python Tutorial http://docs.python.org/2/tutorial/
+	# a line with only a url uses the url as the title too
+	rows = []
+	for line in text.splitlines():
+		words = line.split()
+		if words:
+			rows.append({'title': ' '.join(words[:-1]) or words[-1], 'url': words[-1]})
+	return rows
+
+def parse_categories(text):
+	# one category name per line
+	return [{'name': line.strip()} for line in text.splitlines() if line.strip()]
@@ -0,0 +1,91 @@
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+
+# the rendered sidebar is stored under a key that includes a version number
+# whenever a category is saved or deleted the version is bumped, so old
+# entries simply stop being read
+#
+# the versions and entries use the cache's default TIMEOUT - None with a
+# cache shared by every process, so they last until evicted, and a minute
+# with the per-process cache, where a bump only reaches other processes
+# once their copy of the version has timed out (see settings.CACHES)
+CATEGORIES_VERSION_KEY = 'rango:categories:version'
+# bumped when category aggregates or counters change, which doesn't change
+# the sidebar but does change the categories held by rango/category_index.py
+CATEGORY_STATS_VERSION_KEY = 'rango:category-stats:version'
+SIDEBAR_KEY = 'rango:sidebar:{0}'
+FRAGMENT_KEY = 'rango:fragment:{0}:{1}'
+
+
+def get_versions(*keys):
+	# returns the current value of each version key, creating missing ones
+	versions = cache.get_many(keys)
+	for key in keys:
+		if key not in versions:
+			# seed the version from the clock rather than starting at 1, so that if
+			# the version key is ever evicted we can't collide with old entries
+			version = int(time.time() * 1000)
+			if not cache.add(key, version):
+				# another process got there first - use its value
+				version = cache.get(key, version)
+			versions[key] = version
+	return [versions[key] for key in keys]
+
+def _incr(key):
+	try:
+		return cache.incr(key)
+	except ValueError:
+		# the key doesn't exist yet, creating it gives us a fresh version
+		return get_versions(key)[0]
+
+def bump_version(key):
+	# inside a transaction, another thread or process could read the old
+	# rows and cache them under the new version before we commit, so the
+	# version is bumped again once the transaction has committed
+	if transaction.get_connection().in_atomic_block:
+		transaction.on_commit(lambda: _incr(key))
+	return _incr(key)
+
+def get_categories_version():
+	return get_versions(CATEGORIES_VERSION_KEY)[0]
+
+def bump_categories_version():
+	return bump_version(CATEGORIES_VERSION_KEY)
+
+def bump_category_stats_version():
+	return bump_version(CATEGORY_STATS_VERSION_KEY)
+
+def get_sidebar_html(act_cat=None):
+	key = SIDEBAR_KEY.format(get_categories_version())
+	html = cache.get(key)
+	if html is None:
+		# import here to avoid a circular import with rango.models
+		from rango.category_index import all_categories
+		html = render_to_string('rango/cats.html', {'cats': all_categories()})
+		cache.set(key, html)
+
+	# the cached html is the same for everyone - the current category is
+	# highlighted afterwards by swapping its markers for <strong> tags
+	pk = getattr(act_cat, 'pk', None)
+	if pk is not None:
+		html = html.replace('<!--cat-{0}-->'.format(pk), '<strong>', 1)
+		html = html.replace('<!--/cat-{0}-->'.format(pk), '</strong>', 1)
+	return html
+
+def _fragment_part(value):
+	# a model instance with a version (a Category) stands for that version
+	# of itself, lists for their items, anything else for its text
+	if hasattr(value, '_meta') and hasattr(value, 'version'):
+		return '{0}.{1}.{2}'.format(value._meta.label_lower, value.pk, value.version)
+	if isinstance(value, (list, tuple)):
+		return ','.join(_fragment_part(item) for item in value)
+	return str(value)
+
+def fragment_key(name, *parts):
+	# the parts are hashed, so any text can go in them and the key stays short
+	digest = hashlib.md5('|'.join(_fragment_part(part) for part in parts).encode('utf-8')).hexdigest()
+	return FRAGMENT_KEY.format(name, digest)
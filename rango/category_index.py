@@ -0,0 +1,71 @@
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS
+from rango import metrics
+from rango.caching import CATEGORIES_VERSION_KEY, CATEGORY_STATS_VERSION_KEY, get_versions
+
+# an in-process copy of every category row, keyed by slug, so that turning
+# a category url into a category (show_category, add_page) and drawing the
+# sidebar don't need any queries
+#
+# the copy is loaded the first time it is needed and reloaded whenever the
+# categories version (any category saved or deleted) or the category stats
+# version (views, likes and page aggregates updated) has moved on - checking
+# them costs one cache lookup
+#
+# callers get a new Category instance each time, which they are free to change
+
+_lock = threading.Lock()
+# (versions, field names, slug -> row, rows in id order, id -> row)
+_index = (None, [], {}, [], {})
+
+
+def _load():
+	global _index
+	# read the versions before the rows - if a category changes while we are
+	# loading, the next call sees a newer version and loads again
+	versions = tuple(get_versions(CATEGORIES_VERSION_KEY, CATEGORY_STATS_VERSION_KEY))
+	index = _index
+	if index[0] == versions:
+		return index
+
+	with _lock:
+		if _index[0] == versions:
+			return _index
+		from rango.models import Category
+		started = time.perf_counter()
+		fields = [field.attname for field in Category._meta.concrete_fields]
+		# always from the primary - the index outlives the request, so rows
+		# from a replica that was behind would stick around
+		rows = list(Category.objects.using(DEFAULT_DB_ALIAS).order_by('id').values_list(*fields))
+		slug, pk = fields.index('slug'), fields.index('id')
+		_index = (versions, fields, dict((row[slug], row) for row in rows), rows, dict((row[pk], row) for row in rows))
+		metrics.observe('category_index.rebuild_ms', (time.perf_counter() - started) * 1000)
+		metrics.set_gauge('category_index.size', len(rows))
+		return _index
+
+def _instance(fields, row):
+	from rango.models import Category
+	return Category.from_db(DEFAULT_DB_ALIAS, fields, row)
+
+def get_category(slug):
+	# the category with this slug, or None if there isn't one
+	versions, fields, by_slug, rows, by_id = _load()
+	row = by_slug.get(slug)
+	if row is None:
+		metrics.incr('category_index.miss')
+		return None
+	metrics.incr('category_index.hit')
+	return _instance(fields, row)
+
+def all_categories():
+	# every category, in the order they were added
+	versions, fields, by_slug, rows, by_id = _load()
+	return [_instance(fields, row) for row in rows]
+
+def get_categories(category_ids):
+	# the categories with these ids, in the same order, skipping any that
+	# no longer exist
+	versions, fields, by_slug, rows, by_id = _load()
+	return [_instance(fields, by_id[category_id]) for category_id in category_ids if category_id in by_id]
@@ -0,0 +1,211 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from rango.background import run_periodically
+from rango.caching import bump_category_stats_version
+
+logger = logging.getLogger(__name__)
+
+# view and like counters are not written to the database on every hit
+# instead each increment is appended to a small journal file owned by the
+# process, and every few seconds the journals are folded into one UPDATE
+# per counter using F() expressions, so concurrent hits never race on a
+# read-modify-write and SQLite only sees a handful of writes
+#
+# the journals live on disk, so increments survive a crash or restart -
+# whichever process flushes next picks up journals left by dead processes,
+# so nothing needs to happen at exit
+#
+# journal files are named <pid>.journal while they are being written, and
+# are renamed to <pid>-<stamp>-<n>.batch by the process that flushes them
+
+JOURNAL_SUFFIX = '.journal'
+BATCH_SUFFIX = '.batch'
+
+# the number of rows touched by a single UPDATE, which keeps us well inside
+# SQLite's limit on the number of parameters in a statement
+UPDATE_CHUNK_SIZE = 300
+
+_handlers = {}
+
+
+def register(name, handler):
+	# a handler receives a dict mapping keys (strings) to summed increments
+	# and is called inside the flush transaction
+	_handlers[name] = handler
+
+def field_updater(model_label, field):
+	# builds a handler that adds each delta to field on the row whose pk is
+	# the key, i.e. UPDATE ... SET field = field + CASE id WHEN ... END
+	def apply(deltas):
+		model = apps.get_model(model_label)
+		items = [(int(key), delta) for key, delta in deltas.items() if delta]
+		for start in range(0, len(items), UPDATE_CHUNK_SIZE):
+			chunk = items[start:start + UPDATE_CHUNK_SIZE]
+			increment = Case(*[When(pk=pk, then=Value(delta)) for pk, delta in chunk],
+							 default=Value(0), output_field=IntegerField())
+			model.objects.filter(pk__in=[pk for pk, delta in chunk]).update(
+				**{field: F(field) + increment})
+	return apply
+
+
+def category_updater(field):
+	# as field_updater, also retiring the in-process category index
+	update = field_updater('rango.Category', field)
+	def apply(deltas):
+		update(deltas)
+		bump_category_stats_version()
+	return apply
+
+
+register('page.views', field_updater('rango.Page', 'views'))
+register('category.views', category_updater('views'))
+
+
+def _pid_alive(pid):
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		# the process exists, it just isn't ours
+		return True
+	return True
+
+def _owner(filename):
+	# both journal and batch files start with the pid that owns them
+	try:
+		return int(filename.split('.')[0].split('-')[0])
+	except ValueError:
+		return None
+
+
+class CounterJournal(object):
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		self.pid = None
+		self.fd = None
+		# the file fd is open on, which moves if RANGO_COUNTER_DIR changes
+		self.path = None
+		self.sequence = itertools.count()
+
+	@property
+	def directory(self):
+		# read from settings each time so tests can point it somewhere else
+		return getattr(settings, 'RANGO_COUNTER_DIR', os.path.join(settings.BASE_DIR, 'counters'))
+
+	def _path(self):
+		return os.path.join(self.directory, '{0}{1}'.format(os.getpid(), JOURNAL_SUFFIX))
+
+	def _batch_path(self):
+		name = '{0}-{1}-{2}{3}'.format(os.getpid(), int(time.time() * 1000),
+									   next(self.sequence), BATCH_SUFFIX)
+		return os.path.join(self.directory, name)
+
+	def add(self, name, key, delta=1):
+		line = '{0} {1} {2}\n'.format(name, key, delta).encode('ascii')
+		with self.lock:
+			if self.fd is None or self.pid != os.getpid() or self.path != self._path():
+				# first write, or we have been forked (or pointed at another
+				# directory) - open our own journal
+				if self.fd is not None and self.pid == os.getpid():
+					os.close(self.fd)
+				os.makedirs(self.directory, exist_ok=True)
+				self.path = self._path()
+				self.fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+				self.pid = os.getpid()
+			# a single small O_APPEND write, so the line can't be torn
+			os.write(self.fd, line)
+
+	def _claim(self, path):
+		# renaming is atomic, so only one process can claim a given file
+		target = self._batch_path()
+		try:
+			os.rename(path, target)
+		except FileNotFoundError:
+			return None
+		return target
+
+	def _claim_all(self):
+		with self.lock:
+			if self.fd is not None and self.pid == os.getpid():
+				os.close(self.fd)
+				self.fd = None
+				self._claim(self.path)
+
+		mine = []
+		try:
+			filenames = os.listdir(self.directory)
+		except FileNotFoundError:
+			return mine
+		for filename in filenames:
+			if not filename.endswith((JOURNAL_SUFFIX, BATCH_SUFFIX)):
+				continue
+			owner = _owner(filename)
+			path = os.path.join(self.directory, filename)
+			if owner == os.getpid() and filename.endswith(BATCH_SUFFIX):
+				mine.append(path)
+			elif owner is not None and owner != os.getpid() and not _pid_alive(owner):
+				# left behind by a process that died before flushing
+				claimed = self._claim(path)
+				if claimed:
+					mine.append(claimed)
+		return mine
+
+	def flush(self):
+		paths = self._claim_all()
+		if not paths:
+			return {}
+
+		totals = defaultdict(Counter)
+		for path in paths:
+			with open(path, 'rb') as journal:
+				for line in journal:
+					try:
+						name, key, delta = line.decode('ascii').split()
+						totals[name][key] += int(delta)
+					except ValueError:
+						# a partial line from a process killed mid-write
+						logger.warning("Skipping bad counter line %r in %s", line, path)
+
+		with transaction.atomic():
+			for name, deltas in totals.items():
+				handler = _handlers.get(name)
+				if handler is None:
+					logger.warning("No handler registered for counter %s", name)
+					continue
+				handler(dict(deltas))
+
+		# the increments are committed, so the batches can go - if we die
+		# before this point they will be applied again by the next flush,
+		# which errs on the side of over-counting rather than losing hits
+		for path in paths:
+			os.unlink(path)
+		return dict((name, sum(deltas.values())) for name, deltas in totals.items())
+
+
+journal = CounterJournal()
+
+
+def increment(name, key, delta=1):
+	journal.add(name, key, delta)
+	run_periodically('counters', getattr(settings, 'RANGO_COUNTER_FLUSH_INTERVAL', 10), flush)
+
+def flush():
+	# applies every pending increment, returning the totals per counter
+	return journal.flush()
+
+def record_page_view(page_id):
+	increment('page.views', page_id)
+
+def record_category_view(category_id):
+	increment('category.views', category_id)
@@ -0,0 +1,85 @@
+import csv
+import json
+import zlib
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from rango.models import Category, Page
+
+# streams every category and page out as gzipped JSONL or CSV, in the same
+# record format rango/importer.py reads, so an export can be imported again
+#   {"category": "Python", "views": 128, "likes": 64}
+#   {"category": "Python", "title": "...", "url": "...", "views": 128}
+# categories come first, then pages, each in id order
+#
+# rows are fetched CHUNK_SIZE at a time by seeking past the last id seen,
+# with each page's category name joined in rather than looked up, and
+# compressed as they are written - memory use is the same however big the
+# tables are. SQLite can't stream a single query's results (QuerySet.iterator()
+# still fetches every row), which is why the chunks are separate queries;
+# they run in one transaction so the export is a consistent snapshot
+
+CHUNK_SIZE = 2000
+
+CSV_COLUMNS = ('category', 'title', 'url', 'views', 'likes')
+
+# uncompressed bytes gathered before they are handed to the compressor
+BUFFER_SIZE = 64 * 1024
+
+
+def _chunks(queryset, fields, chunk_size):
+	# yields the rows of queryset as tuples of fields (the first being the
+	# id), one query per chunk
+	last_id = 0
+	while True:
+		rows = list(queryset.filter(id__gt=last_id).order_by('id').values_list(*fields)[:chunk_size])
+		for row in rows:
+			yield row
+		if len(rows) < chunk_size:
+			return
+		last_id = rows[-1][0]
+
+def export_records(using=None, chunk_size=CHUNK_SIZE):
+	using = using or DEFAULT_DB_ALIAS
+	with transaction.atomic(using=using):
+		for category_id, name, views, likes in _chunks(Category.objects.using(using),
+														('id', 'name', 'views', 'likes'), chunk_size):
+			yield {'category': name, 'views': views, 'likes': likes}
+		for page_id, category, title, url, views in _chunks(Page.objects.using(using),
+															('id', 'category__name', 'title', 'url', 'views'),
+															chunk_size):
+			yield {'category': category, 'title': title, 'url': url, 'views': views}
+
+
+class _Line(object):
+	# csv.writer wants a file, this hands back what it writes instead
+	def write(self, value):
+		return value
+
+def lines(records, format='jsonl'):
+	# yields the records as lines of text
+	if format == 'csv':
+		writer = csv.writer(_Line())
+		yield writer.writerow(CSV_COLUMNS)
+		for record in records:
+			yield writer.writerow([record.get(column, '') for column in CSV_COLUMNS])
+	else:
+		for record in records:
+			yield json.dumps(record) + '\n'
+
+def gzipped(lines, level=6):
+	# gzips an iterable of text as it goes, yielding compressed bytes
+	compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+	buffer, size = [], 0
+	for line in lines:
+		buffer.append(line.encode('utf-8'))
+		size += len(buffer[-1])
+		if size >= BUFFER_SIZE:
+			data = compressor.compress(b''.join(buffer))
+			buffer, size = [], 0
+			if data:
+				yield data
+	yield compressor.compress(b''.join(buffer)) + compressor.flush()
+
+def export(format='jsonl', using=None, chunk_size=CHUNK_SIZE):
+	# the whole export as gzipped bytes, a piece at a time
+	return gzipped(lines(export_records(using=using, chunk_size=chunk_size), format))
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
 from rango.models import Page, Category, UserProfile
+from rango.links import normalize
 
 class CategoryForm(forms.ModelForm):
 	name = forms.CharField(max_length=128,
@@ -26,13 +27,13 @@ class PageForm(forms.ModelForm):
 		cleaned_data = self.cleaned_data
 		url = cleaned_data.get('url')
 
-		# if the URL is not empty and doesn't start with 'http://',
-		# then prepend 'http://'
-		if url and not url.startswith('http://'):
-			url = 'http://' + url
-			cleaned_data['url'] = url
+		# if the URL is not empty, normalize it - this prepends 'http://'
+		# when there is no scheme, and leaves https:// (or any other) alone
+		# see rango/links.py
+		if url:
+			cleaned_data['url'] = normalize(url)
 
-			return cleaned_data
+		return cleaned_data
 
 	class Meta:
 		model = Page
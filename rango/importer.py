@@ -0,0 +1,210 @@
+import csv
+import json
+import time
+from collections import OrderedDict
+
+from django.db import transaction
+from django.db.models import Case, CharField, IntegerField, Value, When
+from django.template.defaultfilters import slugify
+from rango import links, stats
+from rango.caching import bump_categories_version
+from rango.models import Category, Page
+
+# streams categories and pages into the database in batches
+#
+# every record names a category, and page records also have a title and url:
+#   {"category": "Python", "views": 128, "likes": 64}
+#   {"category": "Python", "title": "Official Python Tutorial",
+#    "url": "http://docs.python.org/2/tutorial/", "views": 128}
+# CSV files use the same names as columns (category,title,url,views,likes),
+# leaving title and url empty for category rows
+#
+# categories are matched by name and pages by category and title - existing
+# rows are updated, new ones are inserted with bulk_create, and each batch
+# is committed in its own transaction
+
+# SQLite's limit on the parameters bound to one statement (before 3.32)
+MAX_PARAMETERS = 999
+
+# each batch looks up its pages by category and title, two parameters a
+# record, so a batch can't be bigger than this
+MAX_BATCH_SIZE = MAX_PARAMETERS // 2
+
+# records per transaction
+BATCH_SIZE = 400
+
+# the CASE ... WHEN id = %s THEN %s UPDATEs bind two parameters per row for
+# each column, and one more for the id in IN (...) - so they are run on
+# chunks of rows that fit in MAX_PARAMETERS
+PAGE_UPDATE_ROWS = MAX_PARAMETERS // (2 * 3 + 1)
+CATEGORY_UPDATE_ROWS = MAX_PARAMETERS // (2 * 2 + 1)
+
+# category name -> id lookups remembered between batches
+CATEGORY_CACHE_SIZE = 10000
+
+
+def read_records(stream, format='jsonl'):
+	# yields one dict per record from a text stream, without reading it all
+	if format == 'csv':
+		for row in csv.DictReader(stream):
+			yield row
+	else:
+		for line in stream:
+			line = line.strip()
+			if line:
+				yield json.loads(line)
+
+def _int(value):
+	return int(value) if value not in (None, '') else 0
+
+def _chunks(items, size):
+	items = list(items)
+	for start in range(0, len(items), size):
+		yield items[start:start + size]
+
+
+class Importer(object):
+
+	def __init__(self, batch_size=BATCH_SIZE):
+		if not 0 < batch_size <= MAX_BATCH_SIZE:
+			raise ValueError("The batch size must be between 1 and {0}.".format(MAX_BATCH_SIZE))
+		self.batch_size = batch_size
+		self.category_ids = OrderedDict()
+		self.touched = set()
+		self.categories_created = 0
+		self.categories_updated = 0
+		self.pages_created = 0
+		self.pages_updated = 0
+		self.rows = 0
+
+	def _remember(self, name, category_id):
+		self.category_ids[name] = category_id
+		self.category_ids.move_to_end(name)
+		if len(self.category_ids) > CATEGORY_CACHE_SIZE:
+			self.category_ids.popitem(last=False)
+
+	def _resolve_categories(self, categories):
+		# categories maps name -> (views, likes), or None for categories that
+		# are only mentioned by pages and shouldn't be changed if they exist
+		wanted = [name for name in categories
+				  if name not in self.category_ids or categories[name] is not None]
+		existing = dict(Category.objects.filter(name__in=wanted).values_list('name', 'id'))
+
+		# slugs are worked out here, as bulk_create doesn't call Category.save()
+		new = [Category(name=name, slug=slugify(name),
+						views=(categories[name] or (0, 0))[0],
+						likes=(categories[name] or (0, 0))[1])
+			   for name in wanted if name not in existing]
+		updates = [(existing[name], categories[name]) for name in wanted
+				   if name in existing and categories[name] is not None]
+
+		if new:
+			# Category.slug is unique too, so names that make the same slug
+			# are reported here rather than failing the INSERT
+			slugs = {}
+			for category in new:
+				if category.slug in slugs:
+					raise ValueError("Categories {0!r} and {1!r} would have the same slug {2!r}".format(
+						slugs[category.slug], category.name, category.slug))
+				slugs[category.slug] = category.name
+			for slug, name in Category.objects.filter(slug__in=slugs).values_list('slug', 'name'):
+				raise ValueError("Category {0!r} would have the same slug as {1!r}".format(slugs[slug], name))
+
+			# bulk_create doesn't give us the new ids on SQLite, so look them up
+			Category.objects.bulk_create(new)
+			existing.update(Category.objects.filter(name__in=[c.name for c in new]).values_list('name', 'id'))
+			self.categories_created += len(new)
+
+		for chunk in _chunks(updates, CATEGORY_UPDATE_ROWS):
+			Category.objects.filter(id__in=[category_id for category_id, values in chunk]).update(
+				views=Case(*[When(id=category_id, then=Value(views)) for category_id, (views, likes) in chunk],
+						   output_field=IntegerField()),
+				likes=Case(*[When(id=category_id, then=Value(likes)) for category_id, (views, likes) in chunk],
+						   output_field=IntegerField()))
+		self.categories_updated += len(updates)
+
+		for name, category_id in existing.items():
+			self._remember(name, category_id)
+
+	def _save_pages(self, pages):
+		# pages maps (category id, title) -> (url, views)
+		pages = OrderedDict((key, (links.normalize(url), views)) for key, (url, views) in pages.items())
+		link_ids = links.resolve(url for url, views in pages.values())
+		titles = set(title for category_id, title in pages)
+		existing = {}
+		for page_id, category_id, title in (Page.objects
+											.filter(category_id__in=set(c for c, t in pages), title__in=titles)
+											.values_list('id', 'category_id', 'title')):
+			if (category_id, title) in pages:
+				existing[(category_id, title)] = page_id
+
+		for chunk in _chunks(existing.items(), PAGE_UPDATE_ROWS):
+			Page.objects.filter(id__in=[page_id for key, page_id in chunk]).update(
+				url=Case(*[When(id=page_id, then=Value(pages[key][0])) for key, page_id in chunk],
+						 output_field=CharField()),
+				link_id=Case(*[When(id=page_id, then=Value(link_ids.get(pages[key][0]))) for key, page_id in chunk],
+							 output_field=IntegerField()),
+				views=Case(*[When(id=page_id, then=Value(pages[key][1])) for key, page_id in chunk],
+						   output_field=IntegerField()))
+		self.pages_updated += len(existing)
+
+		new = [Page(category_id=category_id, title=title, url=url, link_id=link_ids.get(url), views=views)
+			   for (category_id, title), (url, views) in pages.items()
+			   if (category_id, title) not in existing]
+		Page.objects.bulk_create(new)
+		self.pages_created += len(new)
+
+	def _import_batch(self, records):
+		# later records in a batch win over earlier ones for the same row
+		categories = OrderedDict()
+		for record in records:
+			name = record['category']
+			if record.get('title'):
+				categories.setdefault(name, None)
+			else:
+				categories[name] = (_int(record.get('views')), _int(record.get('likes')))
+
+		with transaction.atomic():
+			self._resolve_categories(categories)
+			pages = OrderedDict()
+			for record in records:
+				if record.get('title'):
+					category_id = self.category_ids[record['category']]
+					pages[(category_id, record['title'])] = (record['url'], _int(record.get('views')))
+			if pages:
+				self._save_pages(pages)
+
+		self.touched.update(self.category_ids[name] for name in categories)
+
+	def run(self, records, progress=None, progress_every=10000):
+		# progress, if given, is called with (rows so far, rows per second)
+		started = time.time()
+		batch = []
+		for record in records:
+			batch.append(record)
+			if len(batch) >= self.batch_size:
+				self._import_batch(batch)
+				self.rows += len(batch)
+				batch = []
+				if progress and self.rows % progress_every < self.batch_size:
+					progress(self.rows, self.rows / max(time.time() - started, 1e-6))
+		if batch:
+			self._import_batch(batch)
+			self.rows += len(batch)
+
+		# bulk_create and update() don't send signals, so bring the category
+		# aggregates and the sidebar up to date in one go at the end
+		stats.rebuild(sorted(self.touched))
+		if self.categories_created or self.categories_updated:
+			bump_categories_version()
+
+		elapsed = max(time.time() - started, 1e-6)
+		if progress:
+			progress(self.rows, self.rows / elapsed)
+		return elapsed
+
+
+def import_records(records, batch_size=BATCH_SIZE, progress=None):
+	importer = Importer(batch_size=batch_size)
+	importer.run(records, progress=progress)
+	return importer
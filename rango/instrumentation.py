@@ -0,0 +1,195 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends import utils as backend_utils
+from django.template.backends import django as django_backend
+from rango import metrics
+
+logger = logging.getLogger(__name__)
+
+# per-request instrumentation, cheap enough to leave on in production
+#
+# InstrumentationMiddleware (first in MIDDLEWARE) records, for every request:
+#   - wall time
+#   - the number of queries, and the time spent in them
+#   - the time spent rendering templates
+#   - the time spent saving the session (by TimedSessionMiddleware, which
+#     stands in for Django's SessionMiddleware)
+# into per-view histograms in rango.metrics, e.g. view.rango:index.ms, and
+# per-template histograms of render time and queries run while rendering
+#
+# queries are timed by wrapping CursorWrapper.execute and templates by
+# wrapping Template.render - outside a request, or with the middleware
+# switched off (RANGO_INSTRUMENTATION = False), both just pass straight
+# through
+#
+# a request that runs the same query RANGO_N_PLUS_ONE_THRESHOLD or more
+# times (the same SQL, ignoring parameters) is probably loading related
+# objects one at a time - these are logged and listed at /rango/_stats/
+
+N_PLUS_ONE_THRESHOLD = 5
+
+# how many different N+1 queries are remembered for /rango/_stats/
+MAX_SUSPECTS = 50
+
+# IN (%s, %s, ...) lists of any length have the same shape
+IN_LIST = re.compile(r'%s(?:, %s)+')
+# transaction control, which every write repeats - not a query to look into
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'SAVEPOINT', 'RELEASE', 'ROLLBACK')
+
+_local = threading.local()
+_install_lock = threading.Lock()
+_installed = False
+_suspects_lock = threading.Lock()
+_suspects = OrderedDict()
+
+
+class RequestStats(object):
+	__slots__ = ('queries', 'query_time', 'statements', 'template_time', 'rendering', 'session_time')
+
+	def __init__(self):
+		self.queries = 0
+		self.query_time = 0.0
+		self.statements = Counter()
+		self.template_time = 0.0
+		self.rendering = False
+		self.session_time = 0.0
+
+
+def current():
+	# the stats for the request being handled by this thread, if any
+	return getattr(_local, 'stats', None)
+
+def shape(sql):
+	if '%s, %s' in sql:
+		return IN_LIST.sub('%s, ...', sql)
+	return sql
+
+def _timed_execute(execute):
+	@wraps(execute)
+	def wrapper(self, sql, *args, **kwargs):
+		stats = current()
+		if stats is None:
+			return execute(self, sql, *args, **kwargs)
+		started = time.perf_counter()
+		try:
+			return execute(self, sql, *args, **kwargs)
+		finally:
+			stats.query_time += time.perf_counter() - started
+			stats.queries += 1
+			# shapes are only worked out once the request is over
+			if not sql.lstrip().upper().startswith(TRANSACTION_CONTROL):
+				stats.statements[sql] += 1
+	return wrapper
+
+def _timed_render(render):
+	@wraps(render)
+	def wrapper(self, *args, **kwargs):
+		stats = current()
+		if stats is None or stats.rendering:
+			# templates rendered inside another (includes, the sidebar) are
+			# part of the outer template's time
+			return render(self, *args, **kwargs)
+		stats.rendering = True
+		queries = stats.queries
+		started = time.perf_counter()
+		try:
+			return render(self, *args, **kwargs)
+		finally:
+			elapsed = time.perf_counter() - started
+			stats.rendering = False
+			stats.template_time += elapsed
+			name = getattr(self.template, 'name', None) or 'unnamed'
+			metrics.observe('template.{0}.ms'.format(name), elapsed * 1000)
+			metrics.observe('template.{0}.queries'.format(name), stats.queries - queries)
+	return wrapper
+
+def install():
+	# wraps the cursor and template methods, once per process
+	global _installed
+	with _install_lock:
+		if _installed:
+			return
+		backend_utils.CursorWrapper.execute = _timed_execute(backend_utils.CursorWrapper.execute)
+		backend_utils.CursorWrapper.executemany = _timed_execute(backend_utils.CursorWrapper.executemany)
+		django_backend.Template.render = _timed_render(django_backend.Template.render)
+		_installed = True
+
+def _view_name(request):
+	match = getattr(request, 'resolver_match', None)
+	return match.view_name if match is not None else 'unresolved'
+
+def _find_n_plus_one(view, stats, threshold):
+	shapes = Counter()
+	for sql, count in stats.statements.items():
+		shapes[shape(sql)] += count
+
+	for sql, count in shapes.items():
+		if count < threshold:
+			continue
+		metrics.incr('n_plus_one')
+		logger.warning("%s ran the same query %d times: %s", view, count, sql)
+		with _suspects_lock:
+			suspect = _suspects.pop((view, sql), None) or {'view': view, 'sql': sql, 'requests': 0, 'max_repeats': 0}
+			suspect['requests'] += 1
+			suspect['max_repeats'] = max(suspect['max_repeats'], count)
+			_suspects[(view, sql)] = suspect
+			if len(_suspects) > MAX_SUSPECTS:
+				_suspects.popitem(last=False)
+
+def record(request, stats, elapsed):
+	view = _view_name(request)
+	prefix = 'view.{0}.'.format(view)
+	metrics.observe(prefix + 'ms', elapsed * 1000)
+	metrics.observe(prefix + 'queries', stats.queries)
+	metrics.observe(prefix + 'query_ms', stats.query_time * 1000)
+	metrics.observe(prefix + 'template_ms', stats.template_time * 1000)
+	metrics.observe(prefix + 'session_ms', stats.session_time * 1000)
+	_find_n_plus_one(view, stats, getattr(settings, 'RANGO_N_PLUS_ONE_THRESHOLD', N_PLUS_ONE_THRESHOLD))
+
+def report():
+	# everything /rango/_stats/ shows, most recently seen N+1 queries first
+	result = metrics.snapshot()
+	with _suspects_lock:
+		result['n_plus_one'] = [dict(suspect) for suspect in reversed(_suspects.values())]
+	return result
+
+
+class InstrumentationMiddleware(object):
+
+	def __init__(self, get_response):
+		if not getattr(settings, 'RANGO_INSTRUMENTATION', True):
+			raise MiddlewareNotUsed
+		install()
+		self.get_response = get_response
+
+	def __call__(self, request):
+		stats = _local.stats = RequestStats()
+		started = time.perf_counter()
+		try:
+			response = self.get_response(request)
+		finally:
+			_local.stats = None
+		record(request, stats, time.perf_counter() - started)
+		return response
+
+
+class TimedSessionMiddleware(SessionMiddleware):
+	# Django's SessionMiddleware, timing how long the session takes to save
+
+	def process_response(self, request, response):
+		stats = current()
+		if stats is None:
+			return super(TimedSessionMiddleware, self).process_response(request, response)
+		started = time.perf_counter()
+		try:
+			return super(TimedSessionMiddleware, self).process_response(request, response)
+		finally:
+			stats.session_time += time.perf_counter() - started
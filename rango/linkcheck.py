@@ -0,0 +1,112 @@
+import asyncio
+import ssl
+import time
+from urllib.parse import urlsplit
+
+from django.db.models import Case, CharField, DateTimeField, FloatField, IntegerField, Value, When
+from django.utils import timezone
+from rango import counters
+from rango.models import Link
+
+# checks whether links still work, many at a time
+#
+# each link gets a HEAD request (or a GET, for servers that don't allow
+# HEAD), made with asyncio so that up to `concurrency` requests are waiting
+# on the network at once, and its status line is read - redirects are
+# recorded as they are, not followed. The HTTP status, the time until the
+# status line arrived, and what went wrong if there was no status, are
+# saved on the Link
+#
+# the work is done per Link, not per Page, so every url is requested once
+# however many pages have it (see rango/links.py)
+
+CONCURRENCY = 20
+TIMEOUT = 10
+USER_AGENT = 'rango-link-checker'
+
+# links checked, then saved, per round
+BATCH_SIZE = 500
+
+
+async def _status(url, method, timeout):
+	parts = urlsplit(url)
+	https = parts.scheme == 'https'
+	port = parts.port or (443 if https else 80)
+	context = ssl.create_default_context() if https else None
+	reader, writer = await asyncio.wait_for(
+		asyncio.open_connection(parts.hostname, port, ssl=context), timeout)
+	try:
+		target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+		writer.write('{0} {1} HTTP/1.1\r\nHost: {2}\r\nUser-Agent: {3}\r\nConnection: close\r\n\r\n'.format(
+			method, target, parts.netloc.rsplit('@', 1)[-1], USER_AGENT).encode('latin-1'))
+		line = await asyncio.wait_for(reader.readline(), timeout)
+	finally:
+		writer.close()
+	try:
+		return int(line.split()[1])
+	except (IndexError, ValueError):
+		raise ValueError("Bad status line {0!r}".format(line[:50]))
+
+async def check(url, timeout=TIMEOUT):
+	# returns (status, milliseconds, error) - status is None when there
+	# was no usable response, and error says why
+	started = time.perf_counter()
+	try:
+		status = await _status(url, 'HEAD', timeout)
+		if status in (405, 501):
+			status = await _status(url, 'GET', timeout)
+		error = ''
+	except asyncio.TimeoutError:
+		status, error = None, 'timed out'
+	except (OSError, ValueError, UnicodeError) as e:
+		status, error = None, str(e) or e.__class__.__name__
+	return status, (time.perf_counter() - started) * 1000, error[:255]
+
+async def check_all(urls, concurrency=CONCURRENCY, timeout=TIMEOUT):
+	# checks every url, at most concurrency at once, returning a list of
+	# results in the same order
+	slots = asyncio.Semaphore(concurrency)
+
+	async def bounded(url):
+		async with slots:
+			return await check(url, timeout)
+	return await asyncio.gather(*[bounded(url) for url in urls])
+
+def save(results):
+	# results maps link id -> (status, milliseconds, error)
+	now = timezone.now()
+	items = list(results.items())
+	for start in range(0, len(items), counters.UPDATE_CHUNK_SIZE):
+		chunk = items[start:start + counters.UPDATE_CHUNK_SIZE]
+
+		def column(index, output_field):
+			return Case(*[When(id=link_id, then=Value(result[index])) for link_id, result in chunk],
+						output_field=output_field)
+		Link.objects.filter(id__in=[link_id for link_id, result in chunk]).update(
+			status=column(0, IntegerField()), latency_ms=column(1, FloatField()),
+			error=column(2, CharField()), checked_at=Value(now, output_field=DateTimeField()))
+
+def check_links(links, concurrency=CONCURRENCY, timeout=TIMEOUT, batch_size=BATCH_SIZE, progress=None):
+	# checks and saves an iterable of (link id, url), a batch at a time,
+	# returning the number checked
+	loop = asyncio.new_event_loop()
+	checked = 0
+	try:
+		batch = []
+		for link in links:
+			batch.append(link)
+			if len(batch) >= batch_size:
+				checked += _check_batch(loop, batch, concurrency, timeout, progress)
+				batch = []
+		if batch:
+			checked += _check_batch(loop, batch, concurrency, timeout, progress)
+	finally:
+		loop.close()
+	return checked
+
+def _check_batch(loop, batch, concurrency, timeout, progress):
+	results = loop.run_until_complete(check_all([url for link_id, url in batch], concurrency, timeout))
+	save(dict((link_id, result) for (link_id, url), result in zip(batch, results)))
+	if progress:
+		progress(batch, results)
+	return len(batch)
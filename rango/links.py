@@ -0,0 +1,70 @@
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+# every distinct url is stored once, as a Link, which pages point at - the
+# link checker (python manage.py check_links, see rango/linkcheck.py)
+# records whether each one still works, however many pages share it
+#
+# urls are normalized before they are stored or looked up, so that
+# 'Example.COM', 'http://example.com' and 'http://example.com:80/#top' are
+# all the same link:
+#   - http:// is added when there is no scheme
+#   - the scheme and host are lowercased, and a trailing dot dropped from the host
+#   - the port is dropped when it is the scheme's default
+#   - an empty path becomes '/'
+#   - the fragment is dropped, it never reaches the server
+# links are found by the sha256 of the normalized url, which has a unique index
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# urls looked up per query, under SQLite's limit on parameters
+LOOKUP_CHUNK_SIZE = 500
+
+
+def normalize(url):
+	url = (url or '').strip()
+	if not url:
+		return url
+	if '://' not in url:
+		url = 'http://' + url
+	parts = urlsplit(url)
+	try:
+		port = parts.port
+	except ValueError:
+		# not a port we can make sense of - leave the url as it is
+		return url
+	host = (parts.hostname or '').rstrip('.')
+	if ':' in host:
+		# an IPv6 address
+		host = '[{0}]'.format(host)
+	netloc = host
+	if port is not None and port != DEFAULT_PORTS.get(parts.scheme.lower()):
+		netloc = '{0}:{1}'.format(host, port)
+	if parts.username is not None:
+		userinfo = parts.username if parts.password is None else '{0}:{1}'.format(parts.username, parts.password)
+		netloc = '{0}@{1}'.format(userinfo, netloc)
+	return urlunsplit((parts.scheme.lower(), netloc, parts.path or '/', parts.query, ''))
+
+def url_hash(url):
+	# the hash of an already normalized url
+	return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+def resolve(urls):
+	# returns a dict mapping each (normalized) url to the id of its Link,
+	# creating the links that don't exist yet
+	from rango.models import Link
+	wanted = dict((url_hash(url), url) for url in set(urls) if url)
+	link_ids = {}
+	hashes = list(wanted)
+	for start in range(0, len(hashes), LOOKUP_CHUNK_SIZE):
+		chunk = hashes[start:start + LOOKUP_CHUNK_SIZE]
+		link_ids.update(Link.objects.filter(url_hash__in=chunk).values_list('url_hash', 'id'))
+
+	missing = [digest for digest in hashes if digest not in link_ids]
+	if missing:
+		# bulk_create doesn't give us the new ids on SQLite, so look them up
+		Link.objects.bulk_create([Link(url=wanted[digest], url_hash=digest) for digest in missing])
+		for start in range(0, len(missing), LOOKUP_CHUNK_SIZE):
+			chunk = missing[start:start + LOOKUP_CHUNK_SIZE]
+			link_ids.update(Link.objects.filter(url_hash__in=chunk).values_list('url_hash', 'id'))
+	return dict((wanted[digest], link_id) for digest, link_id in link_ids.items())
@@ -0,0 +1,65 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from rango import sessions
+from rango.bench import is_write, scratch_database
+from rango.models import Category
+
+ENGINES = [
+	('db', 'django.contrib.sessions.backends.db'),
+	('signed_cookies', 'django.contrib.sessions.backends.signed_cookies'),
+	('hybrid', 'rango.sessions'),
+]
+
+# each visitor browses a little anonymously, then logs in and browses again
+ANONYMOUS = ['/rango/', '/rango/about/', '/rango/category/python/', '/rango/', '/rango/about/']
+SIGNED_IN = ['/rango/', '/rango/restricted/', '/rango/category/python/', '/rango/about/']
+
+
+class Command(BaseCommand):
+	help = "Counts database writes per request with each session engine."
+
+	def add_arguments(self, parser):
+		parser.add_argument('--visitors', type=int, default=50)
+
+	def count_writes(self, queries):
+		return sum(1 for query in queries.captured_queries if is_write(query['sql']))
+
+	def run(self, visitors):
+		anonymous = signed_in = anonymous_writes = signed_in_writes = 0
+		for i in range(visitors):
+			client = Client()
+			with CaptureQueriesContext(connection) as queries:
+				for url in ANONYMOUS:
+					client.get(url)
+			anonymous += len(ANONYMOUS)
+			anonymous_writes += self.count_writes(queries)
+
+			with CaptureQueriesContext(connection) as queries:
+				client.post('/rango/login/', {'username': 'bench', 'password': 'bench-password'})
+				for url in SIGNED_IN:
+					client.get(url)
+				client.get('/rango/logout/')
+				# anything the hybrid engine has queued is written now, and
+				# counted against this visitor
+				sessions.write_behind.flush()
+			signed_in += len(SIGNED_IN) + 2
+			signed_in_writes += self.count_writes(queries)
+		return anonymous, anonymous_writes, signed_in, signed_in_writes
+
+	def handle(self, *args, **options):
+		with scratch_database():
+			Category(name='Python').save()
+			User.objects.create_user('bench', password='bench-password')
+
+			self.stdout.write("{0:<16}{1:>10}{2:>18}{3:>18}{4:>10}".format(
+				'engine', 'requests', 'anonymous w/req', 'signed in w/req', 'w/req'))
+			for name, engine in ENGINES:
+				with override_settings(SESSION_ENGINE=engine, RANGO_SESSION_WRITE_BEHIND_INTERVAL=None):
+					anonymous, anonymous_writes, signed_in, signed_in_writes = self.run(options['visitors'])
+				self.stdout.write("{0:<16}{1:>10}{2:>18.2f}{3:>18.2f}{4:>10.2f}".format(
+					name, anonymous + signed_in,
+					anonymous_writes / anonymous, signed_in_writes / signed_in,
+					(anonymous_writes + signed_in_writes) / (anonymous + signed_in)))
@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from rango.bench import WSGIBrowser, percentile, scratch_database, seed_records
+from rango.importer import import_records
+from rango.models import Category
+
+# how well the site copes with SQLite under concurrent load: N signed-in
+# readers request the index page while one writer adds pages, against a
+# database file, with each of the connection setups below
+#   python manage.py bench_sqlite --readers 8 --seconds 10
+# readers are signed in so that they get past the page cache
+
+CONFIGURATIONS = [
+	# SQLite's own defaults, and a new connection for every request
+	('stock', {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'mmap_size': 0,
+			   'cache_size': -2000, 'temp_store': 'DEFAULT'}, 0),
+	# the PRAGMAs in tango_with_django_project/sqlite3, with persistent connections
+	('tuned', {}, 600),
+]
+
+PASSWORD = 'bench-password'
+
+
+class Worker(threading.Thread):
+	# makes requests with its own browser (and its own database connection)
+	# until the deadline, recording how long each one took
+
+	def __init__(self, application, username, request, ready, deadline):
+		super(Worker, self).__init__(daemon=True)
+		self.browser = WSGIBrowser(application)
+		self.username = username
+		self.request = request
+		self.ready = ready
+		self.deadline = deadline
+		self.times = []
+		self.errors = 0
+
+	def run(self):
+		try:
+			self.browser.get('/rango/login/')
+			self.browser.post('/rango/login/', {'username': self.username, 'password': PASSWORD})
+			self.ready.wait()
+			i = 0
+			while time.time() < self.deadline[0]:
+				method, path, data = self.request(i)
+				started = time.perf_counter()
+				try:
+					status, content = self.browser.request(method, path, data)
+				except Exception:
+					status = 500
+				self.times.append(time.perf_counter() - started)
+				if status >= 500:
+					self.errors += 1
+				i += 1
+		except Exception:
+			# don't leave the others waiting for us
+			self.ready.abort()
+			raise
+		finally:
+			connection.close()
+
+
+class Command(BaseCommand):
+	help = "Measures index/add_page throughput with concurrent readers and a writer, for stock and tuned SQLite connections."
+
+	def add_arguments(self, parser):
+		parser.add_argument('--readers', type=int, default=4)
+		parser.add_argument('--seconds', type=float, default=5.0,
+							help="How long each configuration is run for.")
+		parser.add_argument('--pages', type=int, default=10000)
+
+	def read(self, i):
+		return 'GET', '/rango/', None
+
+	def write(self, i):
+		slug = self.slugs[i % len(self.slugs)]
+		return 'POST', '/rango/category/{0}/add_page/'.format(slug), {
+			'title': 'Bench page {0} {1}'.format(time.time(), i),
+			'url': 'http://example.com/bench/{0}'.format(i), 'views': 0}
+
+	def run(self, application, readers, seconds):
+		# everyone logs in first, then the clock starts
+		deadline = [0]
+		def start_clock():
+			deadline[0] = time.time() + seconds
+		ready = threading.Barrier(readers + 1, action=start_clock)
+		workers = [Worker(application, 'reader{0}'.format(n), self.read, ready, deadline) for n in range(readers)]
+		writer = Worker(application, 'writer', self.write, ready, deadline)
+		for worker in workers + [writer]:
+			worker.start()
+		for worker in workers + [writer]:
+			worker.join()
+
+		reads = sorted(t for worker in workers for t in worker.times)
+		writes = sorted(writer.times)
+		return {
+			'reads': len(reads) / seconds,
+			'read_p95': percentile(reads, 0.95) * 1000,
+			'writes': len(writes) / seconds,
+			'write_p95': percentile(writes, 0.95) * 1000,
+			'errors': sum(worker.errors for worker in workers + [writer]),
+		}
+
+	def handle(self, *args, **options):
+		from tango_with_django_project.wsgi import application
+
+		directory = tempfile.mkdtemp(prefix='rango-bench-sqlite-')
+		try:
+			with scratch_database(name=os.path.join(directory, 'bench.sqlite3')):
+				import_records(seed_records(options['pages'], max(options['pages'] // 100, 1)))
+				for n in range(options['readers']):
+					User.objects.create_user('reader{0}'.format(n), password=PASSWORD)
+				User.objects.create_user('writer', password=PASSWORD)
+				self.slugs = list(Category.objects.order_by('id').values_list('slug', flat=True))
+
+				self.stdout.write("{0} readers on the index page, 1 writer adding pages, {1}s each".format(
+					options['readers'], options['seconds']))
+				self.stdout.write("{0:<8}{1:>10}{2:>14}{3:>11}{4:>15}{5:>8}".format(
+					'config', 'reads/s', 'read p95 ms', 'writes/s', 'write p95 ms', 'errors'))
+				settings_dict = connection.settings_dict
+				saved = settings_dict['OPTIONS'], settings_dict['CONN_MAX_AGE']
+				try:
+					for name, pragmas, max_age in CONFIGURATIONS:
+						# every thread's connection is made from these settings
+						connections.close_all()
+						settings_dict['OPTIONS'] = dict(saved[0], pragmas=pragmas)
+						settings_dict['CONN_MAX_AGE'] = max_age
+						# open a connection now, so the journal mode is switched
+						# before anyone else is connected
+						connection.ensure_connection()
+						connection.close()
+
+						result = self.run(application, options['readers'], options['seconds'])
+						self.stdout.write("{0:<8}{1:>10.1f}{2:>14.2f}{3:>11.1f}{4:>15.2f}{5:>8}".format(
+							name, result['reads'], result['read_p95'], result['writes'], result['write_p95'],
+							result['errors']))
+				finally:
+					connections.close_all()
+					settings_dict['OPTIONS'], settings_dict['CONN_MAX_AGE'] = saved
+		finally:
+			shutil.rmtree(directory, ignore_errors=True)
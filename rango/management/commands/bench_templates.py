@@ -0,0 +1,120 @@
+import copy
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.utils.functional import SimpleLazyObject
+from rango import related, trending
+from rango.bench import percentile, scratch_database, seed_records
+from rango.caching import CATEGORIES_VERSION_KEY, CATEGORY_STATS_VERSION_KEY, get_versions
+from rango.category_index import get_category
+from rango.forms import CategoryForm, PageForm, UserForm, UserProfileForm
+from rango.importer import import_records
+from rango.models import Category
+from rango.pagination import category_pages
+from rango.stats import top_pages
+
+# times how long each rango page template takes to find, compile and render,
+# with the context its view would give it, against a seeded scratch database
+#   python manage.py bench_templates --renders 200
+# for each configuration below: templates read from disk every time
+# (RANGO_TEMPLATE_MODE = 'development'), compiled once and kept
+# ('production'), and compiled once with {% fragment_cache %} switched on
+
+LOADERS = [
+	'django.template.loaders.filesystem.Loader',
+	'django.template.loaders.app_directories.Loader',
+]
+
+CONFIGURATIONS = [
+	('development', LOADERS, False),
+	('cached', [('django.template.loaders.cached.Loader', LOADERS)], False),
+	('fragments', [('django.template.loaders.cached.Loader', LOADERS)], True),
+]
+
+
+class Command(BaseCommand):
+	help = "Benchmarks rendering each rango template with and without cached loaders and fragment caching."
+
+	def add_arguments(self, parser):
+		parser.add_argument('--pages', type=int, default=1000)
+		parser.add_argument('--renders', type=int, default=100,
+							help="Timed renders per template and configuration.")
+
+	# each context_<template> method returns what the view would render it with
+
+	def context_index(self):
+		return {'categories': Category.objects.order_by('-likes')[:5],
+				'pages': SimpleLazyObject(lambda: trending.top_pages(5) or top_pages(5)),
+				'versions': get_versions(CATEGORIES_VERSION_KEY, CATEGORY_STATS_VERSION_KEY)}
+
+	def context_about(self):
+		return {'visits': 1}
+
+	def context_category(self):
+		category = get_category(self.slug)
+		pages, next_cursor = category_pages(category)
+		return {'category': category, 'pages': pages, 'next_cursor': next_cursor,
+				'trending_pages': trending.category_pages(category),
+				'related_categories': related.related_categories(category)}
+
+	def context_add_category(self):
+		return {'form': CategoryForm()}
+
+	def context_add_page(self):
+		return {'form': PageForm(), 'category': get_category(self.slug)}
+
+	def context_register(self):
+		return {'user_form': UserForm(), 'profile_form': UserProfileForm(), 'registered': False}
+
+	def context_login(self):
+		return {}
+
+	def context_restricted(self):
+		return {}
+
+	def context_search(self):
+		return {'query': 'page', 'results': []}
+
+	def render(self, name):
+		request = RequestFactory().get('/rango/')
+		request.user = self.user
+		started = time.perf_counter()
+		render_to_string('rango/{0}.html'.format(name), getattr(self, 'context_' + name)(), request=request)
+		return time.perf_counter() - started
+
+	def handle(self, *args, **options):
+		names = [name[len('context_'):] for name in dir(self) if name.startswith('context_')]
+		with scratch_database():
+			import_records(seed_records(options['pages'], max(options['pages'] // 100, 1)))
+			self.user = User.objects.create_user('bench', password='bench-password')
+			self.slug = Category.objects.order_by('id').values_list('slug', flat=True)[0]
+
+			results = {}
+			for config, loaders, fragments in CONFIGURATIONS:
+				templates = copy.deepcopy(settings.TEMPLATES)
+				templates[0].pop('APP_DIRS', None)
+				templates[0]['OPTIONS']['loaders'] = loaders
+				cache.clear()
+				with override_settings(TEMPLATES=templates, RANGO_FRAGMENT_CACHE=fragments):
+					for name in names:
+						# one untimed render, so the cached loader and the
+						# fragment cache have something in them
+						self.render(name)
+						results[(config, name)] = sorted(self.render(name) for i in range(options['renders']))
+
+			self.stdout.write("{0} renders of each template, mean / p95 in ms".format(options['renders']))
+			self.stdout.write("{0:<14}".format('template') + ''.join(
+				"{0:>20}".format(config) for config, loaders, fragments in CONFIGURATIONS))
+			for name in names:
+				row = "{0:<14}".format(name)
+				for config, loaders, fragments in CONFIGURATIONS:
+					times = results[(config, name)]
+					row += "{0:>20}".format("{0:.3f} / {1:.3f}".format(
+						sum(times) / len(times) * 1000, percentile(times, 0.95) * 1000))
+				self.stdout.write(row)
@@ -0,0 +1,219 @@
+import json
+import sys
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rango.bench import WSGIBrowser, percentile, scratch_database, seed_records
+from rango.importer import import_records
+from rango.models import Category
+
+# times every rango URL through the WSGI application, against a scratch
+# database seeded with as many pages as asked for, e.g.
+#   python manage.py bench_urls --pages 100000 --output bench.json
+#   python manage.py bench_urls --pages 100000 --baseline bench.json
+# the second run fails if a route has got slower (p95) or makes more
+# queries than it did in the first
+
+ROUTES = ['index', 'about', 'category', 'add_page', 'register', 'login', 'logout']
+
+USERNAME = 'bench'
+PASSWORD = 'bench-password'
+
+# a route has regressed when its p95 is more than tolerance times the
+# baseline's, or it makes more than this many extra queries per request
+QUERY_SLACK = 0.5
+
+
+class Command(BaseCommand):
+	help = "Benchmarks every rango URL through the WSGI application against a seeded scratch database."
+
+	def add_arguments(self, parser):
+		parser.add_argument('--pages', type=int, default=1000,
+							help="Pages to seed the database with (default 1000).")
+		parser.add_argument('--categories', type=int,
+							help="Categories to spread the pages over (default one per 100 pages).")
+		parser.add_argument('--requests', type=int, default=100,
+							help="Timed requests per route (default 100).")
+		parser.add_argument('--warmup', type=int, default=5,
+							help="Untimed requests per route before timing starts.")
+		parser.add_argument('--memory-requests', type=int, default=10,
+							help="Requests per route made with tracemalloc on, to find peak memory.")
+		parser.add_argument('--routes', default=','.join(ROUTES),
+							help="Comma separated routes to run (default all).")
+		parser.add_argument('--output', help="Save the results to this JSON file.")
+		parser.add_argument('--baseline', help="Fail if a route regresses past the results in this JSON file.")
+		parser.add_argument('--tolerance', type=float, default=1.5,
+							help="How many times slower than the baseline p95 a route may get (default 1.5).")
+
+	# each route method makes any untimed requests it needs first (logging
+	# in, fetching a CSRF token), then returns the request to time
+	# a setup_<route> method, if there is one, runs once before the route
+
+	def ensure_csrf_cookie(self, browser):
+		if settings.CSRF_COOKIE_NAME not in browser.cookies:
+			browser.get('/rango/login/')
+
+	def log_in(self, browser):
+		self.ensure_csrf_cookie(browser)
+		browser.post('/rango/login/', {'username': USERNAME, 'password': PASSWORD})
+
+	def route_index(self, browser, i):
+		return 'GET', '/rango/', None
+
+	def route_about(self, browser, i):
+		return 'GET', '/rango/about/', None
+
+	def route_category(self, browser, i):
+		return 'GET', '/rango/category/{0}/'.format(self.slugs[i % len(self.slugs)]), None
+
+	def setup_add_page(self, browser):
+		self.log_in(browser)
+
+	def route_add_page(self, browser, i):
+		return 'POST', '/rango/category/{0}/add_page/'.format(self.slugs[i % len(self.slugs)]), {
+			'title': 'Bench page {0}'.format(i), 'url': 'http://example.com/bench/{0}'.format(i), 'views': 0}
+
+	def route_register(self, browser, i):
+		self.ensure_csrf_cookie(browser)
+		return 'POST', '/rango/register/', {
+			'username': 'bench-{0}'.format(i), 'email': 'bench-{0}@example.com'.format(i),
+			'password': PASSWORD, 'website': ''}
+
+	def route_login(self, browser, i):
+		self.ensure_csrf_cookie(browser)
+		return 'POST', '/rango/login/', {'username': USERNAME, 'password': PASSWORD}
+
+	def route_logout(self, browser, i):
+		self.log_in(browser)
+		return 'GET', '/rango/logout/', None
+
+	def bench_route(self, name, application, options):
+		route = getattr(self, 'route_' + name)
+		browser = WSGIBrowser(application)
+		setup = getattr(self, 'setup_' + name, None)
+		if setup is not None:
+			setup(browser)
+		warmup, requests, memory_requests = options['warmup'], options['requests'], options['memory_requests']
+
+		def call(i):
+			method, path, data = route(browser, i)
+			started = time.perf_counter()
+			status, content = browser.request(method, path, data)
+			elapsed = time.perf_counter() - started
+			if status >= 400:
+				raise CommandError("{0} {1} returned {2}".format(method, path, status))
+			return elapsed
+
+		for i in range(warmup):
+			call(i)
+
+		times = []
+		queries = 0
+		for i in range(warmup, warmup + requests):
+			with CaptureQueriesContext(connection) as captured:
+				times.append(call(i))
+			queries += len(captured)
+
+		# tracemalloc slows everything down, so memory is measured separately
+		peak = 0
+		for i in range(warmup + requests, warmup + requests + memory_requests):
+			method, path, data = route(browser, i)
+			tracemalloc.start()
+			try:
+				browser.request(method, path, data)
+				peak = max(peak, tracemalloc.get_traced_memory()[1])
+			finally:
+				tracemalloc.stop()
+
+		times.sort()
+		return {
+			'requests': requests,
+			'p50_ms': round(percentile(times, 0.50) * 1000, 3),
+			'p95_ms': round(percentile(times, 0.95) * 1000, 3),
+			'p99_ms': round(percentile(times, 0.99) * 1000, 3),
+			'rps': round(requests / sum(times), 1) if times else 0.0,
+			'queries': round(queries / max(requests, 1), 2),
+			'peak_kb': round(peak / 1024.0, 1),
+		}
+
+	def seed(self, pages, categories):
+		def progress(rows, rate):
+			self.stderr.write("seeded {0} rows ({1:.0f} rows/s)".format(rows, rate))
+
+		import_records(seed_records(pages, categories), progress=progress if pages >= 100000 else None)
+		User.objects.create_user(USERNAME, password=PASSWORD)
+		self.slugs = list(Category.objects.order_by('id').values_list('slug', flat=True))
+
+	def compare(self, results, baseline, tolerance):
+		if baseline.get('pages') != results['pages']:
+			self.stderr.write("warning: the baseline was recorded with {0} pages, this run has {1}".format(
+				baseline.get('pages'), results['pages']))
+
+		failures = []
+		for name, result in results['routes'].items():
+			expected = baseline.get('routes', {}).get(name)
+			if expected is None:
+				continue
+			if result['p95_ms'] > expected['p95_ms'] * tolerance:
+				failures.append("{0}: p95 {1}ms, baseline {2}ms".format(name, result['p95_ms'], expected['p95_ms']))
+			if result['queries'] > expected['queries'] + QUERY_SLACK:
+				failures.append("{0}: {1} queries per request, baseline {2}".format(
+					name, result['queries'], expected['queries']))
+		return failures
+
+	def handle(self, *args, **options):
+		routes = [name.strip() for name in options['routes'].split(',') if name.strip()]
+		unknown = set(routes) - set(ROUTES)
+		if unknown:
+			raise CommandError("Unknown routes: {0}".format(', '.join(sorted(unknown))))
+
+		baseline = None
+		if options['baseline']:
+			with open(options['baseline']) as f:
+				baseline = json.load(f)
+
+		pages = options['pages']
+		categories = options['categories'] or max(pages // 100, 1)
+
+		# imported here so the WSGI module doesn't set up Django a second time
+		# before the command has started
+		from tango_with_django_project.wsgi import application
+
+		with scratch_database():
+			started = time.time()
+			self.seed(pages, categories)
+			self.stdout.write("Seeded {0} pages in {1} categories in {2:.1f}s".format(
+				pages, categories, time.time() - started))
+
+			results = {
+				'created': timezone.now().isoformat(),
+				'python': sys.version.split()[0],
+				'pages': pages,
+				'categories': categories,
+				'routes': {},
+			}
+			self.stdout.write("{0:<10}{1:>9}{2:>10}{3:>10}{4:>10}{5:>9}{6:>9}{7:>10}".format(
+				'route', 'requests', 'p50 ms', 'p95 ms', 'p99 ms', 'req/s', 'queries', 'peak KB'))
+			for name in routes:
+				result = self.bench_route(name, application, options)
+				results['routes'][name] = result
+				self.stdout.write("{0:<10}{1:>9}{2:>10.2f}{3:>10.2f}{4:>10.2f}{5:>9.1f}{6:>9.2f}{7:>10.1f}".format(
+					name, result['requests'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+					result['rps'], result['queries'], result['peak_kb']))
+
+		if options['output']:
+			with open(options['output'], 'w') as f:
+				json.dump(results, f, indent=2, sort_keys=True)
+			self.stdout.write("Saved results to {0}".format(options['output']))
+
+		if baseline is not None:
+			failures = self.compare(results, baseline, options['tolerance'])
+			if failures:
+				raise CommandError("Regressed against {0}:\n  {1}".format(options['baseline'], '\n  '.join(failures)))
+			self.stdout.write("No regressions against {0}".format(options['baseline']))
@@ -0,0 +1,50 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from rango.linkcheck import CONCURRENCY, TIMEOUT, check_links
+from rango.models import Link, Page
+
+
+class Command(BaseCommand):
+	help = "Checks that the pages' links still work, each distinct url once (see rango/linkcheck.py)."
+
+	def add_arguments(self, parser):
+		parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+							help="Requests in flight at once.")
+		parser.add_argument('--timeout', type=float, default=TIMEOUT,
+							help="Seconds to wait for a connection, and then for a response.")
+		parser.add_argument('--stale-hours', type=float, default=24,
+							help="Only check links not checked for this many hours (0 checks them all).")
+		parser.add_argument('--limit', type=int, help="Check at most this many links.")
+		parser.add_argument('--prune', action='store_true',
+							help="Delete links that no page points at any more first.")
+
+	def progress(self, batch, results):
+		self.totals.update(self.kind(status) for status, ms, error in results)
+		self.stdout.write("{0} links checked".format(sum(self.totals.values())))
+
+	def kind(self, status):
+		return 'error' if status is None else '{0}xx'.format(status // 100)
+
+	def handle(self, *args, **options):
+		if options['prune']:
+			pruned, _ = Link.objects.exclude(id__in=Page.objects.filter(link__isnull=False).values('link_id')).delete()
+			self.stdout.write("Pruned {0} links.".format(pruned))
+
+		links = Link.objects.filter(id__in=Page.objects.values('link_id'))
+		if options['stale_hours']:
+			cutoff = timezone.now() - timedelta(hours=options['stale_hours'])
+			links = links.filter(Q(checked_at__isnull=True) | Q(checked_at__lt=cutoff))
+		# never checked first, then the longest ago
+		links = links.order_by('checked_at', 'id').values_list('id', 'url')
+		if options['limit']:
+			links = links[:options['limit']]
+
+		self.totals = Counter()
+		checked = check_links(links.iterator(), concurrency=options['concurrency'], timeout=options['timeout'],
+							  progress=self.progress)
+		self.stdout.write("Checked {0} links: {1}.".format(
+			checked, ', '.join('{0} {1}'.format(count, kind) for kind, count in sorted(self.totals.items())) or 'none'))
@@ -0,0 +1,41 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from rango.exporter import CHUNK_SIZE, export
+
+
+class Command(BaseCommand):
+	help = "Exports every category and page as gzipped JSONL or CSV (see rango/exporter.py)."
+
+	def add_arguments(self, parser):
+		parser.add_argument('path', help="File to write, e.g. rango.jsonl.gz, or - to write to stdout.")
+		parser.add_argument('--format', choices=['jsonl', 'csv'],
+							help="Output format. Worked out from the file name if not given.")
+		parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+							help="Rows fetched per query.")
+
+	def handle(self, *args, **options):
+		path = options['path']
+		format = options['format'] or ('csv' if path.endswith(('.csv', '.csv.gz')) else 'jsonl')
+
+		if path == '-':
+			stream = sys.stdout.buffer
+		else:
+			try:
+				stream = open(path, 'wb')
+			except OSError as e:
+				raise CommandError("Can't write {0}: {1}".format(path, e))
+
+		started = time.time()
+		written = 0
+		try:
+			for data in export(format, chunk_size=options['chunk_size']):
+				stream.write(data)
+				written += len(data)
+		finally:
+			if path != '-':
+				stream.close()
+
+		if path != '-':
+			self.stdout.write("Exported {0} bytes to {1} in {2:.1f}s.".format(written, path, time.time() - started))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from rango import counters
+
+
+class Command(BaseCommand):
+	help = "Applies buffered view and like counts to the database."
+
+	def handle(self, *args, **options):
+		# picks up this process's journal (if any) and any left behind by
+		# processes that have since exited, e.g. after a restart
+		totals = counters.flush()
+		if not totals:
+			self.stdout.write("No pending counts.")
+		for name, total in sorted(totals.items()):
+			self.stdout.write("{0}: +{1}".format(name, total))
@@ -0,0 +1,58 @@
+import gzip
+import io
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from rango.importer import BATCH_SIZE, MAX_BATCH_SIZE, Importer, read_records
+
+
+class Command(BaseCommand):
+	help = "Imports categories and pages from a JSONL or CSV file (see rango/importer.py)."
+
+	def add_arguments(self, parser):
+		parser.add_argument('path', help="File to import (gzipped if it ends in .gz), or - to read from stdin.")
+		parser.add_argument('--format', choices=['jsonl', 'csv'],
+							help="Input format. Worked out from the file name if not given.")
+		parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+							help="Records per transaction, at most {0}.".format(MAX_BATCH_SIZE))
+
+	def progress(self, rows, rate):
+		self.stdout.write("{0} rows ({1:.0f} rows/s)".format(rows, rate))
+
+	def handle(self, *args, **options):
+		path = options['path']
+		format = options['format'] or ('csv' if path.endswith(('.csv', '.csv.gz')) else 'jsonl')
+
+		if path == '-':
+			stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', newline='')
+		else:
+			try:
+				if path.endswith('.gz'):
+					# e.g. a file written by export_rango
+					stream = gzip.open(path, 'rt', encoding='utf-8', newline='')
+				else:
+					stream = open(path, encoding='utf-8', newline='')
+			except OSError as e:
+				raise CommandError("Can't read {0}: {1}".format(path, e))
+
+		try:
+			importer = Importer(batch_size=options['batch_size'])
+		except ValueError as e:
+			raise CommandError(e)
+		with stream:
+			try:
+				elapsed = importer.run(read_records(stream, format), progress=self.progress)
+			except (KeyError, ValueError) as e:
+				raise CommandError("Bad record near row {0}: {1!r}".format(importer.rows, e))
+			except IntegrityError as e:
+				# e.g. a row added by someone else while we were importing -
+				# the batches before this one are already committed
+				raise CommandError("Couldn't import the batch after row {0}: {1}".format(importer.rows, e))
+
+		self.stdout.write(
+			"Imported {0} rows in {1:.1f}s ({2:.0f} rows/s): "
+			"{3} categories created, {4} updated; {5} pages created, {6} updated.".format(
+				importer.rows, elapsed, importer.rows / elapsed,
+				importer.categories_created, importer.categories_updated,
+				importer.pages_created, importer.pages_updated))
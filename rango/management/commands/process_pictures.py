@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from rango import pictures
+from rango.models import UserProfile
+
+
+class Command(BaseCommand):
+	help = "Makes any missing profile picture thumbnails."
+
+	def handle(self, *args, **options):
+		profiles = (UserProfile.objects.exclude(picture='').filter(thumbnails_ready=False)
+					.only('id', 'picture', 'picture_hash'))
+		done = set()
+		failed = 0
+		for profile in profiles.iterator():
+			try:
+				if not profile.picture_hash:
+					# uploaded before pictures were hashed
+					profile.picture_hash = pictures.hash_file(profile.picture.name)
+					UserProfile.objects.filter(id=profile.id).update(picture_hash=profile.picture_hash)
+				if profile.picture_hash not in done:
+					pictures.process(profile.picture_hash, profile.picture.name)
+					done.add(profile.picture_hash)
+			except (IOError, OSError) as e:
+				# a missing or unreadable picture shouldn't stop the rest
+				self.stderr.write("{0}: {1}".format(profile.picture.name, e))
+				failed += 1
+		self.stdout.write("Made thumbnails for {0} pictures, {1} failed.".format(len(done), failed))
@@ -0,0 +1,26 @@
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+	help = "Deletes expired sessions from the database in small batches."
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=500,
+							help="Sessions deleted per statement.")
+
+	def handle(self, *args, **options):
+		# unlike clearsessions, which deletes every expired row in one
+		# statement, each batch here is its own short transaction, so the
+		# database is never locked for long
+		now = timezone.now()
+		deleted = 0
+		while True:
+			session_keys = list(Session.objects.filter(expire_date__lt=now)
+								.values_list('session_key', flat=True)[:options['batch_size']])
+			if not session_keys:
+				break
+			Session.objects.filter(session_key__in=session_keys).delete()
+			deleted += len(session_keys)
+		self.stdout.write("Deleted {0} expired sessions.".format(deleted))
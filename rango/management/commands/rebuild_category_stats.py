@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from rango import stats
+
+
+class Command(BaseCommand):
+	help = "Recomputes the page count, total page views and top pages of every category."
+
+	def add_arguments(self, parser):
+		parser.add_argument('--batch-size', type=int, default=100,
+							help="Number of categories updated per query.")
+
+	def handle(self, *args, **options):
+		rebuilt = stats.rebuild(batch_size=options['batch_size'])
+		self.stdout.write("Rebuilt stats for {0} categories.".format(rebuilt))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rango import related
+
+
+class Command(BaseCommand):
+	help = "Drops category visits older than RANGO_RELATED_WINDOW and recomputes the related categories from the rest."
+
+	def add_arguments(self, parser):
+		parser.add_argument('--prune', action='store_true',
+							help="Only cut each category down to its closest RANGO_RELATED_NEIGHBOURS neighbours.")
+
+	def handle(self, *args, **options):
+		started = time.perf_counter()
+		if options['prune']:
+			deleted = related.prune()
+			self.stdout.write("Pruned {0} co-visit counts in {1:.1f}s.".format(deleted, time.perf_counter() - started))
+			return
+		visits = related.rebuild()
+		self.stdout.write("Rebuilt related categories from {0} visits in {1:.1f}s ({2}).".format(
+			visits, time.perf_counter() - started, 'NumPy/SciPy' if related.numpy is not None else 'pure Python'))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from rango import trending
+
+
+class Command(BaseCommand):
+	help = "Drops page view buckets older than RANGO_TRENDING_WINDOW and recomputes every trending score from the rest."
+
+	def handle(self, *args, **options):
+		scored = trending.rebuild()
+		self.stdout.write("Rebuilt trending scores for {0} pages.".format(scored))
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rango.template_warmup import warm
+
+
+class Command(BaseCommand):
+	help = "Compiles every template, reporting how long each took and any that don't compile."
+
+	def handle(self, *args, **options):
+		results = warm()
+		failed = [(name, error) for name, ms, error in results if error is not None]
+		if options['verbosity'] > 1:
+			for name, ms, error in sorted(results, key=lambda result: -result[1]):
+				self.stdout.write("{0:>8.2f} ms  {1}".format(ms, name))
+		for name, error in failed:
+			self.stderr.write("{0}: {1}".format(name, error))
+		self.stdout.write("Compiled {0} templates in {1:.0f} ms ({2} mode).".format(
+			len(results) - len(failed), sum(ms for name, ms, error in results), settings.RANGO_TEMPLATE_MODE))
+		if failed:
+			raise CommandError("{0} templates failed to compile.".format(len(failed)))
@@ -0,0 +1,55 @@
+import bisect
+import threading
+from collections import Counter
+
+# simple in-process metrics - counts of things like page cache hits and
+# misses, and histograms of things like request times, kept per process
+# and read with snapshot()
+
+# upper bounds of the histogram buckets, the last bucket takes the rest
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+_lock = threading.Lock()
+_counters = Counter()
+_gauges = {}
+_histograms = {}
+
+
+def incr(name, amount=1):
+	with _lock:
+		_counters[name] += amount
+
+def set_gauge(name, value):
+	# records the current value of something, e.g. the size of a cache
+	with _lock:
+		_gauges[name] = value
+
+def observe(name, value):
+	# adds a value (milliseconds, a query count, ...) to a histogram
+	bucket = bisect.bisect_left(BUCKETS, value)
+	with _lock:
+		histogram = _histograms.get(name)
+		if histogram is None:
+			histogram = _histograms[name] = {'count': 0, 'sum': 0, 'max': 0, 'buckets': [0] * (len(BUCKETS) + 1)}
+		histogram['count'] += 1
+		histogram['sum'] += value
+		histogram['max'] = max(histogram['max'], value)
+		histogram['buckets'][bucket] += 1
+
+def _summary(histogram):
+	# the buckets are reported by their upper bound, '+Inf' for the last
+	buckets = dict(zip([str(bound) for bound in BUCKETS] + ['+Inf'], histogram['buckets']))
+	return {'count': histogram['count'], 'sum': round(histogram['sum'], 3), 'max': round(histogram['max'], 3),
+			'mean': round(histogram['sum'] / histogram['count'], 3), 'buckets': buckets}
+
+def snapshot():
+	with _lock:
+		return {'counters': dict(_counters),
+				'gauges': dict(_gauges),
+				'histograms': dict((name, _summary(histogram)) for name, histogram in _histograms.items())}
+
+def reset():
+	with _lock:
+		_counters.clear()
+		_gauges.clear()
+		_histograms.clear()
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 17:20
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_category_stats(apps, schema_editor):
+    Category = apps.get_model('rango', 'Category')
+    Page = apps.get_model('rango', 'Page')
+    for category in Category.objects.all():
+        pages = Page.objects.filter(category=category)
+        totals = pages.aggregate(count=Count('id'), views=Sum('views'))
+        top_page_ids = pages.order_by('-views', 'id').values_list('id', flat=True)[:10]
+        Category.objects.filter(id=category.id).update(
+            page_count=totals['count'],
+            page_views=totals['views'] or 0,
+            top_page_ids=','.join(str(page_id) for page_id in top_page_ids))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0005_userprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='page_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='page_views',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='top_page_ids',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(fill_category_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# the FTS5 search table used by rango/search.py - SQLite only
+# the triggers that keep it up to date are (re)created after every migrate,
+# but are also created here so rows written by later migrations are indexed
+
+CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS rango_search USING fts5("
+    "title, url, tokenize='unicode61', prefix='2 3 4')",
+    """CREATE TRIGGER IF NOT EXISTS rango_page_search_insert AFTER INSERT ON rango_page BEGIN
+        INSERT INTO rango_search(rowid, title, url) VALUES (new.id * 2, new.title, new.url);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS rango_page_search_update AFTER UPDATE OF title, url ON rango_page BEGIN
+        DELETE FROM rango_search WHERE rowid = old.id * 2;
+        INSERT INTO rango_search(rowid, title, url) VALUES (new.id * 2, new.title, new.url);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS rango_page_search_delete AFTER DELETE ON rango_page BEGIN
+        DELETE FROM rango_search WHERE rowid = old.id * 2;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS rango_category_search_insert AFTER INSERT ON rango_category BEGIN
+        INSERT INTO rango_search(rowid, title, url) VALUES (new.id * 2 + 1, new.name, '');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS rango_category_search_update AFTER UPDATE OF name ON rango_category BEGIN
+        DELETE FROM rango_search WHERE rowid = old.id * 2 + 1;
+        INSERT INTO rango_search(rowid, title, url) VALUES (new.id * 2 + 1, new.name, '');
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS rango_category_search_delete AFTER DELETE ON rango_category BEGIN
+        DELETE FROM rango_search WHERE rowid = old.id * 2 + 1;
+    END""",
+    "INSERT INTO rango_search(rowid, title, url) SELECT id * 2, title, url FROM rango_page",
+    "INSERT INTO rango_search(rowid, title, url) SELECT id * 2 + 1, name, '' FROM rango_category",
+]
+
+DROP = [
+    "DROP TRIGGER IF EXISTS rango_page_search_insert",
+    "DROP TRIGGER IF EXISTS rango_page_search_update",
+    "DROP TRIGGER IF EXISTS rango_page_search_delete",
+    "DROP TRIGGER IF EXISTS rango_category_search_insert",
+    "DROP TRIGGER IF EXISTS rango_category_search_update",
+    "DROP TRIGGER IF EXISTS rango_category_search_delete",
+    "DROP TABLE IF EXISTS rango_search",
+]
+
+
+def run(statements):
+    def apply(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return apply
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0007_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE), run(DROP)),
+    ]
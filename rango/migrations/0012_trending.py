@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 17:47
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0011_category_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageViewBucket',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.IntegerField(db_index=True)),
+                ('views', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='trending_page_ids',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='trending',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['-trending'], name='rango_page_trending'),
+        ),
+        migrations.AddIndex(
+            model_name='page',
+            index=models.Index(fields=['category', '-trending'], name='rango_page_category_trending'),
+        ),
+        migrations.AddField(
+            model_name='pageviewbucket',
+            name='page',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rango.Page'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pageviewbucket',
+            unique_together=set([('page', 'bucket')]),
+        ),
+    ]
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 17:52
+from __future__ import unicode_literals
+
+import hashlib
+from urllib.parse import urlsplit, urlunsplit
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# the url normalization and hash as they were when this migration was
+# written (in rango/links.py), copied so that later changes there don't
+# change what this migration does
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# pages read and updated at a time - each row of the update takes five
+# parameters, well under SQLite's limit of 999
+CHUNK_SIZE = 150
+
+
+def normalize(url):
+    url = (url or '').strip()
+    if not url:
+        return url
+    if '://' not in url:
+        url = 'http://' + url
+    parts = urlsplit(url)
+    try:
+        port = parts.port
+    except ValueError:
+        return url
+    host = (parts.hostname or '').rstrip('.')
+    if ':' in host:
+        host = '[{0}]'.format(host)
+    netloc = host
+    if port is not None and port != DEFAULT_PORTS.get(parts.scheme.lower()):
+        netloc = '{0}:{1}'.format(host, port)
+    if parts.username is not None:
+        userinfo = parts.username if parts.password is None else '{0}:{1}'.format(parts.username, parts.password)
+        netloc = '{0}@{1}'.format(userinfo, netloc)
+    return urlunsplit((parts.scheme.lower(), netloc, parts.path or '/', parts.query, ''))
+
+
+def url_hash(url):
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+def link_pages(apps, schema_editor):
+    # normalizes every page's url and points it at the link for that url,
+    # a chunk of pages at a time: one query for the chunk's links, one
+    # bulk_create for the new ones and one UPDATE for the pages
+    Link = apps.get_model('rango', 'Link')
+    Page = apps.get_model('rango', 'Page')
+    last_id = 0
+    while True:
+        rows = list(Page.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'url')[:CHUNK_SIZE])
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        urls = dict((page_id, normalize(url)) for page_id, url in rows)
+        wanted = dict((url_hash(url), url) for url in urls.values())
+        link_ids = dict(Link.objects.filter(url_hash__in=list(wanted)).values_list('url_hash', 'id'))
+        missing = [digest for digest in wanted if digest not in link_ids]
+        if missing:
+            Link.objects.bulk_create([Link(url=wanted[digest], url_hash=digest) for digest in missing])
+            link_ids.update(Link.objects.filter(url_hash__in=missing).values_list('url_hash', 'id'))
+        Page.objects.filter(id__in=list(urls)).update(
+            url=models.Case(*[models.When(id=page_id, then=models.Value(url)) for page_id, url in urls.items()],
+                            output_field=models.CharField()),
+            link_id=models.Case(*[models.When(id=page_id, then=models.Value(link_ids[url_hash(url)]))
+                                  for page_id, url in urls.items()], output_field=models.IntegerField()))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0012_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Link',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField()),
+                ('url_hash', models.CharField(max_length=64, unique=True)),
+                ('status', models.IntegerField(blank=True, null=True)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('latency_ms', models.FloatField(blank=True, null=True)),
+                ('checked_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='link',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='rango.Link'),
+        ),
+        migrations.RunPython(link_pages, migrations.RunPython.noop),
+    ]
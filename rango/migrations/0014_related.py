@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 17:58
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rango', '0013_links'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryCoVisit',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('visitors', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CategoryVisit',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('visitor', models.CharField(max_length=32)),
+                ('day', models.IntegerField(db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='related_category_ids',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='categoryvisit',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rango.Category'),
+        ),
+        migrations.AddField(
+            model_name='categorycovisit',
+            name='category',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='rango.Category'),
+        ),
+        migrations.AddField(
+            model_name='categorycovisit',
+            name='related',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='rango.Category'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='categoryvisit',
+            unique_together=set([('visitor', 'category')]),
+        ),
+        migrations.AddIndex(
+            model_name='categorycovisit',
+            index=models.Index(fields=['category', '-visitors', 'related'], name='rango_covisit_category'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='categorycovisit',
+            unique_together=set([('category', 'related')]),
+        ),
+    ]
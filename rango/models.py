@@ -4,15 +4,53 @@ from django.contrib.auth.models import User
 
 # Create your models here.
 
+def unchanged_counter(instance, name):
+	# whether name is one of the instance's counters, still as it was loaded
+	loaded = getattr(instance, '_loaded', {})
+	return name in instance.COUNTER_FIELDS and name in loaded and getattr(instance, name) == loaded[name]
+
 class Category(models.Model):
 	name = models.CharField(max_length=128, unique=True)
 	views = models.IntegerField(default=0)
-	likes = models.IntegerField(default=0)
+	# indexed for the index page's most liked categories
+	likes = models.IntegerField(default=0, db_index=True)
 	slug = models.SlugField(unique=True)
 
+	# aggregates over the category's pages, maintained by rango/stats.py
+	# so the index and category pages don't have to scan the page table
+	page_count = models.IntegerField(default=0)
+	page_views = models.IntegerField(default=0)
+	# ids of the most viewed pages, most viewed first, separated by commas
+	top_page_ids = models.CharField(max_length=255, blank=True, default='')
+	# goes up whenever the category or any of its pages change, and is the
+	# ETag of the category's pages in the API (see rango/api.py)
+	version = models.IntegerField(default=0)
+	# ids of the pages trending right now, most trending first (see rango/trending.py)
+	trending_page_ids = models.CharField(max_length=255, blank=True, default='')
+	# ids of the categories most often visited by the same visitors, most
+	# often first (see rango/related.py)
+	related_category_ids = models.CharField(max_length=255, blank=True, default='')
+
+	AGGREGATE_FIELDS = ('page_count', 'page_views', 'top_page_ids', 'version', 'trending_page_ids',
+						'related_category_ids')
+	# changed with UPDATEs by the batched counters (see rango/counters.py)
+	COUNTER_FIELDS = ('views', 'likes')
+
 	def save(self, *args, **kwargs):
 		self.slug = slugify(self.name)
+		if not self._state.adding and not kwargs.get('force_insert') and 'update_fields' not in kwargs:
+			# the aggregates are only ever changed with UPDATEs in rango/stats.py -
+			# writing back the values we loaded could undo a change made since.
+			# The same goes for the counters, unless they have been changed here
+			kwargs['update_fields'] = [f.attname for f in self._meta.concrete_fields
+									   if not f.primary_key and f.attname not in self.AGGREGATE_FIELDS
+									   and not unchanged_counter(self, f.attname)]
+		adding = self._state.adding
 		super(Category, self).save(*args, **kwargs)
+		self._loaded = dict((name, getattr(self, name)) for name in self.COUNTER_FIELDS)
+		if not adding:
+			Category.objects.filter(pk=self.pk).update(version=models.F('version') + 1)
+		# the sidebar is rebuilt by the post_save receiver in rango/signals.py
 
 	class Meta:
 		verbose_name_plural = 'Categories'
@@ -20,16 +58,138 @@ class Category(models.Model):
 	def __str__(self):
 		return self.name
 
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super(Category, cls).from_db(db, field_names, values)
+		# remember the slug we loaded, so that if the name (and so the slug)
+		# changes, pages cached under the old url can be purged
+		instance._loaded_slug = instance.__dict__.get('slug')
+		instance._loaded = dict((name, instance.__dict__.get(name)) for name in cls.COUNTER_FIELDS)
+		return instance
+
+	def get_top_page_ids(self):
+		return [int(page_id) for page_id in self.top_page_ids.split(',') if page_id]
+
+	def get_trending_page_ids(self):
+		return [int(page_id) for page_id in self.trending_page_ids.split(',') if page_id]
+
+	def get_related_category_ids(self):
+		return [int(category_id) for category_id in self.related_category_ids.split(',') if category_id]
+
+
+class Link(models.Model):
+	# one row per distinct url, shared by every page with that url, and
+	# whether it worked the last time it was checked (see rango/links.py)
+	url = models.URLField()
+	# sha256 of the normalized url
+	url_hash = models.CharField(max_length=64, unique=True)
+	# the HTTP status, or None if there was no response (see error)
+	status = models.IntegerField(null=True, blank=True)
+	error = models.CharField(max_length=255, blank=True)
+	latency_ms = models.FloatField(null=True, blank=True)
+	checked_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+	def __str__(self):
+		return self.url
+
 
 class Page(models.Model):
 	category = models.ForeignKey(Category)
 	title = models.CharField(max_length=128)
+	# the page's normalized url, which is also its link's url
 	url = models.URLField()
-	views = models.IntegerField(default=0)
+	# losing a link (pruned by check_links) mustn't take its pages with it
+	link = models.ForeignKey(Link, null=True, blank=True, editable=False, on_delete=models.SET_NULL)
+	# indexed for the most viewed pages across the whole site
+	views = models.IntegerField(default=0, db_index=True)
+	# how much the page is being viewed lately, as a time-decayed score kept
+	# by rango/trending.py - None until it is first viewed
+	trending = models.FloatField(null=True, blank=True, editable=False)
+
+	# changed with UPDATEs by the batched counters and rango/trending.py
+	COUNTER_FIELDS = ('views', 'trending')
+
+	class Meta:
+		indexes = [
+			# a category's pages, most viewed first - matches the ordering used by
+			# rango/pagination.py and rango/stats.py, so no sort step is needed
+			models.Index(fields=['category', '-views', 'id'], name='rango_page_category_views'),
+			# the most trending pages, on the whole site and within a category
+			models.Index(fields=['-trending'], name='rango_page_trending'),
+			models.Index(fields=['category', '-trending'], name='rango_page_category_trending'),
+		]
+
+	@classmethod
+	def from_db(cls, db, field_names, values):
+		instance = super(Page, cls).from_db(db, field_names, values)
+		# remember what was loaded, so that when the page is saved the category
+		# aggregates can be adjusted by the difference (see rango/stats.py)
+		instance._loaded = {'category_id': instance.__dict__.get('category_id'),
+							'views': instance.__dict__.get('views'),
+							'trending': instance.__dict__.get('trending')}
+		return instance
+
+	def save(self, *args, **kwargs):
+		# import here to avoid a circular import with rango.links
+		from rango import links
+		self.url = links.normalize(self.url)
+		self.link_id = links.resolve([self.url]).get(self.url)
+		if not self._state.adding and not kwargs.get('force_insert') and 'update_fields' not in kwargs:
+			# writing back the views and score we loaded could undo views
+			# flushed since, so they are only saved if they have been changed
+			kwargs['update_fields'] = [f.attname for f in self._meta.concrete_fields
+									   if not f.primary_key and not unchanged_counter(self, f.attname)]
+		super(Page, self).save(*args, **kwargs)
+		# further saves of this instance are relative to what was just written
+		self._loaded = {'category_id': self.category_id, 'views': self.views, 'trending': self.trending}
 
 	def __str__(self):
 		return self.title
 
+class PageViewBucket(models.Model):
+	# a page's views in one hour (see rango/trending.py)
+	page = models.ForeignKey(Page)
+	# hours since 1970-01-01 UTC
+	bucket = models.IntegerField(db_index=True)
+	views = models.IntegerField(default=0)
+
+	class Meta:
+		unique_together = ('page', 'bucket')
+
+	def __str__(self):
+		return '{0} @ {1}'.format(self.page_id, self.bucket)
+
+class CategoryVisit(models.Model):
+	# a visitor who has looked at a category (see rango/related.py)
+	# visitors are the random token kept in their session
+	visitor = models.CharField(max_length=32)
+	category = models.ForeignKey(Category)
+	# the day of the visitor's latest visit, as a date ordinal
+	day = models.IntegerField(db_index=True)
+
+	class Meta:
+		unique_together = ('visitor', 'category')
+
+	def __str__(self):
+		return '{0} @ {1}'.format(self.visitor, self.category_id)
+
+class CategoryCoVisit(models.Model):
+	# how many visitors have looked at both category and related - kept in
+	# both directions, and only for each category's closest neighbours
+	category = models.ForeignKey(Category)
+	related = models.ForeignKey(Category, related_name='+')
+	visitors = models.IntegerField(default=0)
+
+	class Meta:
+		unique_together = ('category', 'related')
+		indexes = [
+			# a category's neighbours, most visited first
+			models.Index(fields=['category', '-visitors', 'related'], name='rango_covisit_category'),
+		]
+
+	def __str__(self):
+		return '{0} & {1}'.format(self.category_id, self.related_id)
+
 class UserProfile(models.Model):
 	# this line is required - it links the UserProfile to a User model instance
 	user = models.OneToOneField(User)
@@ -37,10 +197,25 @@ class UserProfile(models.Model):
 	# the additional attributes we wish to include
 	website = models.URLField(blank=True) #user does not have to supply a value for blank fields
 	picture = models.ImageField(upload_to='profile_images', blank=True) #connected with MEDIA_ROOT to provide a storage location for profile pictures
+	# sha256 of the picture, which names it and its thumbnails, and whether
+	# the thumbnails have been made yet (see rango/pictures.py)
+	picture_hash = models.CharField(max_length=64, blank=True, db_index=True)
+	thumbnails_ready = models.BooleanField(default=False)
 
 	# override the __unicode__() method to return something meaningful
 	def __str__(self):
-		return self.user.username	
+		return self.user.username
+
 
+class DailyVisits(models.Model):
+	# site-wide visit totals, updated in batches by rango/visits.py
+	day = models.DateField(unique=True)
+	visits = models.IntegerField(default=0)
+	# visitors seen for the first time that day
+	visitors = models.IntegerField(default=0)
 
-		
\ No newline at end of file
+	class Meta:
+		verbose_name_plural = 'Daily visits'
+
+	def __str__(self):
+		return str(self.day)
@@ -0,0 +1,97 @@
+import hashlib
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rango import metrics
+from rango.caching import CATEGORIES_VERSION_KEY, bump_version, get_versions
+
+logger = logging.getLogger(__name__)
+
+# whole-page caching for anonymous visitors
+#
+# views wrapped with @anonymous_page_cache(scope) keep their rendered
+# response in the cache, and serve it to later anonymous visitors without
+# running the view at all - no queries, no template rendering
+#
+# each view names a scope ('index', 'category:<slug>', ...) and cached
+# entries are keyed on:
+#   - the scope's version, bumped by purge(scope) when its data changes
+#   - the categories version, because every page embeds the sidebar
+#   - a global version, bumped by purge_all() after bulk changes
+#   - the full path and the request headers in RANGO_PAGE_CACHE_VARY
+# so a purge just bumps a version, and old entries are never read again
+
+SCOPE_VERSION_KEY = 'rango:page:{0}:version'
+ALL_VERSION_KEY = 'rango:page:all:version'
+PAGE_KEY = 'rango:page:{0}:{1}'
+
+
+def _is_anonymous(request):
+	# without a session cookie the visitor can't be logged in, so don't
+	# even look at the session
+	if settings.SESSION_COOKIE_NAME not in request.COOKIES:
+		return True
+	return not request.user.is_authenticated
+
+def _page_key(request, scope):
+	versions = get_versions(SCOPE_VERSION_KEY.format(scope), CATEGORIES_VERSION_KEY, ALL_VERSION_KEY)
+	vary = [request.get_full_path()]
+	vary.extend(request.META.get(header, '') for header in getattr(settings, 'RANGO_PAGE_CACHE_VARY', []))
+	digest = hashlib.md5('\n'.join(vary).encode('utf-8')).hexdigest()
+	return PAGE_KEY.format(scope, '.'.join(str(version) for version in versions) + '.' + digest)
+
+def anonymous_page_cache(scope, on_hit=None):
+	# scope is a string, or a function taking the view's arguments and
+	# returning one; on_hit(request, *args, **kwargs), given the view's
+	# arguments, still runs for cached pages (e.g. to count the visit)
+	def decorator(view):
+		@wraps(view)
+		def wrapper(request, *args, **kwargs):
+			if request.method not in ('GET', 'HEAD') or not _is_anonymous(request):
+				return view(request, *args, **kwargs)
+
+			name = scope(request, *args, **kwargs) if callable(scope) else scope
+			key = _page_key(request, name)
+			response = cache.get(key)
+			if response is not None:
+				metrics.incr('page_cache.hit')
+				if on_hit is not None:
+					on_hit(request, *args, **kwargs)
+				response['X-Cache'] = 'HIT'
+				return response
+
+			metrics.incr('page_cache.miss')
+			response = view(request, *args, **kwargs)
+			if response.status_code == 200 and not response.streaming and not response.cookies:
+				cache.set(key, response)
+			response['X-Cache'] = 'MISS'
+			return response
+		return wrapper
+	return decorator
+
+def purge(*scopes):
+	for scope in scopes:
+		logger.debug("Purging cached pages for %s", scope)
+		metrics.incr('page_cache.purge')
+		bump_version(SCOPE_VERSION_KEY.format(scope))
+
+def purge_all():
+	metrics.incr('page_cache.purge')
+	bump_version(ALL_VERSION_KEY)
+
+def category_scope(request, category_name_slug):
+	return 'category:' + category_name_slug
+
+def purge_categories(category_ids):
+	# purges the category pages (and the index, which lists top pages)
+	# a chunk of ids at a time, as a flush can touch any number of categories
+	from rango.counters import UPDATE_CHUNK_SIZE
+	from rango.models import Category
+	category_ids = list(set(category_ids))
+	slugs = []
+	for start in range(0, len(category_ids), UPDATE_CHUNK_SIZE):
+		chunk = category_ids[start:start + UPDATE_CHUNK_SIZE]
+		slugs.extend(Category.objects.filter(id__in=chunk).values_list('slug', flat=True))
+	purge('index', *['category:' + slug for slug in slugs])
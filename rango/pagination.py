@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.db.models import Q
+from rango.models import Page
+from rango.stats import pages_in_order
+
+# pages within a category are listed most viewed first, ties broken by id,
+# and paginated by seeking past the last page shown (keyset pagination)
+# rather than with OFFSET, so fetching any batch of pages costs the same
+# however far into the category it is
+#
+# a cursor is the views and id of the last page shown, e.g. '128.42'
+
+
+def parse_cursor(value):
+	# returns (views, id), or None for a missing or malformed cursor
+	try:
+		views, page_id = value.split('.')
+		return int(views), int(page_id)
+	except (AttributeError, ValueError):
+		return None
+
+def format_cursor(views, page_id):
+	return '{0}.{1}'.format(views, page_id)
+
+def make_cursor(page):
+	return format_cursor(page.views, page.id)
+
+def parse_size(value):
+	default = getattr(settings, 'RANGO_CATEGORY_PAGE_SIZE', 20)
+	maximum = getattr(settings, 'RANGO_CATEGORY_MAX_PAGE_SIZE', 100)
+	try:
+		size = int(value)
+	except (TypeError, ValueError):
+		return default
+	return max(1, min(size, maximum))
+
+def _after(pages, after):
+	if after is None:
+		return pages
+	views, page_id = after
+	return pages.filter(Q(views__lt=views) | Q(views=views, id__gt=page_id))
+
+def category_pages(category, after=None, size=20):
+	# returns a list of up to size pages and the cursor for the next batch
+	# (None when there are no more)
+	top_page_ids = category.get_top_page_ids()
+	if after is None and (size <= len(top_page_ids) or len(top_page_ids) == category.page_count):
+		# the first batch usually comes straight from the category's
+		# precomputed top pages (see rango/stats.py)
+		pages = pages_in_order(top_page_ids[:size])
+		has_more = category.page_count > len(pages)
+	else:
+		pages = _after(Page.objects.filter(category=category), after)
+		# fetch one extra row to find out whether there is another batch
+		pages = list(pages.order_by('-views', 'id')[:size + 1])
+		has_more = len(pages) > size
+		pages = pages[:size]
+
+	next_cursor = make_cursor(pages[-1]) if has_more and pages else None
+	return pages, next_cursor
+
+def category_page_values(category_id, fields, after=None, size=20):
+	# the same batches as category_pages(), as dicts of the given fields
+	# (for the API) rather than Page instances
+	columns = list(fields) + [name for name in ('id', 'views') if name not in fields]
+	rows = list(_after(Page.objects.filter(category_id=category_id), after)
+				.order_by('-views', 'id').values(*columns)[:size + 1])
+	has_more = len(rows) > size
+	rows = rows[:size]
+	next_cursor = format_cursor(rows[-1]['views'], rows[-1]['id']) if has_more and rows else None
+	return [dict((name, row[name]) for name in fields) for row in rows], next_cursor
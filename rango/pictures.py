@@ -0,0 +1,188 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# profile pictures
+#
+# register() only stores the uploaded original, named after the sha256 of
+# its contents, and returns - the resized copies the site actually shows
+# are made afterwards by a small pool of worker threads:
+#   profile_images/<hash>.jpg            the original, as uploaded (.png,
+#                                        .gif or .webp for those formats)
+#   profile_images/<hash>-small.jpg      thumbnails, one per RANGO_PICTURE_SIZES
+#   profile_images/<hash>-medium.jpg     entry, re-encoded as JPEG
+# identical uploads share one original and one set of thumbnails
+#
+# UserProfile.thumbnails_ready says whether a profile's thumbnails exist
+# yet, until then templates are given the original (see picture_url())
+# python manage.py process_pictures makes any thumbnails that are missing,
+# e.g. for pictures uploaded before this, or if the process stopped before
+# its workers got to them
+
+DIRECTORY = 'profile_images'
+
+# the longest side of each thumbnail, in pixels
+SIZES = {'small': 64, 'medium': 200, 'large': 400}
+
+JPEG_QUALITY = 85
+
+# the formats accepted, and the extension the original is stored with -
+# the uploaded name is never used, so nothing but an image Pillow can read
+# is ever served from MEDIA_URL
+FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+
+_executor = None
+_executor_lock = threading.Lock()
+# hashes being worked on -> whether another profile is waiting for them
+_pending = {}
+_pending_lock = threading.Lock()
+
+
+def sizes():
+	return getattr(settings, 'RANGO_PICTURE_SIZES', SIZES)
+
+def original_name(digest, extension):
+	return '{0}/{1}{2}'.format(DIRECTORY, digest, extension)
+
+def thumbnail_name(digest, size):
+	return '{0}/{1}-{2}.jpg'.format(DIRECTORY, digest, size)
+
+def image_extension(upload):
+	# the extension for an uploaded picture, from the format Pillow finds in
+	# it - raises ValidationError if it isn't an image in one of FORMATS
+	upload.seek(0)
+	try:
+		image = Image.open(upload)
+		image.verify()
+	except Exception:
+		raise ValidationError("Upload a valid image. The file you uploaded was either not an image or a corrupted image.")
+	finally:
+		upload.seek(0)
+	extension = FORMATS.get(image.format)
+	if extension is None:
+		raise ValidationError("Pictures must be JPEG, PNG, GIF or WebP images.")
+	return extension
+
+def attach(profile, upload):
+	# stores an uploaded picture as the profile's original, unless the same
+	# picture has been uploaded before - the profile still has to be saved
+	extension = image_extension(upload)
+	digest = hashlib.sha256()
+	for chunk in upload.chunks():
+		digest.update(chunk)
+	digest = digest.hexdigest()
+
+	name = original_name(digest, extension)
+	if not default_storage.exists(name):
+		upload.seek(0)
+		name = default_storage.save(name, upload)
+
+	profile.picture.name = name
+	profile.picture_hash = digest
+	profile.thumbnails_ready = all(default_storage.exists(thumbnail_name(digest, size)) for size in sizes())
+
+def make_thumbnails(digest, original):
+	# writes any missing thumbnails for the original picture with this hash
+	missing = [(size, pixels) for size, pixels in sizes().items()
+			   if not default_storage.exists(thumbnail_name(digest, size))]
+	if not missing:
+		return
+
+	with default_storage.open(original) as f:
+		image = Image.open(f)
+		# lets the JPEG decoder scale the picture down as it reads it,
+		# which is much faster than decoding it at full size
+		image.draft('RGB', (max(pixels for size, pixels in missing),) * 2)
+		image = image.convert('RGB')
+
+	# largest first, so each thumbnail is made from the smallest image that
+	# is still big enough
+	for size, pixels in sorted(missing, key=lambda item: -item[1]):
+		image.thumbnail((pixels, pixels), Image.LANCZOS)
+		buffer = BytesIO()
+		image.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+		name = thumbnail_name(digest, size)
+		if not default_storage.exists(name):
+			default_storage.save(name, ContentFile(buffer.getvalue()))
+
+def process(digest, original):
+	# makes the thumbnails, then marks every profile with this picture ready
+	from rango.models import UserProfile
+	make_thumbnails(digest, original)
+	UserProfile.objects.filter(picture_hash=digest, thumbnails_ready=False).update(thumbnails_ready=True)
+
+def _work(digest, original):
+	try:
+		while True:
+			process(digest, original)
+			with _pending_lock:
+				# another profile with the same picture was saved while we
+				# were working, so mark it ready too
+				if not _pending.pop(digest):
+					break
+				_pending[digest] = False
+	except Exception:
+		logger.exception("Couldn't make thumbnails for %s", original)
+		with _pending_lock:
+			_pending.pop(digest, None)
+	finally:
+		close_old_connections()
+
+def _get_executor():
+	global _executor
+	with _executor_lock:
+		if _executor is None:
+			_executor = ThreadPoolExecutor(max_workers=getattr(settings, 'RANGO_PICTURE_WORKERS', 2),
+										   thread_name_prefix='rango-pictures')
+		return _executor
+
+def schedule(profile):
+	# queues the profile's thumbnails once the current transaction commits
+	# with RANGO_PICTURE_WORKERS = 0 they are made straight away instead
+	if not profile.picture_hash or profile.thumbnails_ready:
+		return
+	digest, original = profile.picture_hash, profile.picture.name
+
+	def submit():
+		if not getattr(settings, 'RANGO_PICTURE_WORKERS', 2):
+			try:
+				process(digest, original)
+			except Exception:
+				logger.exception("Couldn't make thumbnails for %s", original)
+			return
+		with _pending_lock:
+			if digest in _pending:
+				# the same picture is already being worked on
+				_pending[digest] = True
+				return
+			_pending[digest] = False
+		_get_executor().submit(_work, digest, original)
+
+	transaction.on_commit(submit)
+
+def picture_url(profile, size='medium'):
+	# the url of the profile's picture at the given size, falling back to
+	# the original while the thumbnails are being made
+	if profile is None or not profile.picture:
+		return ''
+	if profile.picture_hash and profile.thumbnails_ready and size in sizes():
+		return default_storage.url(thumbnail_name(profile.picture_hash, size))
+	return profile.picture.url
+
+def hash_file(name):
+	digest = hashlib.sha256()
+	with default_storage.open(name) as f:
+		for chunk in File(f).chunks():
+			digest.update(chunk)
+	return digest.hexdigest()
@@ -0,0 +1,41 @@
+import threading
+import time
+from collections import OrderedDict
+
+# in-memory token buckets, per process
+#
+# each key (a username, an IP address) has a bucket holding up to capacity
+# tokens, refilled at one token every interval seconds - an attempt is
+# allowed while the bucket has a token, and only failures take one away
+
+
+class TokenBuckets(object):
+
+	def __init__(self, capacity, interval, max_keys=10000):
+		self.capacity = capacity
+		self.interval = interval
+		self.max_keys = max_keys
+		self.buckets = OrderedDict()
+		self.lock = threading.Lock()
+
+	def _refill(self, key, now):
+		# returns the key's tokens as of now, forgetting the least recently
+		# used keys beyond max_keys (a full bucket needs no remembering)
+		tokens, updated = self.buckets.pop(key, (self.capacity, now))
+		tokens = min(self.capacity, tokens + (now - updated) / self.interval)
+		self.buckets[key] = (tokens, now)
+		if len(self.buckets) > self.max_keys:
+			self.buckets.popitem(last=False)
+		return tokens
+
+	def wait(self, key):
+		# seconds until the key may try again, 0 if it may now
+		with self.lock:
+			tokens = self._refill(key, time.time())
+		return 0 if tokens >= 1 else (1 - tokens) * self.interval
+
+	def take(self, key):
+		now = time.time()
+		with self.lock:
+			tokens = self._refill(key, now)
+			self.buckets[key] = (max(tokens - 1, 0), now)
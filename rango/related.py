@@ -0,0 +1,283 @@
+import itertools
+from array import array
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, IntegerField, Value, When
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+from rango import counters, page_cache
+from rango.caching import bump_category_stats_version
+from rango.category_index import get_categories
+from rango.models import Category, CategoryCoVisit, CategoryVisit
+
+try:
+	import numpy
+	from scipy import sparse
+except ImportError:
+	# rebuild() counts the pairs in plain Python instead, which is fine up
+	# to a few hundred thousand visits
+	numpy = sparse = None
+
+# "visitors who looked at this category also looked at" - shown on each
+# category page
+#
+# each visitor gets a random token in their session the first time they
+# look at a category, and every category view is journaled as
+# 'token:category id' through the batched counters (see rango/counters.py).
+# When the counters are flushed, the visitor/category pairs that are new are
+# added to CategoryVisit (each visitor's history) and, for each of them, one
+# more visitor is counted in CategoryCoVisit for the new category and every
+# other category in that visitor's history
+#
+# CategoryCoVisit is the category x category matrix, stored sparsely - one
+# row per pair of categories that share any visitors, in both directions.
+# python manage.py rebuild_related --prune, run every hour or so, cuts it
+# down to each category's RANGO_RELATED_NEIGHBOURS closest neighbours. The
+# ids of the closest RELATED_CATEGORIES are kept in Category.related_category_ids,
+# which comes with the category from rango/category_index.py - so
+# show_category draws them without a query
+#
+# python manage.py rebuild_related drops visits older than
+# RANGO_RELATED_WINDOW seconds and recomputes the whole matrix from the
+# rest: as a sparse visitor x category matrix V (with NumPy and SciPy
+# installed), the co-visits are V.T * V, less the diagonal
+#
+# visitors with more than MAX_HISTORY categories (crawlers, mostly) are left
+# out of the matrix - they say little about which categories go together,
+# and would add a pair for almost every two categories
+
+VISITOR_KEY = 'visitor'
+TOKEN_LENGTH = 32
+
+# how many category ids are kept in Category.related_category_ids
+RELATED_CATEGORIES = 5
+
+NEIGHBOURS = 50
+WINDOW = 90 * 24 * 60 * 60
+MAX_HISTORY = 100
+
+# rows read per query by rebuild(), and written per bulk_create
+READ_CHUNK_SIZE = 10000
+WRITE_CHUNK_SIZE = 5000
+
+
+def neighbours():
+	return getattr(settings, 'RANGO_RELATED_NEIGHBOURS', NEIGHBOURS)
+
+def _chunks(items, size=counters.UPDATE_CHUNK_SIZE):
+	items = list(items)
+	for start in range(0, len(items), size):
+		yield items[start:start + size]
+
+def _today():
+	return timezone.now().date().toordinal()
+
+def visitor(request):
+	# the visitor's token, handed out the first time they need one
+	token = request.session.get(VISITOR_KEY)
+	if not isinstance(token, str) or len(token) != TOKEN_LENGTH or not token.isalnum():
+		token = get_random_string(TOKEN_LENGTH)
+		request.session[VISITOR_KEY] = token
+	return token
+
+def record_visit(request, category_id):
+	counters.increment('category.visitors', '{0}:{1}'.format(visitor(request), category_id))
+
+def related_categories(category, limit=RELATED_CATEGORIES):
+	# the categories most visited by this category's visitors, from the
+	# in-process category index rather than the database
+	return get_categories(category.get_related_category_ids()[:limit])
+
+
+def _save_related(related):
+	# related maps category id -> related category ids, closest first
+	# only categories whose list has changed are written (and purged from
+	# the page cache), and their ids returned
+	current = {}
+	for chunk in _chunks(related):
+		current.update(Category.objects.filter(id__in=chunk).values_list('id', 'related_category_ids'))
+	changed = {}
+	for category_id, related_ids in related.items():
+		value = ','.join(str(related_id) for related_id in related_ids[:RELATED_CATEGORIES])
+		if category_id in current and current[category_id] != value:
+			changed[category_id] = value
+	for chunk in _chunks(changed.items()):
+		Category.objects.filter(id__in=[category_id for category_id, value in chunk]).update(
+			related_category_ids=Case(*[When(id=category_id, then=Value(value)) for category_id, value in chunk],
+									  output_field=CharField()))
+	if changed:
+		bump_category_stats_version()
+		slugs = []
+		for chunk in _chunks(changed):
+			slugs.extend(Category.objects.filter(id__in=chunk).values_list('slug', flat=True))
+		page_cache.purge(*['category:' + slug for slug in slugs])
+	return list(changed)
+
+def refresh_categories(category_ids):
+	# one indexed query per category, reading at most RELATED_CATEGORIES rows
+	related = {}
+	for category_id in set(category_ids):
+		related[category_id] = list(CategoryCoVisit.objects.filter(category_id=category_id)
+									.order_by('-visitors', 'related_id')
+									.values_list('related_id', flat=True)[:RELATED_CATEGORIES])
+	return _save_related(related)
+
+def _add_pairs(pairs):
+	# pairs maps (category id, related id) -> visitors to add
+	by_category = defaultdict(dict)
+	for (category_id, related_id), visitors in pairs.items():
+		by_category[category_id][related_id] = visitors
+	for category_id, counts in by_category.items():
+		for chunk in _chunks(counts.items()):
+			related_ids = [related_id for related_id, visitors in chunk]
+			existing = set(CategoryCoVisit.objects.filter(category_id=category_id, related_id__in=related_ids)
+						   .values_list('related_id', flat=True))
+			CategoryCoVisit.objects.bulk_create([
+				CategoryCoVisit(category_id=category_id, related_id=related_id, visitors=visitors)
+				for related_id, visitors in chunk if related_id not in existing])
+			if not existing:
+				continue
+			CategoryCoVisit.objects.filter(category_id=category_id, related_id__in=existing).update(
+				visitors=F('visitors') + Case(*[When(related_id=related_id, then=Value(visitors))
+												for related_id, visitors in chunk if related_id in existing],
+											  default=Value(0), output_field=IntegerField()))
+	return list(by_category)
+
+def apply_visits(deltas):
+	# counters handler for category.visitors, whose keys are 'token:category id'
+	today = _today()
+	visited = defaultdict(set)
+	for key in deltas:
+		token, category_id = key.split(':')
+		visited[token].add(int(category_id))
+	# categories deleted since the visit are dropped
+	live = set(category.id for category in get_categories(set().union(*visited.values())))
+
+	history = defaultdict(set)
+	for chunk in _chunks(visited):
+		for token, category_id in CategoryVisit.objects.filter(visitor__in=chunk).values_list('visitor', 'category_id'):
+			history[token].add(category_id)
+
+	new_visits, revisits, pairs = [], defaultdict(list), Counter()
+	for token, category_ids in visited.items():
+		seen = history[token]
+		new = (category_ids & live) - seen
+		for category_id in category_ids & seen:
+			revisits[category_id].append(token)
+		new_visits.extend(CategoryVisit(visitor=token, category_id=category_id, day=today) for category_id in new)
+		if len(seen) + len(new) > MAX_HISTORY:
+			continue
+		for category_id in new:
+			for other in seen:
+				pairs[(category_id, other)] += 1
+				pairs[(other, category_id)] += 1
+		for category_id, other in itertools.permutations(new, 2):
+			pairs[(category_id, other)] += 1
+
+	CategoryVisit.objects.bulk_create(new_visits)
+	# the day of the latest visit is what keeps a visit inside the window
+	for category_id, tokens in revisits.items():
+		for chunk in _chunks(tokens):
+			CategoryVisit.objects.filter(category_id=category_id, visitor__in=chunk).exclude(day=today).update(day=today)
+	refresh_categories(_add_pairs(pairs))
+
+counters.register('category.visitors', apply_visits)
+
+
+def prune(limit=None):
+	# keeps each category's closest neighbours, returning how many rows were deleted
+	if limit is None:
+		limit = neighbours()
+	deleted = 0
+	# only the categories with more than that, found in one pass over the
+	# (category, ...) index
+	crowded = (CategoryCoVisit.objects.order_by().values('category_id')
+			   .annotate(rows=Count('id')).filter(rows__gt=limit).values_list('category_id', flat=True))
+	for category_id in list(crowded):
+		# LIMIT -1 OFFSET limit, along the (category, -visitors, related) index
+		extra = list(CategoryCoVisit.objects.filter(category_id=category_id)
+					 .order_by('-visitors', 'related_id').values_list('id', flat=True)[limit:])
+		for chunk in _chunks(extra):
+			deleted += CategoryCoVisit.objects.filter(id__in=chunk).delete()[0]
+	return deleted
+
+
+def _visits():
+	# every visit as two arrays, of visitor numbers and of category ids
+	# read in id order, a chunk at a time, so memory stays at two ints a visit
+	visitors, categories = array('q'), array('q')
+	numbers = {}
+	last_id = 0
+	while True:
+		rows = list(CategoryVisit.objects.filter(id__gt=last_id).order_by('id')
+					.values_list('id', 'visitor', 'category_id')[:READ_CHUNK_SIZE])
+		if not rows:
+			return visitors, categories
+		for visit_id, token, category_id in rows:
+			visitors.append(numbers.setdefault(token, len(numbers)))
+			categories.append(category_id)
+		last_id = rows[-1][0]
+
+def _neighbours_numpy(visitors, categories, limit):
+	# yields (category id, [(related id, visitors)]) with a sparse matrix product
+	if not visitors:
+		return
+	rows = numpy.frombuffer(visitors, dtype=numpy.int64)
+	columns = numpy.frombuffer(categories, dtype=numpy.int64)
+	history = numpy.bincount(rows)
+	keep = history[rows] <= MAX_HISTORY
+	rows, columns = rows[keep], columns[keep]
+	if not len(rows):
+		return
+	# visitors x categories, 1 where the visitor has looked at the category
+	visits = sparse.csr_matrix((numpy.ones(len(rows), dtype=numpy.int32), (rows, columns)),
+							   shape=(history.size, int(columns.max()) + 1))
+	covisits = visits.T.tocsr().dot(visits)
+	covisits = (covisits - sparse.diags(covisits.diagonal())).tocsr()
+	covisits.eliminate_zeros()
+	for category_id in numpy.flatnonzero(numpy.diff(covisits.indptr)):
+		start, end = covisits.indptr[category_id], covisits.indptr[category_id + 1]
+		related, counts = covisits.indices[start:end], covisits.data[start:end]
+		# most visitors first, then lowest id, as refresh_categories orders them
+		order = numpy.lexsort((related, -counts))[:limit]
+		yield int(category_id), list(zip(related[order].tolist(), counts[order].tolist()))
+
+def _neighbours_python(visitors, categories, limit):
+	# as _neighbours_numpy, counting each visitor's pairs one by one
+	histories = defaultdict(list)
+	for visitor_number, category_id in zip(visitors, categories):
+		histories[visitor_number].append(category_id)
+	covisits = defaultdict(Counter)
+	for category_ids in histories.values():
+		if len(category_ids) <= MAX_HISTORY:
+			for category_id, other in itertools.permutations(category_ids, 2):
+				covisits[category_id][other] += 1
+	for category_id, counts in covisits.items():
+		yield category_id, sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+def rebuild(today=None):
+	# drops visits older than the window and recomputes the matrix from the
+	# rest, returning the number of visits it was built from
+	if today is None:
+		today = _today()
+	window = getattr(settings, 'RANGO_RELATED_WINDOW', WINDOW)
+	CategoryVisit.objects.filter(day__lt=today - window // (24 * 60 * 60)).delete()
+
+	visitors, categories = _visits()
+	compute = _neighbours_numpy if numpy is not None else _neighbours_python
+	related = dict((category_id, []) for category_id in Category.objects.values_list('id', flat=True))
+	with transaction.atomic():
+		CategoryCoVisit.objects.all().delete()
+		rows = []
+		for category_id, closest in compute(visitors, categories, neighbours()):
+			related[category_id] = [related_id for related_id, count in closest]
+			rows.extend(CategoryCoVisit(category_id=category_id, related_id=related_id, visitors=count)
+						for related_id, count in closest)
+			if len(rows) >= WRITE_CHUNK_SIZE:
+				CategoryCoVisit.objects.bulk_create(rows)
+				rows = []
+		CategoryCoVisit.objects.bulk_create(rows)
+		_save_related(related)
+	return len(visitors)
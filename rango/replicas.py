@@ -0,0 +1,74 @@
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# read-only views read from a replica database, everything else (and every
+# write) uses the primary, 'default'
+#
+# the replica is RANGO_REPLICA_ALIAS in DATABASES - out of the box the same
+# SQLite file opened read-only (mode=ro) and kept in WAL mode, so readers
+# never wait for the writer's lock
+#
+# views opt in with @read_from_replica. Views that write use
+# @sticks_to_primary, which gives the visitor a cookie for
+# RANGO_REPLICA_STICKY_SECONDS after a successful POST - while it lasts
+# their reads go to the primary too, so they always see what they just wrote
+# even if a replica is behind
+
+STICKY_COOKIE = 'rango_primary'
+
+_local = threading.local()
+
+
+def replica_alias():
+	alias = getattr(settings, 'RANGO_REPLICA_ALIAS', None)
+	if alias not in connections.databases:
+		return None
+	# under test the replica is a mirror of the test database, and reading it
+	# through a second connection wouldn't see the test's uncommitted rows
+	if connections.databases[alias]['NAME'] == connections.databases[DEFAULT_DB_ALIAS]['NAME']:
+		return None
+	return alias
+
+def read_from_replica(view):
+	@wraps(view)
+	def wrapper(request, *args, **kwargs):
+		if request.method not in ('GET', 'HEAD') or STICKY_COOKIE in request.COOKIES:
+			return view(request, *args, **kwargs)
+		_local.replica = True
+		try:
+			return view(request, *args, **kwargs)
+		finally:
+			_local.replica = False
+	return wrapper
+
+def sticks_to_primary(view):
+	@wraps(view)
+	def wrapper(request, *args, **kwargs):
+		response = view(request, *args, **kwargs)
+		if request.method == 'POST' and response.status_code < 400:
+			seconds = getattr(settings, 'RANGO_REPLICA_STICKY_SECONDS', 10)
+			response.set_cookie(STICKY_COOKIE, '1', max_age=seconds, httponly=True)
+		return response
+	return wrapper
+
+
+class ReplicaRouter(object):
+
+	def db_for_read(self, model, **hints):
+		if getattr(_local, 'replica', False):
+			return replica_alias()
+		return None
+
+	def db_for_write(self, model, **hints):
+		return DEFAULT_DB_ALIAS
+
+	def allow_relation(self, obj1, obj2, **hints):
+		# the replica holds the same rows as the primary
+		return True
+
+	def allow_migrate(self, db, app_label, model_name=None, **hints):
+		# the replica is the primary's copy, never migrated itself
+		return db == DEFAULT_DB_ALIAS
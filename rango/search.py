@@ -0,0 +1,130 @@
+import re
+
+from django.db import connection
+from rango.models import Category, Page
+
+# full-text search over page titles and urls and category names, using an
+# SQLite FTS5 table that triggers keep in step with the rango tables
+#
+# pages and categories share the one table - a page is stored under rowid
+# id * 2 and a category under id * 2 + 1, so a row can be found (and
+# replaced by the triggers) by rowid alone
+
+TABLE = 'rango_search'
+
+# results are ranked with bm25, with a match in the title (or category
+# name) counting for much more than one in the url
+TITLE_WEIGHT = 10.0
+URL_WEIGHT = 1.0
+
+CREATE_TABLE = (
+	"CREATE VIRTUAL TABLE IF NOT EXISTS rango_search USING fts5("
+	"title, url, tokenize='unicode61', prefix='2 3 4')"
+)
+
+TRIGGERS = [
+	"""CREATE TRIGGER IF NOT EXISTS rango_page_search_insert AFTER INSERT ON rango_page BEGIN
+		INSERT INTO rango_search(rowid, title, url) VALUES (new.id * 2, new.title, new.url);
+	END""",
+	"""CREATE TRIGGER IF NOT EXISTS rango_page_search_update AFTER UPDATE OF title, url ON rango_page BEGIN
+		DELETE FROM rango_search WHERE rowid = old.id * 2;
+		INSERT INTO rango_search(rowid, title, url) VALUES (new.id * 2, new.title, new.url);
+	END""",
+	"""CREATE TRIGGER IF NOT EXISTS rango_page_search_delete AFTER DELETE ON rango_page BEGIN
+		DELETE FROM rango_search WHERE rowid = old.id * 2;
+	END""",
+	"""CREATE TRIGGER IF NOT EXISTS rango_category_search_insert AFTER INSERT ON rango_category BEGIN
+		INSERT INTO rango_search(rowid, title, url) VALUES (new.id * 2 + 1, new.name, '');
+	END""",
+	"""CREATE TRIGGER IF NOT EXISTS rango_category_search_update AFTER UPDATE OF name ON rango_category BEGIN
+		DELETE FROM rango_search WHERE rowid = old.id * 2 + 1;
+		INSERT INTO rango_search(rowid, title, url) VALUES (new.id * 2 + 1, new.name, '');
+	END""",
+	"""CREATE TRIGGER IF NOT EXISTS rango_category_search_delete AFTER DELETE ON rango_category BEGIN
+		DELETE FROM rango_search WHERE rowid = old.id * 2 + 1;
+	END""",
+]
+
+REBUILD = [
+	"DELETE FROM rango_search",
+	"INSERT INTO rango_search(rowid, title, url) SELECT id * 2, title, url FROM rango_page",
+	"INSERT INTO rango_search(rowid, title, url) SELECT id * 2 + 1, name, '' FROM rango_category",
+]
+
+
+def is_supported(using=connection):
+	return using.vendor == 'sqlite'
+
+def install(using=connection):
+	# creates the search table and its triggers if they are missing
+	# this is run after every migrate (see rango/signals.py), because
+	# migrations that alter rango_page or rango_category on SQLite rebuild
+	# the table and drop its triggers
+	if not is_supported(using):
+		return
+	with using.cursor() as cursor:
+		cursor.execute(CREATE_TABLE)
+		for trigger in TRIGGERS:
+			cursor.execute(trigger)
+
+def rebuild(using=connection):
+	# repopulates the search table from scratch
+	install(using)
+	with using.cursor() as cursor:
+		for statement in REBUILD:
+			cursor.execute(statement)
+
+def make_query(text):
+	# turns what the user typed into an FTS5 query - every word has to
+	# match, and the last one can be the start of a longer word
+	# words are quoted, so FTS5 operators and punctuation are never parsed
+	words = re.findall(r'\w+', text.lower())
+	if not words:
+		return None
+	terms = ['"{0}"'.format(word) for word in words]
+	terms[-1] += '*'
+	return ' '.join(terms)
+
+def search(text, limit=20):
+	# returns a list of (page or category, score) pairs, best match first
+	query = make_query(text or '')
+	if query is None:
+		return []
+
+	if not is_supported():
+		# no FTS5 - fall back to a (slow) substring match on titles
+		pages = Page.objects.filter(title__icontains=text).select_related('category')[:limit]
+		return [(page, 0.0) for page in pages]
+
+	with connection.cursor() as cursor:
+		cursor.execute(
+			"SELECT rowid, bm25(rango_search, %s, %s) AS score FROM rango_search "
+			"WHERE rango_search MATCH %s ORDER BY score LIMIT %s",
+			[TITLE_WEIGHT, URL_WEIGHT, query, limit])
+		rows = cursor.fetchall()
+
+	pages = Page.objects.select_related('category').in_bulk(
+		[rowid // 2 for rowid, score in rows if rowid % 2 == 0])
+	categories = Category.objects.in_bulk(
+		[rowid // 2 for rowid, score in rows if rowid % 2 == 1])
+
+	results = []
+	for rowid, score in rows:
+		found = (pages if rowid % 2 == 0 else categories).get(rowid // 2)
+		if found is not None:
+			# bm25 scores are negative, lower is better
+			results.append((found, -score))
+	return results
+
+def filter_matching(queryset, text, limit=1000):
+	# narrows a queryset of pages (or categories) to the best limit matching
+	# text - used by the admin's search box. The matching ids are a subquery,
+	# never read into Python, so the statement stays small however many
+	# match. None if there is no FTS5 to ask
+	query = make_query(text or '')
+	if query is None or not is_supported():
+		return None
+	where = ('"{0}"."id" IN (SELECT rowid / 2 FROM rango_search WHERE rango_search MATCH %s '
+			 'AND rowid %% 2 = %s ORDER BY bm25(rango_search, %s, %s) LIMIT %s)').format(queryset.model._meta.db_table)
+	return queryset.extra(where=[where], params=[query, 0 if queryset.model is Page else 1,
+												 TITLE_WEIGHT, URL_WEIGHT, limit])
@@ -0,0 +1,162 @@
+import threading
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+from django.core import signing
+from django.core.cache import caches
+from django.db import transaction
+from rango.background import run_periodically
+
+# the 'hybrid' session engine (SESSION_ENGINE = 'rango.sessions')
+#
+# anonymous visitors only keep a visit count in their session, so their
+# session lives entirely in a signed cookie, like Django's signed_cookies
+# engine - reading or changing it never touches the database
+#
+# once someone logs in their session moves to the cache, with the
+# database as a backing store that is written behind: changes are queued
+# and written in batches every RANGO_SESSION_WRITE_BEHIND_INTERVAL seconds
+# (the first save of a new signed-in session is written straight away)
+#
+# a signed cookie always contains ':' and a random session key never does,
+# which is how load() tells them apart
+#
+# the cache must be shared between processes (e.g. memcached) when running
+# more than one, otherwise each process would cache its own copy of a
+# signed-in session
+
+SIGNED_SALT = 'rango.sessions'
+CACHE_KEY_PREFIX = 'rango.sessions.'
+
+# sessions written to or deleted from the database per statement
+WRITE_CHUNK_SIZE = 300
+
+
+class WriteBehind(object):
+
+	def __init__(self):
+		self.lock = threading.Lock()
+		# session key -> (session_data, expire_date), or None to delete
+		self.pending = {}
+
+	def put(self, session_key, value):
+		with self.lock:
+			self.pending[session_key] = value
+		run_periodically('sessions', getattr(settings, 'RANGO_SESSION_WRITE_BEHIND_INTERVAL', 5), self.flush)
+
+	def get(self, session_key):
+		# returns (True, value) if a write for session_key is still queued
+		with self.lock:
+			if session_key in self.pending:
+				return True, self.pending[session_key]
+		return False, None
+
+	def flush(self):
+		with self.lock:
+			pending, self.pending = self.pending, {}
+		if not pending:
+			return 0
+
+		Session = DBStore.get_model_class()
+		session_keys = list(pending)
+		try:
+			with transaction.atomic():
+				for start in range(0, len(session_keys), WRITE_CHUNK_SIZE):
+					Session.objects.filter(session_key__in=session_keys[start:start + WRITE_CHUNK_SIZE]).delete()
+				Session.objects.bulk_create([
+					Session(session_key=session_key, session_data=value[0], expire_date=value[1])
+					for session_key, value in pending.items() if value is not None])
+		except Exception:
+			# put back anything that hasn't been superseded, and try again later
+			with self.lock:
+				for session_key, value in pending.items():
+					self.pending.setdefault(session_key, value)
+			raise
+		return len(pending)
+
+
+write_behind = WriteBehind()
+
+
+def is_signed(session_key):
+	return bool(session_key) and ':' in session_key
+
+
+class SessionStore(DBStore):
+
+	def __init__(self, session_key=None):
+		self._cache = caches[settings.SESSION_CACHE_ALIAS]
+		super(SessionStore, self).__init__(session_key)
+
+	def _cache_key(self, session_key):
+		return CACHE_KEY_PREFIX + session_key
+
+	def load(self):
+		session_key = self.session_key
+		if session_key is None:
+			return {}
+
+		if is_signed(session_key):
+			try:
+				return signing.loads(session_key, serializer=self.serializer, salt=SIGNED_SALT,
+									 max_age=settings.SESSION_COOKIE_AGE)
+			except Exception:
+				# a bad signature, or an expired cookie - start again
+				self._session_key = None
+				return {}
+
+		data = self._cache.get(self._cache_key(session_key))
+		if data is not None:
+			return data
+
+		queued, value = write_behind.get(session_key)
+		if queued:
+			data = self.decode(value[0]) if value is not None else {}
+		else:
+			data = super(SessionStore, self).load()
+		if self.session_key is not None and data:
+			# pass the expiry in, as get_expiry_age() would otherwise load the session
+			self._cache.set(self._cache_key(session_key), data,
+							self.get_expiry_age(expiry=data.get('_session_expiry')))
+		return data
+
+	def exists(self, session_key):
+		if not session_key or is_signed(session_key):
+			return False
+		return (self._cache_key(session_key) in self._cache
+				or write_behind.get(session_key)[0]
+				or super(SessionStore, self).exists(session_key))
+
+	def create(self):
+		# the key is chosen when the session is saved, because whether it
+		# is a signed cookie depends on what is in the session by then
+		self._session_key = None
+		self.modified = True
+
+	def save(self, must_create=False):
+		data = self._get_session(no_load=must_create)
+		if SESSION_KEY not in data:
+			self._session_key = signing.dumps(data, compress=True, salt=SIGNED_SALT,
+											  serializer=self.serializer)
+			return
+
+		created = self.session_key is None or is_signed(self.session_key)
+		if created:
+			self._session_key = self._get_new_session_key()
+		self._cache.set(self._cache_key(self.session_key), data, self.get_expiry_age())
+		if created:
+			# written through, so other processes can find a session that
+			# has just been logged in to
+			super(SessionStore, self).save(must_create=True)
+		else:
+			write_behind.put(self.session_key, (self.encode(data), self.get_expiry_date()))
+
+	def delete(self, session_key=None):
+		if session_key is None:
+			session_key = self.session_key
+		if session_key is None or is_signed(session_key):
+			# nothing is stored for a signed cookie
+			return
+		self._cache.delete(self._cache_key(session_key))
+		write_behind.put(session_key, None)
@@ -0,0 +1,42 @@
+from django.db import connections
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from rango import page_cache, search, stats
+from rango.caching import bump_categories_version
+from rango.models import Category, Page
+
+# keep the cached sidebar, the cached pages and the category aggregates in
+# step with the categories and pages tables
+# these are connected when the app is ready (see rango/apps.py)
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+	# the sidebar version is part of every cached page's key, so this also
+	# retires every cached page showing the old sidebar
+	bump_categories_version()
+	slugs = set([instance.slug, getattr(instance, '_loaded_slug', None) or instance.slug])
+	page_cache.purge('index', *['category:' + slug for slug in slugs])
+
+@receiver(post_save, sender=Page)
+def page_saved(sender, instance, created, raw=False, **kwargs):
+	loaded = getattr(instance, '_loaded', None) or {}
+	category_ids = [instance.category_id, loaded.get('category_id') or instance.category_id]
+	page_cache.purge_categories(category_ids)
+	stats.touch(category_ids)
+	# raw saves come from loaddata, which is followed by rebuild_category_stats
+	if not raw:
+		stats.page_saved(instance, created)
+
+@receiver(post_delete, sender=Page)
+def page_deleted(sender, instance, **kwargs):
+	page_cache.purge_categories([instance.category_id])
+	stats.touch([instance.category_id])
+	stats.page_deleted(instance)
+
+@receiver(post_migrate)
+def install_search(sender, using, **kwargs):
+	# a migration that alters a rango table on SQLite rebuilds it, which
+	# drops the search triggers, so put back anything that is missing
+	if sender.name == 'rango':
+		search.install(connections[using])
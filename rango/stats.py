@@ -0,0 +1,126 @@
+from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from rango import counters, page_cache, trending
+from rango.caching import bump_category_stats_version
+from rango.models import Category, Page
+
+# Category.page_count, page_views and top_page_ids summarise each category's
+# pages so that the index and category views can render without scanning
+# the page table. They are kept up to date incrementally with UPDATEs as
+# pages change, and rebuild() recomputes them from scratch
+# (python manage.py rebuild_category_stats). Every change bumps the category
+# stats version, so rango/category_index.py reloads its copy
+
+# how many page ids are kept in Category.top_page_ids
+TOP_PAGES = 10
+
+
+def refresh_top_pages(category_ids):
+	# one indexed query per category, reading at most TOP_PAGES rows
+	for category_id in set(category_ids):
+		page_ids = (Page.objects.filter(category_id=category_id)
+					.order_by('-views', 'id')
+					.values_list('id', flat=True)[:TOP_PAGES])
+		Category.objects.filter(id=category_id).update(
+			top_page_ids=','.join(str(page_id) for page_id in page_ids))
+	bump_category_stats_version()
+
+def adjust(category_id, pages=0, views=0):
+	if pages or views:
+		Category.objects.filter(id=category_id).update(
+			page_count=F('page_count') + pages,
+			page_views=F('page_views') + views)
+		bump_category_stats_version()
+
+def touch(category_ids):
+	# bumps the version of categories whose pages have changed
+	category_ids = list(set(category_id for category_id in category_ids if category_id is not None))
+	for start in range(0, len(category_ids), counters.UPDATE_CHUNK_SIZE):
+		chunk = category_ids[start:start + counters.UPDATE_CHUNK_SIZE]
+		Category.objects.filter(id__in=chunk).update(version=F('version') + 1)
+	if category_ids:
+		bump_category_stats_version()
+
+def page_saved(page, created):
+	if created:
+		adjust(page.category_id, pages=1, views=page.views)
+		refresh_top_pages([page.category_id])
+		return
+
+	loaded = getattr(page, '_loaded', None)
+	if loaded is None or loaded['category_id'] is None or loaded['views'] is None:
+		# we don't know what the page looked like before, so start again
+		# for its category
+		rebuild([page.category_id])
+		return
+
+	if loaded['category_id'] != page.category_id:
+		adjust(loaded['category_id'], pages=-1, views=-loaded['views'])
+		adjust(page.category_id, pages=1, views=page.views)
+		refresh_top_pages([loaded['category_id'], page.category_id])
+	elif loaded['views'] != page.views:
+		adjust(page.category_id, views=page.views - loaded['views'])
+		refresh_top_pages([page.category_id])
+
+def page_deleted(page):
+	adjust(page.category_id, pages=-1, views=-page.views)
+	refresh_top_pages([page.category_id])
+
+def rebuild(category_ids=None, batch_size=100):
+	# recomputes the aggregates for the given categories (or all of them),
+	# using one GROUP BY query and one UPDATE per batch of categories
+	if category_ids is None:
+		category_ids = Category.objects.order_by('id').values_list('id', flat=True).iterator()
+	category_ids = list(category_ids)
+
+	for start in range(0, len(category_ids), batch_size):
+		batch = category_ids[start:start + batch_size]
+		totals = (Page.objects.filter(category_id__in=batch)
+				  .values('category_id')
+				  .annotate(count=Count('id'), views=Sum('views'))
+				  .order_by())
+		counts = dict((row['category_id'], (row['count'], row['views'])) for row in totals)
+		Category.objects.filter(id__in=batch).update(
+			page_count=Case(*[When(id=category_id, then=Value(count))
+							  for category_id, (count, views) in counts.items()],
+							default=Value(0), output_field=IntegerField()),
+			page_views=Case(*[When(id=category_id, then=Value(views))
+							  for category_id, (count, views) in counts.items()],
+							default=Value(0), output_field=IntegerField()),
+			version=F('version') + 1)
+		refresh_top_pages(batch)
+	page_cache.purge_all()
+	return len(category_ids)
+
+def apply_page_views(deltas):
+	# counters handler for page.views - as well as bumping Page.views, the
+	# flushed views are added to each category's total and top pages, and
+	# to the trending scores (see rango/trending.py)
+	counters.field_updater('rango.Page', 'views')(deltas)
+
+	by_category = {}
+	page_ids = [int(page_id) for page_id in deltas]
+	for start in range(0, len(page_ids), counters.UPDATE_CHUNK_SIZE):
+		chunk = page_ids[start:start + counters.UPDATE_CHUNK_SIZE]
+		for page_id, category_id in Page.objects.filter(id__in=chunk).values_list('id', 'category_id'):
+			by_category[category_id] = by_category.get(category_id, 0) + deltas[str(page_id)]
+
+	for category_id, views in by_category.items():
+		adjust(category_id, views=views)
+	refresh_top_pages(by_category)
+	trending.record(dict((int(page_id), views) for page_id, views in deltas.items()))
+	touch(by_category)
+	# the new views can change the order of pages on the index and category pages
+	page_cache.purge_categories(by_category)
+
+counters.register('page.views', apply_page_views)
+
+
+def pages_in_order(page_ids):
+	# fetches pages by id, keeping the order of page_ids
+	pages = Page.objects.in_bulk(page_ids)
+	return [pages[page_id] for page_id in page_ids if page_id in pages]
+
+def top_pages(limit=5):
+	# the most viewed pages on the site, read off the index on Page.views -
+	# which also holds the id, so ties go to the newest page without a sort
+	return list(Page.objects.order_by('-views', '-id')[:limit])
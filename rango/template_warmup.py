@@ -0,0 +1,48 @@
+import os
+import time
+
+from django.template import TemplateSyntaxError, engines
+from django.template.utils import get_app_template_dirs
+
+# compiles every template up front, so that with the cached loader
+# (RANGO_TEMPLATE_MODE = 'production') no request has to wait for one to
+# be read and parsed - tango_with_django_project/wsgi.py does this as the
+# application starts, and python manage.py warm_templates does it on its own,
+# which also shows any template that doesn't compile
+
+EXTENSIONS = ('.html', '.txt', '.xml')
+
+
+def template_names(engine):
+	# the name of every template the engine can find, in the order its
+	# directories are searched
+	directories = list(engine.dirs)
+	if engine.app_dirs or any('app_directories' in str(loader) for loader in engine.engine.loaders):
+		directories += list(get_app_template_dirs('templates'))
+	names = []
+	for directory in directories:
+		for root, dirs, files in os.walk(directory):
+			for filename in sorted(files):
+				if filename.endswith(EXTENSIONS):
+					name = os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/')
+					if name not in names:
+						names.append(name)
+	return names
+
+def warm():
+	# returns (template name, milliseconds to compile, error or None) for
+	# every template of every Django template engine
+	results = []
+	for engine in engines.all():
+		if not hasattr(engine, 'engine'):
+			# not a Django template engine
+			continue
+		for name in template_names(engine):
+			started = time.perf_counter()
+			try:
+				engine.get_template(name)
+				error = None
+			except TemplateSyntaxError as e:
+				error = e
+			results.append((name, (time.perf_counter() - started) * 1000, error))
+	return results
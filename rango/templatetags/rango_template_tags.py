@@ -1,9 +1,54 @@
 from django import template
-from rango.models import Category
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+from rango.caching import fragment_key, get_sidebar_html
+from rango.pictures import picture_url
 
 register = template.Library()
 
-@register.inclusion_tag('rango/cats.html')
+# the sidebar is rendered once and cached (see rango/caching.py), so this is
+# a simple tag returning html rather than an inclusion tag
+@register.simple_tag
 def get_category_list(cat=None):
-		return {'cats': Category.objects.all(),
-				'act_cat': cat}
\ No newline at end of file
+		return mark_safe(get_sidebar_html(cat))
+
+# the url of a user's profile picture at one of RANGO_PICTURE_SIZES, e.g.
+# <img src="{% profile_picture_url user.userprofile 'small' %}">
+@register.simple_tag
+def profile_picture_url(profile, size='medium'):
+		return picture_url(profile, size)
+
+# caches the part of a template it encloses, e.g.
+#   {% fragment_cache 'category-pages' category request.GET.urlencode %}
+#   ...
+#   {% endfragment_cache %}
+# under a key made from the name and the values after it - a category
+# counts as its id and version - so a new copy is rendered as soon as any
+# of them changes and old copies never need to expire
+class FragmentCacheNode(template.Node):
+
+	def __init__(self, nodelist, name, parts):
+		self.nodelist = nodelist
+		self.name = name
+		self.parts = parts
+
+	def render(self, context):
+		if not getattr(settings, 'RANGO_FRAGMENT_CACHE', True):
+			return self.nodelist.render(context)
+		key = fragment_key(self.name.resolve(context), *[part.resolve(context) for part in self.parts])
+		html = cache.get(key)
+		if html is None:
+			html = self.nodelist.render(context)
+			cache.set(key, html)
+		return html
+
+@register.tag
+def fragment_cache(parser, token):
+	bits = token.split_contents()
+	if len(bits) < 2:
+		raise template.TemplateSyntaxError("'{0}' needs a name".format(bits[0]))
+	nodelist = parser.parse(('endfragment_cache',))
+	parser.delete_first_token()
+	return FragmentCacheNode(nodelist, parser.compile_filter(bits[1]),
+							 [parser.compile_filter(bit) for bit in bits[2:]])
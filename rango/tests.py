@@ -1,3 +1,912 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from io import BytesIO, StringIO
+from socketserver import ThreadingMixIn
+from unittest import mock, skipIf
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.paginator import EmptyPage
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+from rango import auth, caching, counters, exporter, page_cache, related, replicas, search, sessions, stats, trending
+from rango.admin import CategoryAdmin, EstimatedCountPaginator
+from rango.forms import PageForm
+from rango.importer import import_records
+from rango.links import normalize
+from rango.ratelimit import TokenBuckets
+from PIL import Image
+from rango.models import Category, CategoryCoVisit, CategoryVisit, DailyVisits, Link, Page, PageViewBucket, UserProfile
 
 # Create your tests here.
+
+class RangoTestCase(TestCase):
+	# every test journals its counters into a directory of its own, flushed
+	# only when the test asks - never into BASE_DIR/counters, where the next
+	# real flush would apply them to db.sqlite3
+
+	def setUp(self):
+		directory = tempfile.mkdtemp(prefix='rango-test-')
+		self.addCleanup(shutil.rmtree, directory, True)
+		overridden = override_settings(RANGO_COUNTER_DIR=directory, RANGO_COUNTER_FLUSH_INTERVAL=None)
+		overridden.enable()
+		self.addCleanup(overridden.disable)
+
+
+class QueryPlanTests(RangoTestCase):
+	# checks that the queries behind the busiest views are answered from an
+	# index, using SQLite's EXPLAIN QUERY PLAN
+	# a plan line such as 'SCAN rango_page' (with no index) is a full table
+	# scan, and 'USE TEMP B-TREE FOR ORDER BY' means the rows had to be sorted
+
+	@classmethod
+	def setUpTestData(cls):
+		for i in range(3):
+			category = Category(name='Category {0}'.format(i), likes=i)
+			category.save()
+			Page.objects.bulk_create([Page(category=category, title='Page {0}'.format(j),
+										   url='http://example.com/{0}/{1}'.format(i, j), views=j % 7)
+									  for j in range(30)])
+		stats.rebuild()
+
+	def explain(self, sql, params=()):
+		with connection.cursor() as cursor:
+			cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+			return [row[-1] for row in cursor.fetchall()]
+
+	def assertUsesIndex(self, sql, params=()):
+		plan = self.explain(sql, params)
+		for line in plan:
+			if line.startswith('SCAN') and 'INDEX' not in line:
+				self.fail("Full table scan in {0!r} for {1}".format(plan, sql))
+			if 'TEMP B-TREE' in line:
+				self.fail("Sorting without an index in {0!r} for {1}".format(plan, sql))
+
+	def assertQuerysetUsesIndex(self, queryset):
+		sql, params = queryset.query.sql_with_params()
+		self.assertUsesIndex(sql, params)
+
+	def assertViewUsesIndexes(self, url):
+		# every ordered query, and every query on the page table, that the
+		# view makes should be able to use an index
+		# the first request fills the sidebar cache, which reads every category,
+		# and the cached page is thrown away (and cached fragments ignored) so
+		# the view and its template run again
+		self.client.get(url)
+		page_cache.purge_all()
+		with override_settings(RANGO_FRAGMENT_CACHE=False), CaptureQueriesContext(connection) as queries:
+			response = self.client.get(url)
+		self.assertEqual(response.status_code, 200)
+
+		checked = 0
+		for query in queries.captured_queries:
+			sql = query['sql']
+			if not sql.startswith('SELECT') or 'rango_' not in sql:
+				continue
+			if 'ORDER BY' in sql or 'FROM "rango_page"' in sql:
+				self.assertUsesIndex(sql)
+				checked += 1
+		self.assertTrue(checked, "No rango queries were made by {0}".format(url))
+
+	def test_most_liked_categories(self):
+		self.assertQuerysetUsesIndex(Category.objects.order_by('-likes')[:5])
+
+	def test_most_viewed_pages(self):
+		self.assertQuerysetUsesIndex(Page.objects.order_by('-views')[:5])
+		# ties and all, as stats.top_pages reads them
+		self.assertQuerysetUsesIndex(Page.objects.order_by('-views', '-id')[:5])
+
+	def test_category_pages(self):
+		category = Category.objects.get(slug='category-1')
+		self.assertQuerysetUsesIndex(Page.objects.filter(category=category))
+		self.assertQuerysetUsesIndex(
+			Page.objects.filter(category=category).order_by('-views', 'id')[:20])
+
+	def test_index_view(self):
+		self.assertViewUsesIndexes('/rango/')
+
+	def test_show_category_view(self):
+		self.assertViewUsesIndexes('/rango/category/category-1/')
+
+	def test_show_category_later_pages(self):
+		# past the first batch the pages come from a keyset query on the page table
+		self.assertViewUsesIndexes('/rango/category/category-1/?after=3.10&size=5')
+		self.assertViewUsesIndexes('/rango/category/category-1/pages/?after=3.10&size=5')
+
+
+class StubServer(ThreadingMixIn, HTTPServer):
+	# a local web server for the link checker to check, counting the
+	# requests it gets for each path
+	daemon_threads = True
+
+	def __init__(self):
+		HTTPServer.__init__(self, ('127.0.0.1', 0), StubHandler)
+		self.hits = Counter()
+
+	def url(self, path):
+		return 'http://127.0.0.1:{0}{1}'.format(self.server_address[1], path)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+	def respond(self):
+		self.server.hits[self.path] += 1
+		if self.path == '/slow':
+			time.sleep(1)
+		if self.path == '/no-head' and self.command == 'HEAD':
+			status = 405
+		else:
+			status = {'/ok': 200, '/no-head': 200, '/moved': 301, '/slow': 200}.get(self.path, 404)
+		self.send_response(status)
+		self.send_header('Content-Length', '0')
+		self.end_headers()
+
+	do_HEAD = do_GET = respond
+
+	def log_message(self, *args):
+		pass
+
+
+class LinkTests(RangoTestCase):
+
+	def test_normalize(self):
+		self.assertEqual(normalize('Example.COM'), 'http://example.com/')
+		self.assertEqual(normalize('http://example.com:80/a?b=1#top'), 'http://example.com/a?b=1')
+		self.assertEqual(normalize('https://example.com:443'), 'https://example.com/')
+		self.assertEqual(normalize('https://example.com:8443/A'), 'https://example.com:8443/A')
+
+	def test_page_form_keeps_https(self):
+		form = PageForm({'title': 'Secure', 'url': 'https://example.com/docs', 'views': 0})
+		self.assertTrue(form.is_valid())
+		self.assertEqual(form.cleaned_data['url'], 'https://example.com/docs')
+		form = PageForm({'title': 'Bare', 'url': 'example.com', 'views': 0})
+		self.assertTrue(form.is_valid())
+		self.assertEqual(form.cleaned_data['url'], 'http://example.com/')
+
+	def test_pages_share_links(self):
+		python = Category.objects.create(name='Python')
+		django = Category.objects.create(name='Django')
+		first = Page.objects.create(category=python, title='Docs', url='http://Docs.example.com')
+		second = Page.objects.create(category=django, title='Docs', url='http://docs.example.com/#intro')
+		self.assertEqual(first.link_id, second.link_id)
+		self.assertEqual(second.url, 'http://docs.example.com/')
+		self.assertEqual(Link.objects.count(), 1)
+
+	def test_check_links(self):
+		server = StubServer()
+		thread = threading.Thread(target=server.serve_forever, daemon=True)
+		thread.start()
+		self.addCleanup(server.server_close)
+		self.addCleanup(server.shutdown)
+
+		category = Category.objects.create(name='Links')
+		for i, path in enumerate(['/ok', '/ok', '/ok', '/missing', '/moved', '/no-head', '/slow']):
+			Page.objects.create(category=category, title='Page {0}'.format(i), url=server.url(path))
+		call_command('check_links', concurrency=3, timeout=0.5, stdout=StringIO())
+
+		statuses = dict((link.url.split('/', 3)[3], link) for link in Link.objects.all())
+		self.assertEqual(statuses['ok'].status, 200)
+		self.assertEqual(statuses['missing'].status, 404)
+		self.assertEqual(statuses['moved'].status, 301)
+		self.assertEqual(statuses['no-head'].status, 200)
+		self.assertIsNone(statuses['slow'].status)
+		self.assertEqual(statuses['slow'].error, 'timed out')
+		self.assertIsNotNone(statuses['ok'].latency_ms)
+		self.assertIsNotNone(statuses['ok'].checked_at)
+		# three pages, one request
+		self.assertEqual(server.hits['/ok'], 1)
+		self.assertEqual(server.hits['/no-head'], 2)
+
+		# nothing is stale yet, so a second run checks nothing
+		call_command('check_links', stdout=StringIO())
+		self.assertEqual(server.hits['/ok'], 1)
+
+
+class CounterTests(RangoTestCase):
+
+	def setUp(self):
+		super(CounterTests, self).setUp()
+		self.category = Category.objects.create(name='Python')
+		self.page = Page.objects.create(category=self.category, title='Docs', url='http://docs.python.org/')
+
+	def test_flush_applies_deltas(self):
+		for i in range(3):
+			counters.record_page_view(self.page.id)
+		counters.record_category_view(self.category.id)
+		# nothing is written until the flush
+		self.assertEqual(Page.objects.get(id=self.page.id).views, 0)
+		self.assertFalse(os.path.exists(os.path.join(settings.BASE_DIR, 'counters', '{0}.journal'.format(os.getpid()))))
+
+		self.assertEqual(counters.flush(), {'page.views': 3, 'category.views': 1})
+		self.assertEqual(Page.objects.get(id=self.page.id).views, 3)
+		category = Category.objects.get(id=self.category.id)
+		self.assertEqual((category.views, category.page_views), (1, 3))
+		self.assertEqual(category.get_top_page_ids(), [self.page.id])
+		# and the journal is gone
+		self.assertEqual(counters.flush(), {})
+
+	def test_stale_save_keeps_counts(self):
+		category = Category.objects.get(id=self.category.id)
+		page = Page.objects.get(id=self.page.id)
+		counters.record_category_view(self.category.id)
+		counters.record_page_view(self.page.id)
+		counters.flush()
+
+		# instances loaded before the flush are saved with other changes
+		category.name = 'Python 3'
+		category.save()
+		page.title = 'Python Docs'
+		page.save()
+		self.assertEqual(Category.objects.get(id=self.category.id).views, 1)
+		self.assertEqual(Page.objects.get(id=self.page.id).views, 1)
+		self.assertIsNotNone(Page.objects.get(id=self.page.id).trending)
+
+		# but counts that were changed on purpose are saved
+		category.likes = 10
+		category.save()
+		self.assertEqual(Category.objects.get(id=self.category.id).likes, 10)
+
+	def test_flush_across_many_categories(self):
+		pages = [self.page]
+		for i in range(4):
+			category = Category.objects.create(name='Category {0}'.format(i))
+			pages.append(Page.objects.create(category=category, title='Page', url='http://example.com/{0}/'.format(i)))
+		versions = dict(Category.objects.values_list('id', 'version'))
+		for page in pages:
+			counters.record_page_view(page.id)
+		# the categories are touched and purged a chunk of ids at a time
+		with mock.patch.object(counters, 'UPDATE_CHUNK_SIZE', 2), CaptureQueriesContext(connection) as queries:
+			counters.flush()
+		touches = [query for query in queries.captured_queries
+				   if query['sql'].startswith('UPDATE "rango_category" SET "version"')]
+		self.assertEqual(len(touches), 3)
+		for category_id, version in Category.objects.values_list('id', 'version'):
+			self.assertGreater(version, versions[category_id])
+
+	def test_views_count_visits(self):
+		self.client.get('/rango/category/python/')
+		# a cached copy of the page still counts
+		response = self.client.get('/rango/category/python/')
+		self.assertEqual(response['X-Cache'], 'HIT')
+		self.client.get('/rango/goto/?page_id={0}'.format(self.page.id))
+		totals = counters.flush()
+		self.assertEqual(totals['category.views'], 2)
+		self.assertEqual(totals['page.views'], 1)
+		self.assertEqual(Category.objects.get(id=self.category.id).views, 2)
+
+
+@override_settings(SESSION_ENGINE='rango.sessions', RANGO_SESSION_WRITE_BEHIND_INTERVAL=None)
+class HybridSessionTests(RangoTestCase):
+
+	def setUp(self):
+		super(HybridSessionTests, self).setUp()
+		User.objects.create_user('alice', password='alice-password')
+
+	def test_anonymous_session_is_a_signed_cookie(self):
+		self.client.get('/rango/')
+		self.assertTrue(sessions.is_signed(self.client.cookies[settings.SESSION_COOKIE_NAME].value))
+		self.assertEqual(Session.objects.count(), 0)
+
+	def test_signed_in_session_is_written_behind(self):
+		self.client.login(username='alice', password='alice-password')
+		session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+		self.assertFalse(sessions.is_signed(session_key))
+		# the first save is written straight through
+		self.assertTrue(Session.objects.filter(session_key=session_key).exists())
+
+		session = sessions.SessionStore(session_key)
+		session['colour'] = 'green'
+		session.save()
+		self.assertNotIn('colour', Session.objects.get(session_key=session_key).get_decoded())
+		# but other requests see the change straight away
+		self.assertEqual(sessions.SessionStore(session_key)['colour'], 'green')
+		sessions.write_behind.flush()
+		self.assertEqual(Session.objects.get(session_key=session_key).get_decoded()['colour'], 'green')
+
+		self.client.logout()
+		sessions.write_behind.flush()
+		self.assertFalse(Session.objects.filter(session_key=session_key).exists())
+
+
+class ApiTests(RangoTestCase):
+
+	def setUp(self):
+		super(ApiTests, self).setUp()
+		self.busy = Category.objects.create(name='Busy')
+		Page.objects.bulk_create([Page(category=self.busy, title='Busy {0}'.format(i),
+									   url='http://busy.example.com/{0}'.format(i), views=100 - i)
+								  for i in range(15)])
+		self.quiet = Category.objects.create(name='Quiet')
+		Page.objects.create(category=self.quiet, title='Quiet', url='http://quiet.example.com/', views=85)
+		stats.rebuild()
+
+	def top_titles(self, limit):
+		response = self.client.get('/rango/api/pages/top/', {'limit': limit, 'fields': 'title,views'})
+		self.assertEqual(response.status_code, 200)
+		return [page['title'] for page in json.loads(response.content.decode())['pages']]
+
+	def test_top_pages(self):
+		self.assertEqual(self.top_titles(3), ['Busy 0', 'Busy 1', 'Busy 2'])
+		# the 11th and 12th pages of the busy category aren't in its
+		# top_page_ids, but are still among the 12 most viewed
+		self.assertEqual(self.top_titles(12), ['Busy {0}'.format(i) for i in range(12)])
+		self.assertEqual(self.top_titles(16)[-1], 'Quiet')
+
+	def test_top_pages_read_the_views_index(self):
+		with CaptureQueriesContext(connection) as queries:
+			self.top_titles(5)
+		self.assertFalse([query for query in queries.captured_queries if 'FROM "rango_category"' in query['sql']])
+
+	def test_not_modified(self):
+		url = '/rango/api/categories/busy/pages/'
+		response = self.client.get(url)
+		self.assertEqual(response.status_code, 200)
+		etag = response['ETag']
+
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+		self.assertFalse([query for query in queries.captured_queries if 'rango_page' in query['sql']])
+
+		# a new page changes the category's version, and so the ETag
+		Page.objects.create(category=self.busy, title='New', url='http://busy.example.com/new')
+		response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertNotEqual(response['ETag'], etag)
+
+	def test_unknown_field(self):
+		response = self.client.get('/rango/api/categories/', {'fields': 'id,secret'})
+		self.assertEqual(response.status_code, 400)
+
+
+class RelatedTests(RangoTestCase):
+
+	def setUp(self):
+		super(RelatedTests, self).setUp()
+		self.ids = [Category.objects.create(name=name).id for name in ('Python', 'Django', 'Flask', 'Rust')]
+
+	def visit(self, *visits):
+		# visits are (visitor, index into self.ids)
+		related.apply_visits(dict(('{0}:{1}'.format(token, self.ids[i]), 1) for token, i in visits))
+
+	def covisits(self):
+		return dict(((self.ids.index(category_id), self.ids.index(related_id)), visitors) for category_id, related_id, visitors
+					in CategoryCoVisit.objects.values_list('category_id', 'related_id', 'visitors'))
+
+	def related_ids(self, i):
+		return Category.objects.get(id=self.ids[i]).get_related_category_ids()
+
+	def test_new_and_repeat_visits(self):
+		self.visit(('a' * 32, 0), ('a' * 32, 1), ('b' * 32, 0), ('b' * 32, 1), ('b' * 32, 2))
+		self.assertEqual(self.covisits(), {(0, 1): 2, (1, 0): 2, (0, 2): 1, (2, 0): 1, (1, 2): 1, (2, 1): 1})
+		self.assertEqual(self.related_ids(0), [self.ids[1], self.ids[2]])
+
+		# coming back to a category changes nothing, a new one is paired
+		# with everything the visitor has seen before
+		self.visit(('a' * 32, 0), ('a' * 32, 2))
+		self.assertEqual(CategoryVisit.objects.count(), 6)
+		self.assertEqual(self.covisits(), {(0, 1): 2, (1, 0): 2, (0, 2): 2, (2, 0): 2, (1, 2): 2, (2, 1): 2})
+
+	def test_long_histories_are_left_out(self):
+		with mock.patch.object(related, 'MAX_HISTORY', 2):
+			self.visit(('a' * 32, 0), ('a' * 32, 1), ('a' * 32, 2))
+		self.assertEqual(CategoryVisit.objects.count(), 3)
+		self.assertEqual(self.covisits(), {})
+		self.assertEqual(self.related_ids(0), [])
+
+	def test_prune(self):
+		self.visit(('a' * 32, 0), ('a' * 32, 1), ('a' * 32, 2), ('b' * 32, 0), ('b' * 32, 2))
+		self.assertEqual(related.prune(1), 3)
+		# each category keeps its closest neighbour
+		self.assertEqual(self.covisits(), {(0, 2): 2, (1, 0): 1, (2, 0): 2})
+		self.assertEqual(related.prune(1), 0)
+
+	def seed(self):
+		visits = [('a' * 32, 0), ('a' * 32, 1), ('a' * 32, 2), ('b' * 32, 0), ('b' * 32, 2),
+				  ('c' * 32, 1), ('c' * 32, 3), ('d' * 32, 3), ('d' * 32, 0)]
+		self.visit(*visits)
+		return self.covisits()
+
+	def test_rebuild_matches_incremental(self):
+		incremental = self.seed()
+		with mock.patch.object(related, 'numpy', None):
+			self.assertEqual(related.rebuild(), 9)
+		self.assertEqual(self.covisits(), incremental)
+		self.assertEqual(self.related_ids(0), [self.ids[2], self.ids[1], self.ids[3]])
+
+	@skipIf(related.numpy is None, "NumPy and SciPy aren't installed")
+	def test_rebuild_with_numpy(self):
+		incremental = self.seed()
+		self.assertEqual(related.rebuild(), 9)
+		self.assertEqual(self.covisits(), incremental)
+		self.assertEqual(self.related_ids(0), [self.ids[2], self.ids[1], self.ids[3]])
+
+		visitors, categories = related._visits()
+		self.assertEqual(list(related._neighbours_numpy(visitors, categories, 2)),
+						 sorted(related._neighbours_python(visitors, categories, 2)))
+
+
+class AdminSearchTests(RangoTestCase):
+
+	def test_search_more_ids_than_parameters(self):
+		category = Category.objects.create(name='Python')
+		Page.objects.bulk_create([Page(category=category, title='Tutorial {0}'.format(i),
+									   url='http://example.com/{0}'.format(i)) for i in range(1200)])
+		Page.objects.create(category=category, title='Reference', url='http://example.com/reference')
+		User.objects.create_superuser('admin', 'admin@example.com', 'admin-password')
+		self.client.login(username='admin', password='admin-password')
+
+		response = self.client.get('/admin/rango/page/', {'q': 'tutor'})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.context['cl'].result_count, 1200)
+		self.assertEqual(search.filter_matching(Page.objects.all(), 'tutor', limit=1000).count(), 1000)
+
+
+class EstimatedCountTests(RangoTestCase):
+
+	def setUp(self):
+		super(EstimatedCountTests, self).setUp()
+		patcher = mock.patch('rango.admin.EXACT_COUNT_LIMIT', 10)
+		patcher.start()
+		self.addCleanup(patcher.stop)
+		Category.objects.bulk_create([Category(name='Category {0}'.format(i), slug='category-{0}'.format(i))
+									  for i in range(20)])
+		# the largest id is left, so the estimate is still 20
+		ids = list(Category.objects.order_by('id').values_list('id', flat=True))
+		Category.objects.filter(id__in=ids[9:19]).delete()
+
+	def paginator(self):
+		return EstimatedCountPaginator(Category.objects.order_by('id'), 5)
+
+	def test_pages_past_the_last_row(self):
+		paginator = self.paginator()
+		self.assertEqual((paginator.count, paginator.num_pages), (20, 4))
+		self.assertEqual(len(paginator.page(2).object_list), 5)
+		# page 4 of the estimate has no rows, so the real last page is shown
+		page = paginator.page(4)
+		self.assertEqual((page.number, len(page.object_list)), (2, 5))
+		self.assertEqual((paginator.count, paginator.num_pages), (10, 2))
+
+	def test_page_past_the_estimate(self):
+		self.assertEqual(self.paginator().page(100).number, 2)
+		with self.assertRaises(EmptyPage):
+			self.paginator().page(0)
+
+	def test_changelist(self):
+		User.objects.create_superuser('admin', 'admin@example.com', 'admin-password')
+		self.client.login(username='admin', password='admin-password')
+		with mock.patch.object(CategoryAdmin, 'list_per_page', 5):
+			response = self.client.get('/admin/rango/category/', {'p': 3})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.context['cl'].result_list), 5)
+
+
+class PictureTests(RangoTestCase):
+
+	def setUp(self):
+		super(PictureTests, self).setUp()
+		media = tempfile.mkdtemp(prefix='rango-media-')
+		self.addCleanup(shutil.rmtree, media, True)
+		overridden = override_settings(MEDIA_ROOT=media, RANGO_PICTURE_WORKERS=0)
+		overridden.enable()
+		self.addCleanup(overridden.disable)
+
+	def register(self, picture):
+		return self.client.post('/rango/register/', {'username': 'alice', 'email': 'alice@example.com',
+													 'password': 'alice-password', 'picture': picture})
+
+	def test_picture_named_after_its_format(self):
+		buffer = BytesIO()
+		Image.new('RGB', (10, 10), 'red').save(buffer, 'PNG')
+		self.register(SimpleUploadedFile('page.html', buffer.getvalue(), content_type='text/html'))
+		profile = UserProfile.objects.get(user__username='alice')
+		self.assertTrue(profile.picture.name.endswith('.png'))
+		self.assertEqual(profile.picture.name, 'profile_images/{0}.png'.format(profile.picture_hash))
+
+	def test_not_an_image(self):
+		response = self.register(SimpleUploadedFile('avatar.jpg', b'<script>alert(1)</script>', content_type='image/jpeg'))
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response.context['profile_form'].errors['picture'])
+		# nothing is saved
+		self.assertFalse(User.objects.filter(username='alice').exists())
+		self.assertFalse(os.listdir(settings.MEDIA_ROOT))
+
+
+class ImportTests(RangoTestCase):
+
+	def records(self, views):
+		yield {'category': 'Python', 'views': views, 'likes': 1}
+		for i in range(400):
+			yield {'category': 'Python', 'title': 'Page {0}'.format(i), 'url': 'http://example.com/{0}'.format(i), 'views': views}
+
+	def test_import_updates_in_chunks(self):
+		import_records(self.records(1))
+		# a second import updates every row, in more than one UPDATE
+		importer = import_records(self.records(5))
+		self.assertEqual((importer.pages_created, importer.pages_updated), (0, 400))
+		self.assertEqual(set(Page.objects.values_list('views', flat=True)), {5})
+		category = Category.objects.get(name='Python')
+		self.assertEqual((category.views, category.page_count, category.page_views), (5, 400, 2000))
+
+	def test_same_slug_is_reported(self):
+		fd, path = tempfile.mkstemp(suffix='.jsonl')
+		self.addCleanup(os.remove, path)
+		with os.fdopen(fd, 'w') as f:
+			f.write('{"category": "C++"}\n{"category": "C"}\n')
+		with self.assertRaisesRegex(CommandError, "'C\\+\\+' and 'C'"):
+			call_command('import_rango', path, stdout=StringIO())
+		self.assertFalse(Category.objects.exists())
+
+
+class SearchTests(RangoTestCase):
+
+	def setUp(self):
+		super(SearchTests, self).setUp()
+		self.python = Category.objects.create(name='Python')
+		self.tutorial = Page.objects.create(category=self.python, title='Official Python Tutorial',
+											url='http://docs.python.org/tutorial/')
+		Page.objects.create(category=self.python, title='Reference', url='http://tutorial.example.com/')
+
+	def search(self, query):
+		response = self.client.get('/rango/api/search/', {'q': query})
+		self.assertEqual(response.status_code, 200)
+		return json.loads(response.content.decode())['results']
+
+	def test_title_ranks_above_url(self):
+		results = self.search('tutorial')
+		self.assertEqual([result['title'] for result in results], ['Official Python Tutorial', 'Reference'])
+
+	def test_prefix_and_categories(self):
+		results = self.search('pyth')
+		self.assertEqual(set((result['type'], result['id']) for result in results),
+						 {('category', self.python.id), ('page', self.tutorial.id)})
+
+	def test_index_follows_changes(self):
+		self.tutorial.title = 'Beginners Guide'
+		self.tutorial.save()
+		self.assertEqual([result['id'] for result in self.search('beginners')], [self.tutorial.id])
+		self.tutorial.delete()
+		self.assertEqual(self.search('beginners'), [])
+
+	def test_operators_are_not_parsed(self):
+		self.assertEqual(self.search('"tutorial OR'), self.search('tutorial or'))
+		self.assertEqual(self.search('!!!'), [])
+
+	def test_search_page(self):
+		response = self.client.get('/rango/search/', {'q': 'tutorial'})
+		self.assertContains(response, 'Official Python Tutorial')
+
+
+class VisitTests(RangoTestCase):
+
+	def totals(self):
+		counters.flush()
+		return DailyVisits.objects.values_list('visits', 'visitors').get(day=timezone.now().date())
+
+	def test_counts_once_per_interval(self):
+		self.client.get('/rango/')
+		self.client.get('/rango/about/')
+		self.assertEqual(self.client.session['visits'], 1)
+		self.assertEqual(self.totals(), (1, 1))
+
+		with override_settings(RANGO_VISIT_INTERVAL=0):
+			self.client.get('/rango/')
+		self.assertEqual(self.client.session['visits'], 2)
+		# a returning visitor, not a new one
+		self.assertEqual(self.totals(), (2, 1))
+
+	def test_repeat_visit_leaves_session_alone(self):
+		self.client.get('/rango/')
+		session_key = self.client.session.session_key
+		with CaptureQueriesContext(connection) as queries:
+			self.client.get('/rango/about/')
+		self.assertEqual(self.client.session.session_key, session_key)
+		self.assertFalse([query for query in queries if query['sql'].startswith(('UPDATE', 'INSERT'))])
+
+
+class PageCacheTests(RangoTestCase):
+
+	def setUp(self):
+		super(PageCacheTests, self).setUp()
+		# cached pages outlive the test database's rollbacks
+		cache.clear()
+		self.category = Category.objects.create(name='Python')
+		self.page = Page.objects.create(category=self.category, title='Docs', url='http://docs.python.org/')
+
+	def get(self):
+		return self.client.get('/rango/category/python/')
+
+	def test_hit_runs_no_view_queries(self):
+		self.assertEqual(self.get()['X-Cache'], 'MISS')
+		with CaptureQueriesContext(connection) as queries:
+			response = self.get()
+		self.assertEqual(response['X-Cache'], 'HIT')
+		self.assertContains(response, 'Docs')
+		self.assertFalse([query for query in queries if 'rango_' in query['sql']])
+
+	def test_purged_page_is_rendered_again(self):
+		self.get()
+		self.assertEqual(self.get()['X-Cache'], 'HIT')
+		self.page.title = 'Python Documentation'
+		self.page.save()
+		response = self.get()
+		self.assertEqual(response['X-Cache'], 'MISS')
+		self.assertContains(response, 'Python Documentation')
+		self.assertEqual(self.get()['X-Cache'], 'HIT')
+
+		page_cache.purge('category:python')
+		self.assertEqual(self.get()['X-Cache'], 'MISS')
+
+	def test_category_save_bumps_the_sidebar_once(self):
+		with mock.patch('rango.caching._incr') as incr:
+			self.category.name = 'Python 3'
+			self.category.save()
+		self.assertEqual([call[0][0] for call in incr.call_args_list].count(caching.CATEGORIES_VERSION_KEY), 1)
+
+	def test_signed_in_users_are_not_cached(self):
+		User.objects.create_user('leifos', password='secret')
+		self.client.login(username='leifos', password='secret')
+		self.get()
+		self.assertFalse(self.get().has_header('X-Cache'))
+
+
+@override_settings(RANGO_HASH_WORKERS=0, RANGO_LOGIN_ATTEMPTS=3, RANGO_LOGIN_ATTEMPT_INTERVAL=60)
+class LoginTests(RangoTestCase):
+
+	def setUp(self):
+		super(LoginTests, self).setUp()
+		User.objects.create_user('leifos', password='secret')
+		# the buckets are per process, so each test starts with full ones
+		for name in ('failed_by_username', 'failed_by_address'):
+			patcher = mock.patch.object(auth, name, TokenBuckets(auth.LOGIN_ATTEMPTS, auth.LOGIN_ATTEMPT_INTERVAL))
+			patcher.start()
+			self.addCleanup(patcher.stop)
+
+	def login(self, username='leifos', password='secret', address='127.0.0.1'):
+		return self.client.post('/rango/login/', {'username': username, 'password': password},
+								REMOTE_ADDR=address)
+
+	def test_login(self):
+		self.assertRedirects(self.login(), '/rango/', fetch_redirect_response=False)
+		self.assertIn('_auth_user_id', self.client.session)
+
+	def test_failures_are_limited(self):
+		for i in range(3):
+			self.assertContains(self.login(password='wrong'), 'Invalid login details')
+		response = self.login()
+		self.assertEqual(response.status_code, 429)
+		self.assertIn(int(response['Retry-After']), (60, 61))
+		# the username is locked out from every address
+		self.assertEqual(self.login(address='10.0.0.1').status_code, 429)
+		# but other users can still sign in
+		User.objects.create_user('david', password='secret')
+		self.assertEqual(self.login(username='david', address='10.0.0.1').status_code, 302)
+
+	def test_outdated_hash_is_upgraded(self):
+		user = User.objects.get(username='leifos')
+		# a hash made with far fewer iterations than the current default
+		user.password = PBKDF2PasswordHasher().encode('secret', 'salt', iterations=1000)
+		user.save()
+		self.assertEqual(self.login().status_code, 302)
+		self.assertFalse(PBKDF2PasswordHasher().must_update(User.objects.get(username='leifos').password))
+
+
+class ReplicaTests(RangoTestCase):
+
+	def setUp(self):
+		super(ReplicaTests, self).setUp()
+		self.factory = RequestFactory()
+		# a replica that isn't the test database, as in production
+		patcher = mock.patch('rango.replicas.replica_alias', return_value='replica')
+		patcher.start()
+		self.addCleanup(patcher.stop)
+
+	@staticmethod
+	@replicas.read_from_replica
+	def database(request):
+		return replicas.ReplicaRouter().db_for_read(Page)
+
+	def test_reads_use_the_replica(self):
+		self.assertEqual(self.database(self.factory.get('/')), 'replica')
+		# only while the view runs
+		self.assertIsNone(replicas.ReplicaRouter().db_for_read(Page))
+		self.assertIsNone(self.database(self.factory.post('/')))
+
+	def test_sticky_cookie_reads_the_primary(self):
+		request = self.factory.get('/')
+		request.COOKIES[replicas.STICKY_COOKIE] = '1'
+		self.assertIsNone(self.database(request))
+
+	def test_post_sets_sticky_cookie(self):
+		User.objects.create_user('leifos', password='secret')
+		self.client.login(username='leifos', password='secret')
+		self.assertNotIn(replicas.STICKY_COOKIE, self.client.get('/rango/add_category/').cookies)
+		response = self.client.post('/rango/add_category/', {'name': 'Python', 'views': 0, 'likes': 0})
+		self.assertEqual(response.status_code, 302)
+		cookie = response.cookies[replicas.STICKY_COOKIE]
+		self.assertEqual(cookie['max-age'], settings.RANGO_REPLICA_STICKY_SECONDS)
+
+
+class ReplicaAliasTests(TestCase):
+
+	def test_no_replica_under_test(self):
+		# the replica mirrors the test database, which it can't see into
+		self.assertIsNone(replicas.replica_alias())
+		self.assertEqual(replicas.ReplicaRouter().db_for_write(Page), 'default')
+
+
+class ExportTests(RangoTestCase):
+
+	def setUp(self):
+		super(ExportTests, self).setUp()
+		python = Category.objects.create(name='Python', views=128, likes=64)
+		Category.objects.create(name='Django')
+		for i in range(3):
+			Page.objects.create(category=python, title='Page {0}'.format(i),
+								url='http://example.com/{0}/'.format(i), views=i)
+		User.objects.create_user('leifos', password='secret', is_staff=True)
+
+	def download(self, **params):
+		self.client.login(username='leifos', password='secret')
+		response = self.client.get('/rango/export/', params)
+		self.assertEqual(response['Content-Type'], 'application/gzip')
+		return gzip.decompress(b''.join(response.streaming_content)).decode('utf-8')
+
+	def test_jsonl(self):
+		records = [json.loads(line) for line in self.download().splitlines()]
+		self.assertEqual(records[:2], [{'category': 'Python', 'views': 128, 'likes': 64},
+									   {'category': 'Django', 'views': 0, 'likes': 0}])
+		self.assertEqual(records[2:], [{'category': 'Python', 'title': 'Page {0}'.format(i),
+										'url': 'http://example.com/{0}/'.format(i), 'views': i}
+									   for i in range(3)])
+
+	def test_csv(self):
+		lines = self.download(format='csv').splitlines()
+		self.assertEqual(lines[0], ','.join(exporter.CSV_COLUMNS))
+		self.assertEqual(lines[1], 'Python,,,128,64')
+		self.assertEqual(lines[-1], 'Python,Page 2,http://example.com/2/,2,')
+
+	def test_chunks_and_round_trip(self):
+		data = b''.join(exporter.export(chunk_size=2))
+		records = [json.loads(line) for line in gzip.decompress(data).decode('utf-8').splitlines()]
+		self.assertEqual(len(records), 5)
+		# an export imports back into the same rows
+		import_records(records)
+		self.assertEqual(Page.objects.count(), 3)
+		self.assertEqual(Category.objects.get(name='Python').views, 128)
+
+	def test_staff_only(self):
+		User.objects.create_user('david', password='secret')
+		self.client.login(username='david', password='secret')
+		response = self.client.get('/rango/export/')
+		self.assertEqual(response.status_code, 302)
+		self.assertIn('/admin/login/', response['Location'])
+
+
+class TrendingTests(RangoTestCase):
+
+	def setUp(self):
+		super(TrendingTests, self).setUp()
+		cache.clear()
+		self.category = Category.objects.create(name='Python')
+		self.old = Page.objects.create(category=self.category, title='Old', url='http://example.com/old/')
+		self.new = Page.objects.create(category=self.category, title='New', url='http://example.com/new/')
+		self.start = time.time() - 3 * trending.HALF_LIFE
+
+	def test_recent_views_count_more(self):
+		trending.record({self.old.id: 10}, self.start)
+		trending.record({self.new.id: 5}, self.start + 2 * trending.HALF_LIFE)
+		now = self.start + 2 * trending.HALF_LIFE
+		# ten views two half lives ago are worth two and a half now
+		self.assertAlmostEqual(trending.score(Page.objects.get(id=self.old.id).trending, now), 2.5)
+		self.assertAlmostEqual(trending.score(Page.objects.get(id=self.new.id).trending, now), 5)
+
+		category = Category.objects.get(id=self.category.id)
+		self.assertEqual(category.get_trending_page_ids(), [self.new.id, self.old.id])
+		self.assertEqual(trending.top_pages(), [self.new, self.old])
+		self.assertEqual(trending.category_pages(category, limit=1), [self.new])
+
+	def test_rebuild_from_buckets(self):
+		trending.record({self.old.id: 10}, self.start)
+		trending.record({self.old.id: 10, self.new.id: 5}, self.start + trending.BUCKET_SECONDS)
+		scores = dict(Page.objects.values_list('id', 'trending'))
+		Page.objects.update(trending=None)
+
+		self.assertEqual(trending.rebuild(now=self.start + trending.BUCKET_SECONDS), 2)
+		for page_id, trending_score in Page.objects.values_list('id', 'trending'):
+			# within the half hour the buckets are rounded to
+			self.assertAlmostEqual(trending_score, scores[page_id], delta=0.5 * trending.BUCKET_SECONDS / trending.HALF_LIFE)
+		self.assertEqual(Category.objects.get(id=self.category.id).get_trending_page_ids(), [self.old.id, self.new.id])
+
+		# buckets older than the window are dropped, with their scores
+		with override_settings(RANGO_TRENDING_WINDOW=trending.BUCKET_SECONDS):
+			self.assertEqual(trending.rebuild(now=self.start + 3 * trending.BUCKET_SECONDS), 0)
+		self.assertFalse(PageViewBucket.objects.exists())
+		self.assertEqual(trending.top_pages(), [])
+
+	def test_flush_records_views(self):
+		counters.record_page_view(self.new.id)
+		counters.flush()
+		self.assertIsNotNone(Page.objects.get(id=self.new.id).trending)
+		self.assertEqual(trending.top_pages(), [self.new])
+
+
+class BulkTests(RangoTestCase):
+
+	def setUp(self):
+		super(BulkTests, self).setUp()
+		self.category = Category.objects.create(name='Python')
+		User.objects.create_user('leifos', password='secret')
+		self.client.login(username='leifos', password='secret')
+
+	def post_json(self, path, rows):
+		response = self.client.post(path, json.dumps(rows), content_type='application/json')
+		return response, json.loads(response.content.decode())
+
+	def test_text_box(self):
+		text = 'Official Python Tutorial http://docs.python.org/tutorial/\n\nhttp://www.python.org/\n'
+		response = self.client.post('/rango/category/python/add_pages/', {'pages': text})
+		self.assertRedirects(response, '/rango/category/python/', fetch_redirect_response=False)
+		self.assertEqual(sorted(Page.objects.values_list('title', flat=True)),
+						 ['Official Python Tutorial', 'http://www.python.org/'])
+		category = Category.objects.get(id=self.category.id)
+		self.assertEqual(category.page_count, 2)
+		self.assertEqual(sorted(category.get_top_page_ids()), sorted(Page.objects.values_list('id', flat=True)))
+
+	def test_json_rows_in_one_insert(self):
+		rows = [{'title': 'Page {0}'.format(i), 'url': 'http://example.com/{0}/'.format(i)} for i in range(100)]
+		with CaptureQueriesContext(connection) as queries:
+			response, result = self.post_json('/rango/category/python/add_pages/', rows)
+		self.assertEqual(response.status_code, 201)
+		self.assertEqual(result, {'added': 100, 'errors': []})
+		self.assertEqual(len([query for query in queries if query['sql'].startswith('INSERT INTO "rango_page"')]), 1)
+		self.assertEqual(Category.objects.get(id=self.category.id).page_count, 100)
+		self.assertEqual(Link.objects.count(), 100)
+
+	def test_invalid_row_adds_nothing(self):
+		rows = [{'title': 'Good', 'url': 'http://example.com/'}, {'title': 'Bad', 'url': 'not a url'}, 'page']
+		response, result = self.post_json('/rango/category/python/add_pages/', rows)
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual([error['row'] for error in result['errors']], [1, 2])
+		self.assertIn('url', result['errors'][0]['errors'])
+		self.assertFalse(Page.objects.exists())
+
+		# the text box shows the errors by line number
+		response = self.client.post('/rango/category/python/add_pages/', {'pages': 'Good http://example.com/\nBad !'})
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.context['errors'][0][0], 2)
+		self.assertFalse(Page.objects.exists())
+
+	@override_settings(RANGO_BULK_MAX_ROWS=2)
+	def test_too_many_rows(self):
+		rows = [{'title': 'Page', 'url': 'http://example.com/{0}/'.format(i)} for i in range(3)]
+		response, result = self.post_json('/rango/category/python/add_pages/', rows)
+		self.assertEqual(response.status_code, 400)
+		self.assertFalse(Page.objects.exists())
+
+	def test_categories(self):
+		response = self.client.post('/rango/add_categories/', {'categories': 'Django\nFlask\n'})
+		self.assertRedirects(response, '/rango/', fetch_redirect_response=False)
+		self.assertEqual(Category.objects.get(name='Flask').slug, 'flask')
+
+		# names whose slugs are taken, by a category or an earlier row
+		response, result = self.post_json('/rango/add_categories/',
+										  [{'name': 'Pyramid'}, {'name': 'python'}, {'name': 'Bottle'}, {'name': 'bottle'}])
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual([error['row'] for error in result['errors']], [1, 3])
+		self.assertFalse(Category.objects.filter(name='Pyramid').exists())
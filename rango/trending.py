@@ -0,0 +1,160 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, FloatField, IntegerField, Value, When
+from rango import counters
+from rango.caching import CATEGORY_STATS_VERSION_KEY, bump_category_stats_version, get_versions
+from rango.models import Category, Page, PageViewBucket
+
+# what's being viewed lately, rather than what has been viewed most ever
+#
+# every flush of the page view counters (see rango/stats.py) adds the
+# flushed views to two places:
+#   - PageViewBucket, the views each page got in each hour, kept for
+#     RANGO_TRENDING_WINDOW seconds so the scores can be rebuilt
+#   - Page.trending, a score in which every view counts half as much after
+#     RANGO_TRENDING_HALF_LIFE seconds, and half as much again after another
+#
+# decaying every score as time passes would mean rewriting every row, so
+# instead a view at time t is worth 2 ** (t / half life) - the further in
+# the future, the more - which ranks pages exactly as the decayed scores
+# would, without ever changing a score that isn't getting views. Those
+# numbers get enormous, so Page.trending holds their log2, and adding a
+# view is log2(2 ** trending + 2 ** (log2(views) + t / half life))
+#
+# each category keeps the ids of its TOP_PAGES most trending pages in
+# Category.trending_page_ids, updated at every flush for the categories
+# that got views (the order of the rest can't have changed). The site-wide
+# list is read from the index on Page.trending and cached until the next
+# flush - either way the index page costs a query for at most TOP_PAGES rows,
+# however many pages there are
+#
+# python manage.py rebuild_trending prunes old buckets and recomputes every
+# score from the buckets that are left, e.g. after changing the half life
+
+# how many page ids are kept in Category.trending_page_ids
+TOP_PAGES = 10
+
+BUCKET_SECONDS = 60 * 60
+HALF_LIFE = 24 * 60 * 60
+WINDOW = 14 * 24 * 60 * 60
+
+TRENDING_KEY = 'rango:trending:{0}:{1}'
+
+
+def half_life():
+	return getattr(settings, 'RANGO_TRENDING_HALF_LIFE', HALF_LIFE)
+
+def bucket_of(timestamp):
+	return int(timestamp // BUCKET_SECONDS)
+
+def _log_add(a, b):
+	# log2(2 ** a + 2 ** b), without working out either power
+	if a is None:
+		return b
+	high, low = max(a, b), min(a, b)
+	return high + math.log2(1 + 2 ** (low - high))
+
+def add_views(trending, views, timestamp):
+	# the new Page.trending after views more views at timestamp
+	if views <= 0:
+		return trending
+	return _log_add(trending, math.log2(views) + timestamp / half_life())
+
+def score(trending, timestamp=None):
+	# the decayed score itself - the page's views, each counted half as much
+	# for every half life since it happened
+	if trending is None:
+		return 0.0
+	if timestamp is None:
+		timestamp = time.time()
+	return 2 ** (trending - timestamp / half_life())
+
+def _save_buckets(bucket, deltas):
+	existing = set(PageViewBucket.objects.filter(bucket=bucket, page_id__in=deltas).values_list('page_id', flat=True))
+	PageViewBucket.objects.bulk_create([PageViewBucket(page_id=page_id, bucket=bucket)
+										for page_id in deltas if page_id not in existing])
+	items = list(deltas.items())
+	for start in range(0, len(items), counters.UPDATE_CHUNK_SIZE):
+		chunk = items[start:start + counters.UPDATE_CHUNK_SIZE]
+		PageViewBucket.objects.filter(bucket=bucket, page_id__in=[page_id for page_id, views in chunk]).update(
+			views=F('views') + Case(*[When(page_id=page_id, then=Value(views)) for page_id, views in chunk],
+									default=Value(0), output_field=IntegerField()))
+
+def _save_scores(scores):
+	# scores maps page id -> new Page.trending
+	items = list(scores.items())
+	for start in range(0, len(items), counters.UPDATE_CHUNK_SIZE):
+		chunk = items[start:start + counters.UPDATE_CHUNK_SIZE]
+		Page.objects.filter(id__in=[page_id for page_id, trending in chunk]).update(
+			trending=Case(*[When(id=page_id, then=Value(trending)) for page_id, trending in chunk],
+						  output_field=FloatField()))
+
+def refresh_categories(category_ids):
+	# one indexed query per category, reading at most TOP_PAGES rows
+	for category_id in set(category_ids):
+		page_ids = (Page.objects.filter(category_id=category_id, trending__isnull=False)
+					.order_by('-trending')
+					.values_list('id', flat=True)[:TOP_PAGES])
+		Category.objects.filter(id=category_id).update(
+			trending_page_ids=','.join(str(page_id) for page_id in page_ids), version=F('version') + 1)
+	bump_category_stats_version()
+
+def record(deltas, timestamp=None):
+	# adds views (page id -> views) to the buckets and scores, and returns
+	# the ids of the categories whose trending pages may have changed
+	if timestamp is None:
+		timestamp = time.time()
+	deltas = dict((page_id, views) for page_id, views in deltas.items() if views > 0)
+	if not deltas:
+		return set()
+	_save_buckets(bucket_of(timestamp), deltas)
+
+	scores, category_ids = {}, set()
+	page_ids = list(deltas)
+	for start in range(0, len(page_ids), counters.UPDATE_CHUNK_SIZE):
+		chunk = page_ids[start:start + counters.UPDATE_CHUNK_SIZE]
+		for page_id, category_id, trending in Page.objects.filter(id__in=chunk).values_list('id', 'category_id', 'trending'):
+			scores[page_id] = add_views(trending, deltas[page_id], timestamp)
+			category_ids.add(category_id)
+	_save_scores(scores)
+	refresh_categories(category_ids)
+	return category_ids
+
+def rebuild(now=None):
+	# drops buckets older than the window and recomputes every score from
+	# the rest, returning the number of pages with a score
+	if now is None:
+		now = time.time()
+	window = getattr(settings, 'RANGO_TRENDING_WINDOW', WINDOW)
+	PageViewBucket.objects.filter(bucket__lt=bucket_of(now - window)).delete()
+
+	scores = {}
+	for page_id, bucket, views in PageViewBucket.objects.order_by('page_id', 'bucket').values_list('page_id', 'bucket', 'views').iterator():
+		# a bucket's views are counted as of the middle of the hour
+		scores[page_id] = add_views(scores.get(page_id), views, (bucket + 0.5) * BUCKET_SECONDS)
+	with transaction.atomic():
+		Page.objects.exclude(trending=None).update(trending=None)
+		_save_scores(scores)
+		refresh_categories(Category.objects.values_list('id', flat=True))
+	return len(scores)
+
+def top_pages(limit=5):
+	# the most trending pages on the site, most trending first
+	key = TRENDING_KEY.format(get_versions(CATEGORY_STATS_VERSION_KEY)[0], limit)
+	page_ids = cache.get(key)
+	if page_ids is None:
+		page_ids = list(Page.objects.filter(trending__isnull=False)
+						.order_by('-trending').values_list('id', flat=True)[:limit])
+		cache.set(key, page_ids)
+	pages = Page.objects.in_bulk(page_ids)
+	return [pages[page_id] for page_id in page_ids if page_id in pages]
+
+def category_pages(category, limit=5):
+	# a category's most trending pages, from Category.trending_page_ids
+	page_ids = category.get_trending_page_ids()[:limit]
+	pages = Page.objects.in_bulk(page_ids)
+	return [pages[page_id] for page_id in page_ids if page_id in pages]
@@ -1,5 +1,5 @@
 from django.conf.urls import url
-from rango import views
+from rango import api, views
 
 # look for any sequence of alphanumeric characters after rango/category/.../
 # (\w) or hyphens (\-), matching as many as we like ([ ]+)
@@ -11,10 +11,21 @@ urlpatterns = [
 	url(r'^$', views.index, name='index'),
 	url(r'^about/$', views.about, name='about'),
 	url(r'add_category/$', views.add_category, name='add_category'),
+	url(r'^add_categories/$', views.add_categories, name='add_categories'),
 	url(r'^category/(?P<category_name_slug>[\w\-]+)/$', views.show_category, name='show_category'),
 	url(r'^category/(?P<category_name_slug>[\w\-]+)/add_page/$', views.add_page, name='add_page'),
+	url(r'^category/(?P<category_name_slug>[\w\-]+)/add_pages/$', views.add_pages, name='add_pages'),
+	url(r'^category/(?P<category_name_slug>[\w\-]+)/pages/$', views.show_category_pages, name='show_category_pages'),
 	url(r'^register/$', views.register, name='register'),
 	url(r'^login/$', views.user_login, name='login'),
 	url(r'^restricted/$', views.restricted, name='restricted'),
 	url(r'^logout/$', views.user_logout, name='logout'),
+	url(r'^goto/$', views.goto_url, name='goto'),
+	url(r'^search/$', views.search, name='search'),
+	url(r'^api/search/$', views.search_api, name='search_api'),
+	url(r'^api/categories/$', api.categories, name='api_categories'),
+	url(r'^api/categories/(?P<category_name_slug>[\w\-]+)/pages/$', api.category_pages, name='api_category_pages'),
+	url(r'^api/pages/top/$', api.top_pages, name='api_top_pages'),
+	url(r'^export/$', views.export_data, name='export_data'),
+	url(r'^_stats/$', views.instrumentation_stats, name='instrumentation_stats'),
 ]
\ No newline at end of file
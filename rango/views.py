@@ -1,13 +1,40 @@
+import json
+
 from rango.models import Page
 from django.contrib.auth import authenticate, login, logout
 from django.core.urlresolvers import reverse
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.shortcuts import render
-from django.http import HttpResponseRedirect, HttpResponse
+from django.template.loader import render_to_string
+from django.http import HttpResponseRedirect, HttpResponse, JsonResponse, StreamingHttpResponse
 from rango.models import Category
 from rango.forms import CategoryForm, PageForm, UserForm, UserProfileForm
-from datetime import datetime
-
+from rango.counters import record_category_view, record_page_view
+from rango.stats import top_pages
+from rango.category_index import get_category
+from rango.replicas import read_from_replica, replica_alias, sticks_to_primary
+from rango.pagination import category_pages, parse_cursor, parse_size
+from rango.search import search as run_search
+from rango.visits import track_visit
+from rango.page_cache import anonymous_page_cache, category_scope
+from rango.instrumentation import report
+from rango import bulk, exporter, pictures, related, trending
+from rango.auth import HashingBusy, hash_password, login_failed, login_wait
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from rango.caching import CATEGORIES_VERSION_KEY, CATEGORY_STATS_VERSION_KEY, get_versions
+
+# index, about and show_category look the same to every anonymous visitor,
+# so their responses are cached (see rango/page_cache.py) - the visit is
+# still counted when a cached page is served
+# views that only read use the read-only replica, and views that write
+# send the visitor's next few reads to the primary (see rango/replicas.py)
+
+@anonymous_page_cache('index', on_hit=track_visit)
+@read_from_replica
 def index(request):
 
 	# query the database for a list of ALL categories currently stored
@@ -15,59 +42,84 @@ def index(request):
 	# retrieve only the top 5 or all if <5
 	# place the list in context_dict
 	# context_dict will be passed to the template engine
-	request.session.set_test_cookie()
 	category_list = Category.objects.order_by('-likes')[:5]
-	page_list = Page.objects.order_by('-views')[:5]
-	context_dict = {'categories': category_list, 'pages': page_list}
-
-	# call the helper function to handle the cookies
-	visitor_cookie_handler(request)
-	context_dict['visits'] = request.session['visits']
+	# the pages being viewed most lately (see rango/trending.py) - until any
+	# views have been counted, the most viewed pages ever, read off the
+	# index on Page.views rather than by sorting the whole page table
+	# both lists are only fetched if the template's cached copy of them is
+	# out of date, which the versions tell it
+	page_list = SimpleLazyObject(lambda: trending.top_pages(5) or top_pages(5))
+	context_dict = {'categories': category_list, 'pages': page_list,
+					'versions': get_versions(CATEGORIES_VERSION_KEY, CATEGORY_STATS_VERSION_KEY)}
+
+	# count the visit - this only touches the session when the count changes
+	context_dict['visits'] = track_visit(request)
 
 	# obtain response object early so we can add cookie information
 	response = render(request, 'rango/index.html', context=context_dict)
 	# return the response back to the user, updating any cookies that need changed
 	return response
 
+@anonymous_page_cache('about', on_hit=track_visit)
+@read_from_replica
 def about(request):
-	if request.session.test_cookie_worked():
-		print("TEST COOKIE WORKED!")
-		request.session.delete_test_cookie()
-
 	context_dict = {}
 	# prints out whether the method is a GET or POST
 	print(request.method)
 	# prints out the user name, if no one is logged in it prints 'AnonymousUser'
 	print(request.user)
 
-	visitor_cookie_handler(request)
-	context_dict['visits'] = request.session['visits']
+	context_dict['visits'] = track_visit(request)
 
 	response = render(request, 'rango/about.html', context=context_dict)
 	return response
 
+def count_category_visit(request, category):
+	# the category's view count, and the visit for related categories
+	record_category_view(category.id)
+	related.record_visit(request, category.id)
+
+def category_visited(request, category_name_slug):
+	# on_hit for show_category's cached pages
+	category = get_category(category_name_slug)
+	if category is not None:
+		count_category_visit(request, category)
+
+@anonymous_page_cache(category_scope, on_hit=category_visited)
+@read_from_replica
 def show_category(request, category_name_slug):
 	# create a context dictionary which we can pass
 	# to the template rendering engine
 	context_dict = {}
 
-	try:
-		# can we find a category name slug with the given name?
-		# if we can't, the .get() method raises a DoesNotExist exception
-		# so the .get() ,ethod returns one model instance or raises an exception
-		category = Category.objects.get(slug=category_name_slug)
-
-		# retrieve all the associated pages
-		# note that filter() will return a list of page objects or an empty list
-		pages = Page.objects.filter(category=category)
+	# can we find a category name slug with the given name?
+	# categories are looked up in rango/category_index.py, which returns
+	# None if there is no such category (without asking the database)
+	category = get_category(category_name_slug)
+	if category is not None:
+		# retrieve one batch of pages, most viewed first
+		# ?after= carries on from where the previous batch finished
+		# note that this will return a list of page objects or an empty list
+		after_cursor = parse_cursor(request.GET.get('after'))
+		pages, next_cursor = category_pages(category, after=after_cursor,
+											size=parse_size(request.GET.get('size')))
 
 		# adds our results list to the template context under name pages
 		context_dict['pages'] = pages
+		context_dict['next_cursor'] = next_cursor
+		# and the category's pages being viewed most lately, if there are any
+		if after_cursor is None:
+			context_dict['trending_pages'] = trending.category_pages(category)
+		# and the categories its visitors look at most, worked out ahead of
+		# time (see rango/related.py)
+		context_dict['related_categories'] = related.related_categories(category)
+		# and count this visit to the category
+		count_category_visit(request, category)
 		# we also add the category object from 
 		# the database to the context dictionary
 		# we'll use this in the template to verify that the category exists
 		context_dict['category'] = category
-	except Category.DoesNotExist:
+	else:
 		# don't do anything - template will display the no category message for us
 		context_dict['category'] = None
 		context_dict['pages'] = None
@@ -75,7 +127,26 @@ def show_category(request, category_name_slug):
 	# go render the response and return it to the client
 	return render(request, 'rango/category.html', context_dict)
 
+@read_from_replica
+def show_category_pages(request, category_name_slug):
+	# the next batch of a category's pages as JSON, used by category.html
+	# to load more pages without reloading the whole category
+	category = get_category(category_name_slug)
+	if category is None:
+		return JsonResponse({'error': 'The specified category does not exist!'}, status=404)
+
+	pages, next_cursor = category_pages(category,
+										after=parse_cursor(request.GET.get('after')),
+										size=parse_size(request.GET.get('size')))
+	return JsonResponse({
+		'pages': [{'id': page.id, 'title': page.title, 'url': page.url, 'views': page.views}
+				  for page in pages],
+		'next': next_cursor,
+		'html': render_to_string('rango/page_list.html', {'pages': pages}, request=request),
+	})
+
 @login_required
+@sticks_to_primary
 def add_category(request):
 	form = CategoryForm()
 
@@ -91,7 +162,8 @@ def add_category(request):
 			# we could give a confirmation message
 			# but since the most recent category added is on the index page
 			# then we can direct the user back to the index page
-			return index(request)
+			# (redirecting, so reloading the page doesn't post the form again)
+			return HttpResponseRedirect(reverse('index'))
 		else:
 			# the supplied form contains errors -
 			# just print them to the terminal
@@ -102,11 +174,9 @@ def add_category(request):
 	return render(request, 'rango/add_category.html', {'form': form})
 
 @login_required
+@sticks_to_primary
 def add_page(request, category_name_slug):
-	try:
-		category = Category.objects.get(slug=category_name_slug)
-	except Category.DoesNotExist:
-		category = None
+	category = get_category(category_name_slug)
 
 	form = PageForm()
 	if request.method == 'POST':
@@ -117,8 +187,11 @@ def add_page(request, category_name_slug):
 				page = form.save(commit=False)
 				page.category = category
 				page.views = 0
-				page.save()
-			return show_category(request, category_name_slug)
+				# the page, its link and the category's aggregates in one transaction
+				with transaction.atomic():
+					page.save()
+				# redirecting, so reloading the page doesn't add the page again
+				return HttpResponseRedirect(reverse('show_category', args=[category_name_slug]))
 		else:
 			# the supplied form contains errors -
 			# just print them to the terminal
@@ -127,6 +200,64 @@ def add_page(request, category_name_slug):
 	context_dict = {'form':form, 'category': category}
 	return render(request, 'rango/add_page.html', context_dict)
 
+def _bulk_rows(request, field, parse):
+	# the rows posted to a bulk add - a JSON list of objects, or one per
+	# line of the form's text box
+	if request.content_type == 'application/json':
+		rows = json.loads(request.body.decode('utf-8'))
+		if not isinstance(rows, list):
+			raise ValueError("Expected a list of rows.")
+		return rows
+	return parse(request.POST.get(field, ''))
+
+def _bulk_add(request, field, parse, add, redirect_to, template, context_dict):
+	# adds the posted rows all at once (see rango/bulk.py), then redirects,
+	# or shows the errors of each row and adds none of them
+	# JSON requests get JSON back: {"added": n, "errors": [...]}
+	is_json = request.content_type == 'application/json'
+	errors = {}
+	if request.method == 'POST':
+		try:
+			added, errors = add(_bulk_rows(request, field, parse))
+		except (ValueError, bulk.TooManyRows) as e:
+			if is_json:
+				return JsonResponse({'added': 0, 'errors': [{'row': None, 'errors': {'__all__': [str(e)]}}]}, status=400)
+			errors = {None: {'__all__': [str(e)]}}
+		else:
+			if is_json:
+				return JsonResponse({'added': len(added), 'errors': bulk.error_list(errors)},
+									status=400 if errors else 201)
+			if not errors:
+				return HttpResponseRedirect(redirect_to)
+
+	# rows are numbered from 1 for people, and are lines of the text box
+	context_dict['errors'] = [(None if i is None else i + 1, row_errors)
+							  for i, row_errors in sorted(errors.items(), key=lambda item: item[0] or 0)]
+	context_dict['text'] = request.POST.get(field, '')
+	context_dict['max_rows'] = bulk.max_rows()
+	return render(request, template, context_dict)
+
+@login_required
+@sticks_to_primary
+def add_pages(request, category_name_slug):
+	# many pages at once, one per line of a text box (or a JSON list)
+	category = get_category(category_name_slug)
+	if category is None:
+		if request.content_type == 'application/json':
+			return JsonResponse({'error': 'The specified category does not exist!'}, status=404)
+		return render(request, 'rango/add_pages.html', {'category': None})
+	return _bulk_add(request, 'pages', bulk.parse_pages, lambda rows: bulk.add_pages(category, rows),
+					 reverse('show_category', args=[category_name_slug]), 'rango/add_pages.html',
+					 {'category': category})
+
+@login_required
+@sticks_to_primary
+def add_categories(request):
+	# many categories at once, one name per line (or a JSON list)
+	return _bulk_add(request, 'categories', bulk.parse_categories, bulk.add_categories,
+					 reverse('index'), 'rango/add_categories.html', {})
+
+@sticks_to_primary
 def register(request):
 	# a boolean value for telling the template whether 
 	# the registration was successful
@@ -141,14 +272,28 @@ def register(request):
 		user_form = UserForm(data=request.POST)
 		profile_form = UserProfileForm(data=request.POST)
 
-		#If the 2 forms are valid:
-		if user_form.is_valid() and profile_form.is_valid():
-			#save the user's form data to the database
-			user = user_form.save()
+		# the picture (if any) has to be an image we can read, which is
+		# checked before anything is saved
+		valid = user_form.is_valid() and profile_form.is_valid()
+		if valid and 'picture' in request.FILES:
+			try:
+				pictures.image_extension(request.FILES['picture'])
+			except ValidationError as error:
+				profile_form.add_error('picture', error)
+				valid = False
 
-			# now we hash the password with the set_password method
-			# once hashed, we can update the user object
-			user.set_password(user.password)
+		#If the 2 forms are valid:
+		if valid:
+			# hold off saving the user until the password is hashed, so
+			# the user is written with a single INSERT
+			user = user_form.save(commit=False)
+
+			# the hashing is done by the pool in rango/auth.py, which
+			# may be too busy right now
+			try:
+				user.password = hash_password(user.password)
+			except HashingBusy:
+				return busy()
 			user.save()
 
 			# now sort out the UserProfile instance
@@ -162,11 +307,14 @@ def register(request):
 			# did the user provide a profile picture?
 			# if so, we need to get it from the input form and 
 			# put it in the UserProfile model
+			# only the original is stored here - the thumbnails are made
+			# in the background once the profile is saved (rango/pictures.py)
 			if 'picture' in request.FILES:
-				profile.picture = request.FILES['picture']
+				pictures.attach(profile, request.FILES['picture'])
 
 			# now we save the UserProfile model instance 
 			profile.save()
+			pictures.schedule(profile)
 			# update our variable to indicate that the template registration was successful
 			registered=True
 		else:
@@ -197,9 +345,20 @@ def user_login(request):
 		username = request.POST.get('username')
 		password = request.POST.get('password')
 
+		# too many failed attempts for this username or address? then
+		# don't even check the password
+		wait = login_wait(request, username)
+		if wait:
+			response = HttpResponse("Too many failed logins - please try again later.", status=429)
+			response['Retry-After'] = int(wait) + 1
+			return response
+
 		# use Django's machinery to attempt to see if the username/password
 		# combination is valid - a User object is returned if it is
-		user = authenticate(username=username, password=password)
+		try:
+			user = authenticate(request, username=username, password=password)
+		except HashingBusy:
+			return busy()
 
 		# if we have a User object, the details are correct
 		# if None, no user with matching credentials was found
@@ -215,7 +374,9 @@ def user_login(request):
 				return HttpResponse("Your Rango account is disabled")
 		else:
 			# bad login details were provided so no logging in!
-			print("Invalid login details: {0}, {1}".format(username, password))
+			# (never print the password that was tried)
+			login_failed(request, username)
+			print("Invalid login details for {0}".format(username))
 			#context_dict = {'bad_details': "Invalid login details supplied."}
 			#return render(request, 'rango/login.html', context_dict)
 			return HttpResponse("Invalid login details supplied.")			
@@ -227,6 +388,13 @@ def user_login(request):
 		# the blank dictionary object
 		return render(request, 'rango/login.html', {})
 
+def busy():
+	# registering and logging in wait for the password hashing pool, which
+	# turns requests away when too many are already waiting
+	response = HttpResponse("Rango is busy right now - please try again in a moment.", status=503)
+	response['Retry-After'] = 5
+	return response
+
 @login_required
 def restricted(request):
 	return render(request, 'rango/restricted.html', {})
@@ -238,37 +406,52 @@ def user_logout(request):
 	# take the user back to the homepage
 	return HttpResponseRedirect(reverse('index'))
 
-# this is not a view, just a helper function because it doesn't return a response object
-# this helper function takes request and response objects because we want to be able to access 
-# the incoming cookies from the request and add or update cookies in the response
-
-def get_server_side_cookie(request, cookie, default_val=None):
-	val = request.session.get(cookie)
-	if not val:
-		val = default_val
-	return val
-
-def visitor_cookie_handler(request):
-	# get the no. of visits to the site
-	# if the cookie exists, the value returned is cast to an integer
-	# if the cookie doesn't exist, the the default value of 1 is used
-	visits = int(get_server_side_cookie(request, 'visits', '1'))
-	last_visit_cookie = get_server_side_cookie(request, 'last_visit', str(datetime.now()))
-	last_visit_time = datetime.strptime(last_visit_cookie[:-7], '%Y-%m-%d %H:%M:%S')
-	
-	# if it's been more than a day since the last visit...
-	if(datetime.now() - last_visit_time).seconds > 0:
-		visits = visits + 1
-		# update the last visit cookie now that we have updated the count
-		# store session cookies from the server side in the request.session[] dictionary
-		request.session['last_visit'] = str(datetime.now())
-	else:
-		# set the last visit cookie
-		request.session['last_visit'] = last_visit_cookie
-
-	# update/set the visits cookie
-	request.session['visits'] = visits
-
-
-
+def search(request):
+	# full-text search over pages and categories (see rango/search.py)
+	query = request.GET.get('q', '').strip()
+	results = run_search(query) if query else []
+	return render(request, 'rango/search.html', {'query': query, 'results': results})
+
+def search_api(request):
+	# the same search as JSON, for scripts and other clients
+	query = request.GET.get('q', '').strip()
+	results = []
+	for found, score in run_search(query) if query else []:
+		if isinstance(found, Page):
+			results.append({'type': 'page', 'id': found.id, 'title': found.title, 'url': found.url,
+							'category': found.category.slug, 'score': score})
+		else:
+			results.append({'type': 'category', 'id': found.id, 'name': found.name,
+							'slug': found.slug, 'score': score})
+	return JsonResponse({'query': query, 'results': results})
 
+def goto_url(request):
+	# count a click-through to a page, then send the user on to its url
+	# the view is only journaled here - see rango/counters.py
+	try:
+		page = Page.objects.only('url').get(id=int(request.GET.get('page_id')))
+	except (TypeError, ValueError, Page.DoesNotExist):
+		# no page_id, a malformed one, or a page that doesn't exist
+		return HttpResponseRedirect(reverse('index'))
+
+	record_page_view(page.id)
+	return HttpResponseRedirect(page.url)
+
+@staff_member_required
+def instrumentation_stats(request):
+	# per-view timings, query counts and suspected N+1 queries for this
+	# process (see rango/instrumentation.py)
+	return JsonResponse(report())
+
+@staff_member_required
+def export_data(request):
+	# every category and page as a gzipped JSONL (or ?format=csv) download,
+	# streamed as it is read (see rango/exporter.py)
+	# the rows are read after the view has returned, so the replica is
+	# chosen here rather than with @read_from_replica
+	format = 'csv' if request.GET.get('format') == 'csv' else 'jsonl'
+	response = StreamingHttpResponse(exporter.export(format, using=replica_alias()),
+									 content_type='application/gzip')
+	response['Content-Disposition'] = 'attachment; filename="rango-{0}.{1}.gz"'.format(
+		timezone.now().strftime('%Y%m%d'), format)
+	return response
@@ -0,0 +1,66 @@
+import time
+from datetime import date
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from rango import counters
+from rango.models import DailyVisits
+
+# counts how many times each visitor has come back to the site
+#
+# the count and the time of the last counted visit are kept in the session
+# as plain integers, and the session is only changed when the count goes
+# up - so a visitor who comes back within RANGO_VISIT_INTERVAL seconds
+# doesn't cause a session save, and the request stays read-only
+#
+# site-wide totals per day go through the batched counters in
+# rango/counters.py rather than being written on every visit
+
+
+def track_visit(request):
+	# returns the visitor's visit count, including this one
+	session = request.session
+	now = int(time.time())
+	visits = session.get('visits')
+	last_visit = session.get('last_visit')
+	interval = getattr(settings, 'RANGO_VISIT_INTERVAL', 24 * 60 * 60)
+
+	if not isinstance(visits, int) or not isinstance(last_visit, int):
+		# a new visitor (or one whose session predates integer timestamps)
+		if not isinstance(visits, int):
+			visits = 0
+			record_site_visit(new_visitor=True)
+		else:
+			record_site_visit()
+		visits = visits + 1
+	elif now - last_visit >= interval:
+		visits = visits + 1
+		record_site_visit()
+	else:
+		# seen recently - nothing to change
+		return visits
+
+	session['visits'] = visits
+	session['last_visit'] = now
+	return visits
+
+def record_site_visit(new_visitor=False):
+	today = timezone.now().date().toordinal()
+	counters.increment('site.visits', today)
+	if new_visitor:
+		counters.increment('site.visitors', today)
+
+def site_counter(field):
+	# counters handler adding to DailyVisits, keyed by the day's ordinal
+	def apply(deltas):
+		days = dict((date.fromordinal(int(day)), delta) for day, delta in deltas.items())
+		existing = set(DailyVisits.objects.filter(day__in=days).values_list('day', flat=True))
+		DailyVisits.objects.bulk_create([DailyVisits(day=day) for day in days if day not in existing])
+		# there is rarely more than one day in a flush
+		for day, delta in days.items():
+			DailyVisits.objects.filter(day=day).update(**{field: F(field) + delta})
+	return apply
+
+counters.register('site.visits', site_counter('visits'))
+counters.register('site.visitors', site_counter('visitors'))
@@ -50,8 +50,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # times each request, its queries, templates and session save (first,
+    # so that it sees everything the other middleware does)
+    'rango.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    # Django's SessionMiddleware, timing session saves
+    'rango.instrumentation.TimedSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -61,12 +65,33 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'tango_with_django_project.urls'
 
+# Templates
+# in RANGO_TEMPLATE_MODE 'production' each template is compiled once per
+# process and kept (Django's cached loader), and the WSGI application
+# compiles them all as it starts (see rango/template_warmup.py) - in
+# 'development' they are read from disk on every render, so edits show up
+# straight away. Production is the default whenever DEBUG is off
+
+RANGO_TEMPLATE_MODE = os.environ.get('RANGO_TEMPLATE_MODE', 'development' if DEBUG else 'production')
+
+template_loaders = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+if RANGO_TEMPLATE_MODE == 'production':
+    template_loaders = [('django.template.loaders.cached.Loader', template_loaders)]
+
+# {% fragment_cache %} keeps rendered parts of pages in the cache (see
+# rango/templatetags/rango_template_tags.py) - False renders them every time
+
+RANGO_FRAGMENT_CACHE = True
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATE_DIR, ],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': template_loaders,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -84,19 +109,199 @@ WSGI_APPLICATION = 'tango_with_django_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/1.11/ref/settings/#databases
 
+# both use Django's SQLite backend with WAL, synchronous=NORMAL, a bigger
+# cache, mmap and a busy timeout (tango_with_django_project/sqlite3), and
+# keep their connections open between requests
+# python manage.py bench_sqlite compares this with a stock connection
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'tango_with_django_project.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'CONN_MAX_AGE': 600,
+    },
+    # the same file opened read-only, used by the views that only read
+    # (see rango/replicas.py)
+    'replica': {
+        'ENGINE': 'tango_with_django_project.sqlite3',
+        'NAME': 'file:{0}?mode=ro'.format(os.path.join(BASE_DIR, 'db.sqlite3')),
+        'OPTIONS': {'uri': True},
+        'CONN_MAX_AGE': 600,
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['rango.replicas.ReplicaRouter']
+
+RANGO_REPLICA_ALIAS = 'replica'
+
+# seconds after a visitor's last write during which their reads go to the
+# primary, so they see their own changes
+RANGO_REPLICA_STICKY_SECONDS = 10
+
+
+# Cache
+# the sidebar, cached pages and fragments, the category index and the API's
+# ETags are all invalidated by bumping version keys in the cache (see
+# rango/caching.py), so every process must see the same cache for a bump
+# in one to reach the others
+#
+# set RANGO_CACHE_LOCATION to a memcached server (e.g. 127.0.0.1:11211,
+# needs python-memcached) whenever more than one process serves the site -
+# entries then last until they are invalidated
+#
+# without it each process has a cache of its own, which is only supported
+# for a single process (e.g. runserver): with more, a change made in one is
+# seen by the others only once their entries time out, after
+# RANGO_LOCAL_CACHE_TIMEOUT seconds
+
+RANGO_CACHE_LOCATION = os.environ.get('RANGO_CACHE_LOCATION')
+
+RANGO_LOCAL_CACHE_TIMEOUT = 60
+
+if RANGO_CACHE_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': RANGO_CACHE_LOCATION,
+            'TIMEOUT': None,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'rango',
+            'TIMEOUT': RANGO_LOCAL_CACHE_TIMEOUT,
+            'OPTIONS': {
+                # room for cached pages as well as fragments
+                'MAX_ENTRIES': 10000,
+            },
+        }
+    }
+
+# anonymous visitors are served cached copies of the index, about and
+# category pages, which vary by path plus these request headers
+RANGO_PAGE_CACHE_VARY = []
+
+
+# Sessions
+# RANGO_SESSION_MODE picks the session engine:
+#   'db' - Django's database sessions
+#   'signed_cookies' - the whole session in a signed cookie
+#   'hybrid' - signed cookies for anonymous visitors, and the cache with
+#       write-behind to the database for signed-in users (rango/sessions.py)
+# python manage.py bench_sessions compares the database writes of each
+#
+# 'hybrid' keeps signed-in sessions in the cache, so it needs the shared
+# cache (RANGO_CACHE_LOCATION) - with a cache per process, logging out in
+# one process would leave the session alive in the others. Its queued
+# writes are only in memory, so up to RANGO_SESSION_WRITE_BEHIND_INTERVAL
+# seconds of session changes are lost if a process dies
+
+RANGO_SESSION_MODE = os.environ.get('RANGO_SESSION_MODE', 'db')
+
+if RANGO_SESSION_MODE == 'hybrid' and not RANGO_CACHE_LOCATION:
+    from django.core.exceptions import ImproperlyConfigured
+    raise ImproperlyConfigured("RANGO_SESSION_MODE 'hybrid' needs a shared cache - set RANGO_CACHE_LOCATION.")
+
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+    'hybrid': 'rango.sessions',
+}[RANGO_SESSION_MODE]
+
+# seconds between batched session writes in hybrid mode
+RANGO_SESSION_WRITE_BEHIND_INTERVAL = 5
+
+
+# Counters
+# page and category views/likes are journaled to disk and applied to the
+# database in batches (see rango/counters.py)
+
+RANGO_COUNTER_DIR = os.path.join(BASE_DIR, 'counters')
+
+# seconds between flushes, or None to only flush via manage.py flush_counters
+RANGO_COUNTER_FLUSH_INTERVAL = 10
+
+
+# Trending
+# flushed page views also go into hourly buckets and time-decayed scores
+# (see rango/trending.py) - a view counts half as much after
+# RANGO_TRENDING_HALF_LIFE seconds, and buckets are kept for
+# RANGO_TRENDING_WINDOW seconds (pruned by manage.py rebuild_trending)
+
+RANGO_TRENDING_HALF_LIFE = 24 * 60 * 60
+
+RANGO_TRENDING_WINDOW = 14 * 24 * 60 * 60
+
+
+# Related categories
+# the categories each category's visitors also look at (see rango/related.py)
+# - each category keeps its RANGO_RELATED_NEIGHBOURS closest neighbours,
+# pruned by manage.py rebuild_related --prune (run it hourly, e.g. from
+# cron), and visits older than RANGO_RELATED_WINDOW seconds are dropped by
+# manage.py rebuild_related
+
+RANGO_RELATED_NEIGHBOURS = 50
+
+RANGO_RELATED_WINDOW = 90 * 24 * 60 * 60
+
+
+# Visits
+# a visitor's visit count goes up at most once per RANGO_VISIT_INTERVAL seconds
+
+RANGO_VISIT_INTERVAL = 24 * 60 * 60
+
+
+# Category pages
+# pages are listed in batches, RANGO_CATEGORY_PAGE_SIZE at a time unless
+# ?size= asks for a different number (up to RANGO_CATEGORY_MAX_PAGE_SIZE)
+
+RANGO_CATEGORY_PAGE_SIZE = 20
+
+RANGO_CATEGORY_MAX_PAGE_SIZE = 100
+
+
+# Instrumentation
+# per-view timings and query counts, shown to staff at /rango/_stats/
+
+RANGO_INSTRUMENTATION = True
+
+# the same query run this many times in one request is reported as N+1
+RANGO_N_PLUS_ONE_THRESHOLD = 5
+
+
+# Profile pictures
+# thumbnails are made by this many background threads per process, or
+# during the request if it is 0 (see rango/pictures.py)
+
+RANGO_PICTURE_WORKERS = 2
+
+# the longest side, in pixels, of each thumbnail size
+RANGO_PICTURE_SIZES = {'small': 64, 'medium': 200, 'large': 400}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
 LOGIN_URL = '/rango/login/'
 
+# passwords are hashed and checked by a pool of background threads (see
+# rango/auth.py) - RANGO_HASH_WORKERS defaults to half the CPUs, and 0
+# hashes in the request thread
+AUTHENTICATION_BACKENDS = ['rango.auth.PooledModelBackend']
+
+# hashes that may wait for the pool before registering or logging in is
+# refused with a 503
+RANGO_HASH_QUEUE = 32
+
+# failed logins allowed per username before it has to wait, and the
+# seconds after which another attempt is allowed
+RANGO_LOGIN_ATTEMPTS = 5
+
+RANGO_LOGIN_ATTEMPT_INTERVAL = 60
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
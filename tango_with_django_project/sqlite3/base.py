@@ -0,0 +1,51 @@
+from django.db.backends.sqlite3 import base
+
+# Django's SQLite backend, setting PRAGMAs on every new connection
+#
+# DATABASES = {'default': {
+#     'ENGINE': 'tango_with_django_project.sqlite3',
+#     'NAME': ...,
+#     'OPTIONS': {'pragmas': {'cache_size': -64000}},
+# }}
+#
+# the pragmas given in OPTIONS are added to (or replace) PRAGMAS below -
+# a pragma set to None isn't set at all
+#
+# journal_mode is skipped for in-memory and read-only (mode=ro) databases,
+# which can't change it - WAL is kept in the database file, so read-only
+# connections to a WAL database get it anyway
+
+PRAGMAS = {
+	# readers see the last commit and don't block the writer, or each other
+	'journal_mode': 'WAL',
+	# in WAL mode, only sync at checkpoints - a power cut can lose the last
+	# few commits, but never corrupt the database
+	'synchronous': 'NORMAL',
+	# read the database through memory-mapped I/O (up to 256MB of it)
+	'mmap_size': 256 * 1024 * 1024,
+	# keep up to 20MB of pages cached per connection (negative means KiB)
+	'cache_size': -20000,
+	# wait up to 5 seconds for a lock rather than failing straight away
+	'busy_timeout': 5000,
+	'temp_store': 'MEMORY',
+}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+	def get_connection_params(self):
+		params = super(DatabaseWrapper, self).get_connection_params()
+		# not a sqlite3.connect() argument, so take it out
+		pragmas = dict(PRAGMAS)
+		pragmas.update(params.pop('pragmas', None) or {})
+		self.pragmas = dict((name, value) for name, value in pragmas.items() if value is not None)
+		return params
+
+	def get_new_connection(self, conn_params):
+		conn = super(DatabaseWrapper, self).get_new_connection(conn_params)
+		name = str(conn_params['database'])
+		for pragma, value in sorted(self.pragmas.items()):
+			if pragma == 'journal_mode' and (self.creation.is_in_memory_db(name) or 'mode=ro' in name):
+				continue
+			conn.execute('PRAGMA {0} = {1}'.format(pragma, value))
+		return conn
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tango_with_django_project.settings")
 
 application = get_wsgi_application()
+
+# with the cached template loader, compile every template now rather than
+# during the first requests (see rango/template_warmup.py)
+from django.conf import settings
+
+if settings.RANGO_TEMPLATE_MODE == 'production':
+    from rango.template_warmup import warm
+    warm()